@@ -0,0 +1,108 @@
+"""Memory and training throughput of one-hot vs embedding encoding of high-cardinality categorical columns.
+
+A synthetic table with a few numeric and several high-cardinality categorical columns is encoded both ways, then
+feature width, in-memory size, CSV size, size of the first linear layer and training steps per second are compared.
+"""
+import argparse
+import time
+from typing import Dict, Literal
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn.functional as func
+
+from src.config import MLPModelConfig
+from src.data.preprocessing.steps import _np_to_df, fit_col_transformer, get_categorical_vocab
+from src.train.model import get_mlp_model
+
+
+def make_table(num_rows: int, num_numeric: int, num_categorical: int, cardinality: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    columns: Dict[str, np.ndarray] = {f'num_{idx}': rng.normal(size=num_rows) for idx in range(num_numeric)}
+    for idx in range(num_categorical):
+        # Zipf-like frequencies, as usually seen in real high-cardinality columns
+        codes = np.minimum(rng.zipf(1.3, size=num_rows), cardinality) - 1
+        columns[f'cat_{idx}'] = np.char.add('v', codes.astype(str))
+    return pd.DataFrame(columns)
+
+
+def _encode(
+    table: pd.DataFrame,
+    categorical_cols: tuple[str, ...],
+    encoding: Literal['one_hot', 'embedding'],
+) -> tuple[pd.DataFrame, tuple[int, ...]]:
+    transformer = fit_col_transformer(
+        table,
+        categorical_cols,
+        apply_standardization=True,
+        categorical_encoding=encoding,
+    )
+    features_np = transformer.transform(table)
+    if hasattr(features_np, 'toarray'):  # one-hot output may be sparse for very wide tables
+        features_np = features_np.toarray()
+    vocab = get_categorical_vocab(transformer)
+    features = _np_to_df(features_np, transformer.get_feature_names_out(), code_cols=tuple(vocab or ()))
+    cardinalities = tuple(len(categories) + 1 for categories in vocab.values()) if vocab else ()
+    return features, cardinalities
+
+
+def _train_steps_per_sec(
+    features: pd.DataFrame,
+    cardinalities: tuple[int, ...],
+    batch_size: int,
+    num_steps: int,
+) -> tuple[float, int]:
+    model = get_mlp_model(MLPModelConfig(), in_dim=features.shape[1], out_dim=2, cat_cardinalities=cardinalities)
+    optimizer = torch.optim.SGD(model.parameters(), lr=1e-3)
+    data = torch.tensor(features.to_numpy(), dtype=torch.float32)
+    target = torch.randint(0, 2, (len(data),))
+
+    def step() -> None:
+        idx = torch.randint(0, len(data), (batch_size,))
+        loss = func.cross_entropy(model(data[idx]), target[idx])
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+
+    for _ in range(5):  # warmup
+        step()
+    started = time.perf_counter()
+    for _ in range(num_steps):
+        step()
+    return num_steps / (time.perf_counter() - started), model.linear_1.weight.numel()
+
+
+def run_benchmark(
+    num_rows: int = 100_000,
+    num_numeric: int = 8,
+    num_categorical: int = 4,
+    cardinality: int = 2_000,
+    batch_size: int = 256,
+    num_steps: int = 200,
+    seed: int = 42,
+) -> None:
+    table = make_table(num_rows, num_numeric, num_categorical, cardinality, seed)
+    categorical_cols = tuple(col for col in table.columns if col.startswith('cat_'))
+
+    print(f'{"encoding":<10} {"width":>7} {"memory, MB":>11} {"CSV, MB":>8} {"linear_1 params":>16} {"steps/s":>8}')
+    encoding: Literal['one_hot', 'embedding']
+    for encoding in ('one_hot', 'embedding'):
+        features, cardinalities = _encode(table, categorical_cols, encoding)
+        memory_mb = features.memory_usage(deep=True).sum() / 2**20
+        csv_mb = len(features.to_csv(index=False).encode()) / 2**20
+        steps_per_sec, linear_1_params = _train_steps_per_sec(features, cardinalities, batch_size, num_steps)
+        print(
+            f'{encoding:<10} {features.shape[1]:>7} {memory_mb:>11.1f} {csv_mb:>8.1f} {linear_1_params:>16} '
+            f'{steps_per_sec:>8.1f}',
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--num-rows', type=int, default=100_000)
+    parser.add_argument('--cardinality', type=int, default=2_000)
+    parser.add_argument('--num-categorical', type=int, default=4)
+    args = parser.parse_args()
+
+    run_benchmark(num_rows=args.num_rows, num_categorical=args.num_categorical, cardinality=args.cardinality)
@@ -0,0 +1,95 @@
+"""CPU data-parallel (DDP over `gloo`) training throughput benchmark.
+
+Runs the same short local training in 1, 2, 4 and 8 processes and reports samples per second for each of them.
+Every run is a separate subprocess, because Lightning's DDP launcher re-executes the launching command for each rank.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, Sequence
+
+from src.config import MLPExperimentConfig, RunModeEnum, get_experiment_cfg
+from src.constants import PROJECT_ROOT
+
+DEFAULT_NUM_PROCESSES = (1, 2, 4, 8)
+
+
+def _get_benchmark_cfg(cfg: MLPExperimentConfig, num_processes: int, epochs: int) -> MLPExperimentConfig:
+    cfg = cfg.model_copy(deep=True)
+    cfg.run_mode = RunModeEnum.local
+    cfg.track_in_clearml = False
+    cfg.run_store_config.enabled = False  # every benchmark run trains the same config on the same data
+    trainer_cfg = cfg.trainer_config
+    trainer_cfg.accelerator = 'cpu'
+    trainer_cfg.devices = num_processes
+    trainer_cfg.strategy = 'ddp' if num_processes > 1 else 'auto'
+    trainer_cfg.min_epochs = epochs
+    trainer_cfg.max_epochs = epochs
+    trainer_cfg.fast_dev_run = False
+    return cfg
+
+
+def run_worker(num_processes: int, epochs: int, output_path: Path) -> None:
+    # Imported here to keep the launcher process free of torch and lightning
+    from src.train.callbacks import ThroughputCallback
+    from src.train.train import train_mlp
+
+    cfg = _get_benchmark_cfg(get_experiment_cfg(), num_processes, epochs)
+    train_mlp(cfg, extra_callbacks=[ThroughputCallback(warmup_epochs=1, output_path=output_path)])
+
+
+def run_benchmark(num_processes_grid: Sequence[int] = DEFAULT_NUM_PROCESSES, epochs: int = 3) -> Dict[int, float]:
+    cpu_count = os.cpu_count() or 1
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for num_processes in num_processes_grid:
+            output_path = Path(tmp_dir) / f'throughput_{num_processes}.json'
+            env = {
+                **os.environ,
+                'PYTHONPATH': str(PROJECT_ROOT),
+                # Avoid oversubscription: each process gets its share of cores for intra-op parallelism
+                'OMP_NUM_THREADS': str(max(1, cpu_count // num_processes)),
+            }
+            cmd = [
+                sys.executable,
+                __file__,
+                '--worker',
+                '--num-processes',
+                str(num_processes),
+                '--epochs',
+                str(epochs),
+                '--output',
+                str(output_path),
+            ]
+            subprocess.run(cmd, env=env, check=True)
+            with open(output_path) as in_file:
+                results[num_processes] = json.load(in_file)['samples_per_sec']
+
+    _print_report(results)
+    return results
+
+
+def _print_report(results: Dict[int, float]) -> None:
+    base = results.get(1)
+    print(f'{"processes":>10} {"samples/s":>12} {"speedup":>8} {"efficiency":>10}')
+    for num_processes, throughput in results.items():
+        speedup = throughput / base if base else float('nan')
+        print(f'{num_processes:>10} {throughput:>12.1f} {speedup:>8.2f} {speedup / num_processes:>10.2f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--worker', action='store_true', help='Run a single training, used internally.')
+    parser.add_argument('--num-processes', type=int, nargs='+', default=list(DEFAULT_NUM_PROCESSES))
+    parser.add_argument('--epochs', type=int, default=3, help='The first epoch is excluded as a warmup.')
+    parser.add_argument('--output', type=Path)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.num_processes[0], args.epochs, args.output)
+    else:
+        run_benchmark(args.num_processes, args.epochs)
@@ -0,0 +1,96 @@
+"""Training step overhead of per-step Lightning logging vs buffered asynchronous metric logging.
+
+The same small MLP is trained on a synthetic in-memory table with tiny batches, so that logging is a noticeable part
+of a step, once with `step_loss` logged by Lightning on every step and once with it aggregated on device and written to
+a local file by the background thread of the metric sink.
+"""
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Dict, Literal
+
+import lightning
+import torch
+from lightning import Trainer
+from lightning.pytorch.loggers import CSVLogger
+from torch.utils.data import DataLoader, TensorDataset
+
+from src.config import MLPExperimentConfig
+from src.tracking.sink import BufferedMetricSink, JsonlBackend
+from src.train.callbacks import BufferedStepMetricsCallback, ThroughputCallback
+from src.train.lightning_module import ClassificationLightningModule
+
+NUM_FEATURES = 32
+NUM_CLASSES = 2
+
+
+def _get_loader(num_rows: int, batch_size: int, seed: int) -> DataLoader:
+    generator = torch.Generator().manual_seed(seed)
+    features = torch.randn(num_rows, NUM_FEATURES, generator=generator)
+    target = (features[:, 0] > 0).long()
+    return DataLoader(TensorDataset(features, target), batch_size=batch_size, shuffle=True)
+
+
+def _steps_per_sec(
+    backend: Literal['lightning', 'jsonl'],
+    loader: DataLoader,
+    epochs: int,
+    log_dir: Path,
+) -> float:
+    cfg = MLPExperimentConfig()
+    cfg.metric_logging_config.backend = backend
+    lightning.seed_everything(cfg.seed)
+
+    throughput_callback = ThroughputCallback(warmup_epochs=1)
+    callbacks = [throughput_callback]
+    sink = None
+    if backend != 'lightning':
+        sink = BufferedMetricSink(JsonlBackend(log_dir / backend / 'metrics.jsonl'))
+        callbacks.append(BufferedStepMetricsCallback(sink, cfg.metric_logging_config.aggregate_every_n_steps))
+
+    trainer = Trainer(
+        accelerator='cpu',
+        devices=1,
+        max_epochs=epochs,
+        # Lightning flushes logged values to the logger every `log_every_n_steps`, so every step is logged
+        log_every_n_steps=1,
+        logger=CSVLogger(log_dir, name=backend),
+        callbacks=callbacks,
+        enable_checkpointing=False,
+        enable_progress_bar=False,
+        enable_model_summary=False,
+    )
+    model = ClassificationLightningModule(cfg, NUM_FEATURES, NUM_CLASSES)
+    try:
+        trainer.fit(model=model, train_dataloaders=loader)
+    finally:
+        if sink is not None:
+            sink.close()
+
+    summary = throughput_callback.summary(trainer.world_size)
+    return float(summary['samples_per_sec']) / loader.batch_size  # type: ignore[operator]
+
+
+def run_benchmark(num_rows: int = 100_000, batch_size: int = 16, epochs: int = 3, seed: int = 42) -> Dict[str, float]:
+    loader = _get_loader(num_rows, batch_size, seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results = {
+            backend: _steps_per_sec(backend, loader, epochs, Path(tmp_dir))  # type: ignore[arg-type]
+            for backend in ('lightning', 'jsonl')
+        }
+
+    print(f'{"logging":>10} {"steps/s":>10} {"step, us":>10}')
+    for backend, steps_per_sec in results.items():
+        print(f'{backend:>10} {steps_per_sec:>10.1f} {1e6 / steps_per_sec:>10.1f}')
+    print(f'Speedup of buffered logging: {results["jsonl"] / results["lightning"]:.2f}x')
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--num-rows', type=int, default=100_000)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--epochs', type=int, default=3, help='The first epoch is excluded as a warmup.')
+    args = parser.parse_args()
+
+    run_benchmark(args.num_rows, args.batch_size, args.epochs)
@@ -0,0 +1,121 @@
+"""Cold start and throughput of the NumPy-only runtime vs TorchScript for the exported MLP.
+
+Cold start is the wall time of a fresh process that imports the runtime, loads the model and scores one row, measured
+end to end (including interpreter startup) and in-process (imports, loading and the first prediction only). Throughput
+is measured in this process at several batch sizes on the test split.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Sequence, Tuple
+
+import torch
+
+from src.constants import PROJECT_ROOT
+from src.data.preprocessing.steps import load_transformer
+from src.export.core import (
+    check_numpy_parity,
+    compute_f1,
+    export_numpy,
+    export_torchscript,
+    get_numpy_predict_fn,
+    get_test_datamodule,
+    get_torch_predict_fn,
+    load_mlp,
+    load_raw_test_features,
+    load_test_split,
+    measure_latency,
+)
+
+DEFAULT_BATCH_SIZES = (1, 32, 256, 2048)
+_COLD_START_CODE = {
+    'numpy': (
+        'import time; start = time.perf_counter()\n'
+        'import numpy as np\n'
+        'from src.inference.numpy_runtime import NumpyMLP\n'
+        'model = NumpyMLP.load({path!r})\n'
+        'model.forward(np.zeros((1, {num_features}), dtype=np.float32))\n'
+        'print(time.perf_counter() - start)\n'
+    ),
+    'torchscript': (
+        'import time; start = time.perf_counter()\n'
+        'import torch\n'
+        'model = torch.jit.load({path!r})\n'
+        'with torch.inference_mode(): model(torch.zeros(1, {num_features}))\n'
+        'print(time.perf_counter() - start)\n'
+    ),
+}
+
+
+def measure_cold_start(runtime: str, path: Path, num_features: int, repeats: int = 5) -> Tuple[float, float]:
+    """Median wall time of a fresh scoring process and median in-process time of imports, loading and prediction."""
+    code = _COLD_START_CODE[runtime].format(path=str(path), num_features=num_features)
+    env = {**os.environ, 'PYTHONPATH': str(PROJECT_ROOT)}
+    wall_times, in_process_times = [], []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', code], env=env, check=True, capture_output=True, text=True)
+        wall_times.append(time.perf_counter() - start)
+        in_process_times.append(float(output.stdout.strip().splitlines()[-1]))
+    return statistics.median(wall_times), statistics.median(in_process_times)
+
+
+def run_benchmark(
+    checkpoint_path: Path,
+    batch_sizes: Sequence[int] = DEFAULT_BATCH_SIZES,
+) -> Dict[str, Dict[str, float]]:
+    module, model = load_mlp(checkpoint_path)
+    datamodule = get_test_datamodule(module)
+    features, target = load_test_split(module, datamodule)
+    num_classes = module.hparams.num_classes
+    transformer = load_transformer(datamodule.data_path)  # type: ignore[arg-type]
+    raw_features = load_raw_test_features(module.hparams.cfg, datamodule.data_path)  # type: ignore[arg-type]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = {
+            'torchscript': export_torchscript(model, features[:1], Path(tmp_dir) / 'mlp.ts'),
+            'numpy': export_numpy(model, transformer, Path(tmp_dir) / 'mlp.npz'),
+        }
+        # Raises if the NumPy runtime doesn't match torch and the fitted transformer, timings of it would be meaningless
+        parity = check_numpy_parity(paths['numpy'], model, features, raw_features, transformer)
+        predict_fns = {
+            'torchscript': get_torch_predict_fn(torch.jit.load(str(paths['torchscript']))),
+            'numpy': get_numpy_predict_fn(paths['numpy']),
+        }
+        for runtime, path in paths.items():
+            wall_time, in_process_time = measure_cold_start(runtime, path, features.shape[1])
+            latency = measure_latency(predict_fns[runtime], features, batch_sizes)
+            results[runtime] = {
+                'cold_start_s': wall_time,
+                'import_load_predict_s': in_process_time,
+                'test_f1': compute_f1(predict_fns[runtime], features, target, num_classes),
+                **{f'rows_per_sec_bs{stats.batch_size}': stats.rows_per_sec for stats in latency},
+            }
+
+    results['numpy'].update(parity)
+    _print_report(results)
+    return results
+
+
+def _print_report(results: Dict[str, Dict[str, float]]) -> None:
+    # Parity diffs are reported only for the NumPy runtime
+    metric_names = dict.fromkeys(metric_name for metrics in results.values() for metric_name in metrics)
+    print(f'{"metric":<26}' + ''.join(f'{runtime:>14}' for runtime in results))
+    for metric_name in metric_names:
+        values = (metrics.get(metric_name) for metrics in results.values())
+        print(f'{metric_name:<26}' + ''.join(f'{"-":>14}' if value is None else f'{value:>14.4g}' for value in values))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('checkpoint', type=Path, help='Path to a Lightning checkpoint')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=list(DEFAULT_BATCH_SIZES))
+    args = parser.parse_args()
+
+    run_benchmark(args.checkpoint, args.batch_sizes)
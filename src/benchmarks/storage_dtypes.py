@@ -0,0 +1,84 @@
+"""Disk size, load time, resident memory and batch assembly speed of processed splits stored as CSV vs compact `.npz`.
+
+A synthetic table with numeric and one-hot encoded categorical columns is saved as a `train` split in `csv`, `compact`
+and `compact` with float16 numerics formats, read back and sampled in random batches, as the training DataLoader does.
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from src.benchmarks.categorical_encoding import _encode, make_table
+from src.data.data_model import CompactFeatures, NumericDtype, StorageFormat, TabularSplit
+
+_VARIANTS: Dict[str, tuple[StorageFormat, NumericDtype]] = {
+    'csv': ('csv', 'float32'),
+    'compact': ('compact', 'float32'),
+    'compact_fp16': ('compact', 'float16'),
+}
+
+
+def _resident_mb(split: TabularSplit) -> float:
+    features = split._features
+    if isinstance(features, CompactFeatures):
+        features_bytes = features.nbytes
+    else:
+        features_bytes = features.memory_usage(deep=True).sum()
+    return float(features_bytes + split._target.memory_usage(deep=True)) / 2**20
+
+
+def _rows_per_sec(split: TabularSplit, batch_size: int, num_batches: int, seed: int) -> float:
+    rng = np.random.default_rng(seed)
+    batches = [rng.integers(0, len(split), batch_size) for _ in range(num_batches)]
+    started = time.perf_counter()
+    for indices in batches:
+        split.get_batch(indices)
+    return batch_size * num_batches / (time.perf_counter() - started)
+
+
+def run_benchmark(
+    num_rows: int = 200_000,
+    num_categorical: int = 8,
+    cardinality: int = 50,
+    batch_size: int = 256,
+    num_batches: int = 200,
+    seed: int = 42,
+) -> None:
+    table = make_table(num_rows, 8, num_categorical, cardinality, seed)
+    categorical_cols = tuple(col for col in table.columns if col.startswith('cat_'))
+    features, _ = _encode(table, categorical_cols, 'one_hot')
+    target = pd.Series(np.random.default_rng(seed).integers(0, 2, num_rows), name='target')
+    reference = features.to_numpy(dtype=np.float32)
+
+    print(f'Table of {num_rows} rows and {features.shape[1]} columns after one-hot encoding')
+    print(f'{"format":<13} {"disk, MB":>9} {"load, s":>8} {"memory, MB":>11} {"batch rows/s":>13} {"max abs diff":>13}')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, (storage_format, numeric_dtype) in _VARIANTS.items():
+            export_dir = Path(tmp_dir) / name
+            TabularSplit(features, target, 'train').save(export_dir, False, storage_format, numeric_dtype)
+            disk_mb = sum(path.stat().st_size for path in (export_dir / 'train').iterdir()) / 2**20
+
+            started = time.perf_counter()
+            split = TabularSplit.from_folder(export_dir, 'train', 'target')
+            load_s = time.perf_counter() - started
+
+            max_diff = float(np.abs(split.get_batch(np.arange(num_rows))[0].numpy() - reference).max())
+            rows_per_sec = _rows_per_sec(split, batch_size, num_batches, seed)
+            print(
+                f'{name:<13} {disk_mb:>9.1f} {load_s:>8.2f} {_resident_mb(split):>11.1f} {rows_per_sec:>13.0f} '
+                f'{max_diff:>13.2e}',
+            )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--num-rows', type=int, default=200_000)
+    parser.add_argument('--num-categorical', type=int, default=8)
+    parser.add_argument('--cardinality', type=int, default=50)
+    args = parser.parse_args()
+
+    run_benchmark(num_rows=args.num_rows, num_categorical=args.num_categorical, cardinality=args.cardinality)
@@ -1,4 +1,3 @@
-from logging import Logger
 from pathlib import Path
 from typing import Any, Dict, Optional, Sequence
 
@@ -8,6 +7,7 @@ from clearml.task import TaskInstance
 from src.clearml_pipeline.utils import DataManager, get_data_task_name
 from src.config import DataConfig, MLPExperimentConfig
 from src.data.preprocessing.main import RAW_CSV_FILENAME
+from src.tracking.sink import TextReporter
 
 
 def connect_cfg(task: TaskInstance, cfg: MLPExperimentConfig) -> MLPExperimentConfig:
@@ -24,7 +24,7 @@ def connect_cfg(task: TaskInstance, cfg: MLPExperimentConfig) -> MLPExperimentCo
 
 
 class PreprocessDataManager(DataManager):
-    def __init__(self, project_name: str, task_dataset_name: str, data_cfg: DataConfig, logger: Logger):
+    def __init__(self, project_name: str, task_dataset_name: str, data_cfg: DataConfig, logger: TextReporter):
         super().__init__(project_name, task_dataset_name, data_cfg, logger)
         self.raw_dataset: Dataset = self._check_raw_ds_exists()
 
@@ -40,6 +40,13 @@ class PreprocessDataManager(DataManager):
     def get_latest_preprocessed_ds(self) -> Optional[Dataset]:
         return self.get_ds_if_exists(dataset_name=self.task_dataset_name, alias='latest_preprocessed_dataset')
 
+    def restore_latest_processed_ds(self, processed_dir: Path) -> None:
+        # Incremental preprocessing appends to the latest processed version, which may be absent locally
+        if (latest_processed_ds := self.get_latest_preprocessed_ds()) is None:
+            return
+        latest_processed_ds.get_mutable_local_copy(target_folder=str(processed_dir), overwrite=True)
+        self.logger.report_text(f'The latest version of `{self.task_dataset_name}` dataset is restored for appending.')
+
     def upload_processed_ds(self, processed_dir: Path) -> Dataset:
         latest_processed_ds = self.get_latest_preprocessed_ds()
         if latest_processed_ds is None:
@@ -87,6 +94,30 @@ class PreprocessDataManager(DataManager):
         return processed_ds
 
 
+def upload_processed_dir(project_name: str, data_cfg: DataConfig, processed_dir: Path) -> str:
+    """Upload processed data as a new version of the `Prep <orig_dataset_name>` dataset without a ClearML task.
+
+    Returns ID of the new version, or of the latest one if processed data hasn't changed since it.
+    """
+    dataset_name = get_data_task_name(data_cfg, stage='prep')
+    existing_ds_names = {ds['name'] for ds in Dataset.list_datasets(dataset_project=project_name)}
+    parent_datasets = []
+    if dataset_name in existing_ds_names:
+        latest_processed_ds = Dataset.get(dataset_project=project_name, dataset_name=dataset_name)
+        if not latest_processed_ds.verify_dataset_hash(str(processed_dir)):
+            return str(latest_processed_ds.id)
+        parent_datasets.append(latest_processed_ds)
+    processed_ds = Dataset.create(
+        dataset_project=project_name,
+        dataset_name=dataset_name,
+        parent_datasets=parent_datasets,
+        dataset_tags=['preprocessed'],
+    )
+    processed_ds.sync_folder(local_path=processed_dir, verbose=False)
+    processed_ds.finalize(auto_upload=True)
+    return str(processed_ds.id)
+
+
 def get_raw_ds_local_path(raw_dataset: Dataset) -> Path:
     return Path(raw_dataset.get_local_copy()) / RAW_CSV_FILENAME
 
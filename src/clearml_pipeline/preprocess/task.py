@@ -6,6 +6,7 @@ from src.clearml_pipeline.preprocess.core import PreprocessDataManager, connect_
 from src.clearml_pipeline.utils import get_data_task_name, init_task
 from src.config import MLPExperimentConfig, get_experiment_cfg
 from src.data.preprocessing.main import preprocess_data
+from src.data.preprocessing.path_helpers import _get_processed_dir_path
 
 
 def clearml_preprocess(cfg: MLPExperimentConfig, create_draft: bool = False) -> Dataset:
@@ -28,6 +29,8 @@ def clearml_preprocess(cfg: MLPExperimentConfig, create_draft: bool = False) ->
         logger=logger,
     )
     raw_csv_path = get_raw_ds_local_path(data_manager.raw_dataset)
+    if data_cfg.processing_config.incremental:
+        data_manager.restore_latest_processed_ds(_get_processed_dir_path(project_name, data_cfg.orig_dataset_name))
     processed_dir = preprocess_data(project_name, data_cfg, raw_csv_path, cfg.seed)
     logger.report_text('Pre-processing finished! Uploading data to ClearML...')
     ds = data_manager.upload_processed_ds(processed_dir)
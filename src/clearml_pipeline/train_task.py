@@ -1,10 +1,17 @@
+from typing import Optional
+
 from clearml import Task
 
 from src.config import MLPExperimentConfig, get_experiment_cfg
-from src.train.train import train_mlp
+from src.train.dataset import SplitCache
+from src.train.train import TrainingResult, train_mlp
 
 
-def clearml_train_mlp(cfg: MLPExperimentConfig, create_draft: bool = False) -> None:
+def clearml_train_mlp(
+    cfg: MLPExperimentConfig,
+    create_draft: bool = False,
+    split_cache: Optional[SplitCache] = None,
+) -> TrainingResult:
     if cfg.track_in_clearml:
         Task.force_requirements_env_freeze()
         task = Task.init(
@@ -18,7 +25,7 @@ def clearml_train_mlp(cfg: MLPExperimentConfig, create_draft: bool = False) -> N
         task.connect_configuration(configuration=cfg_dump)
         cfg = MLPExperimentConfig.model_validate(cfg_dump)
 
-    train_mlp(cfg)
+    return train_mlp(cfg, split_cache=split_cache)
 
 
 if __name__ == '__main__':
@@ -1,9 +1,10 @@
 from typing import Literal, Optional
 
-from clearml import Dataset, Logger, Task, TaskTypes
+from clearml import Dataset, Task, TaskTypes
 from clearml.task import TaskInstance
 
 from src.config import DataConfig
+from src.tracking.sink import BufferedMetricSink, ClearMLBackend, TextReporter
 
 
 def get_data_task_name(data_cfg: DataConfig, stage: Literal['init', 'prep']) -> str:
@@ -11,7 +12,7 @@ def get_data_task_name(data_cfg: DataConfig, stage: Literal['init', 'prep']) ->
     return f'{prefix} {data_cfg.orig_dataset_name}'
 
 
-def init_task(project_name: str, task_dataset_name: str) -> tuple[TaskInstance, Logger]:
+def init_task(project_name: str, task_dataset_name: str) -> tuple[TaskInstance, BufferedMetricSink]:
     Task.force_requirements_env_freeze()
     task = Task.init(
         project_name=project_name,
@@ -20,11 +21,12 @@ def init_task(project_name: str, task_dataset_name: str) -> tuple[TaskInstance,
         reuse_last_task_id=False,
     )
 
-    return task, task.get_logger()
+    # Reports are sent to ClearML in batches by a background thread, so they don't block the task
+    return task, BufferedMetricSink(ClearMLBackend(task.get_logger()))
 
 
 class DataManager:
-    def __init__(self, project_name: str, task_dataset_name: str, data_cfg: DataConfig, logger: Logger):
+    def __init__(self, project_name: str, task_dataset_name: str, data_cfg: DataConfig, logger: TextReporter):
         self.project_name = project_name
         self.task_dataset_name = task_dataset_name
         self.data_cfg = data_cfg
@@ -1,7 +1,7 @@
 import os
 from enum import Enum
 from pathlib import Path
-from typing import Literal, NamedTuple, Optional, Tuple, Type, TypeVar, Union
+from typing import Annotated, Any, Dict, Literal, NamedTuple, Optional, Sequence, Tuple, Type, TypeVar, Union
 
 import yaml
 from omegaconf import OmegaConf
@@ -18,8 +18,10 @@ class _BaseValidatedConfig(BaseModel):
 
 class _ConfigYamlMixin(BaseModel):
     @classmethod
-    def from_yaml(cls: Type[T], path: Union[str, Path]) -> T:
-        cfg = OmegaConf.to_container(OmegaConf.load(path), resolve=True)
+    def from_yaml(cls: Type[T], path: Union[str, Path], overlay_paths: Sequence[Union[str, Path]] = ()) -> T:
+        # Overlays are partial configs merged on top of the config in order, e.g. tuned settings
+        merged = OmegaConf.merge(OmegaConf.load(path), *(OmegaConf.load(overlay) for overlay in overlay_paths))
+        cfg = OmegaConf.to_container(merged, resolve=True)
         return cls(**cfg)
 
     def to_yaml(self, path: Union[str, Path]) -> None:
@@ -36,17 +38,84 @@ class SplitRatios(NamedTuple):
 class DataLoaderConfig(_BaseValidatedConfig):
     batch_size: int = 32
     num_workers: int = 0
-    pin_memory: bool = True
+    pin_memory: bool = True  # has effect only if CUDA is available
+    # used only if `num_workers` > 0: keep worker processes between epochs, number of batches loaded ahead by a worker
+    persistent_workers: bool = False
+    prefetch_factor: Optional[int] = None
+
+
+class RangeRule(_BaseValidatedConfig):
+    kind: Literal['range'] = 'range'
+    column: str
+    min_value: Optional[float] = None
+    max_value: Optional[float] = None
+    min_inclusive: bool = True
+    max_inclusive: bool = True
+
+
+class NotNullRule(_BaseValidatedConfig):
+    kind: Literal['not_null'] = 'not_null'
+    columns: Tuple[str, ...]
+
+
+class AllowedValuesRule(_BaseValidatedConfig):
+    kind: Literal['allowed_values'] = 'allowed_values'
+    column: str
+    values: Tuple[Union[int, float, str], ...]
+
+
+class ExpressionRule(_BaseValidatedConfig):
+    kind: Literal['expression'] = 'expression'
+    # Column names, numbers, strings, arithmetic, comparisons and `and`/`or`/`not`, e.g. `Oldpeak >= 0 and Age < 100`
+    expression: str
+
+
+# Rows that don't satisfy a rule are filtered out
+FilterRule = Annotated[
+    Union[RangeRule, NotNullRule, AllowedValuesRule, ExpressionRule],
+    Field(discriminator='kind'),
+]
 
 
 class ProcessingConfig(_BaseValidatedConfig):
     split_ratios: SplitRatios = SplitRatios(0.7, 0.15, 0.15)
+    # `stratified`: random split stratified by target, depends on seed
+    # `hash`: deterministic split by hash of `split_key_columns` (all feature columns if not set), split of a row
+    # doesn't depend on other rows, so it's stable as raw data grows and can be computed in streaming fashion
+    split_mode: Literal['stratified', 'hash'] = 'stratified'
+    split_key_columns: Optional[Tuple[str, ...]] = None
     target_column: str = 'HeartDisease'
     categorical_columns: Optional[
         Tuple[str, ...]
     ] = None  # all other columns except target will be treated as numerical
     positive_columns: Optional[Tuple[str, ...]] = None  # values <= 0 will be filtered out
+    row_filters: Tuple[FilterRule, ...] = ()  # applied together with `positive_columns` in a single pass
+    # if set, raw CSV is read and filtered in chunks of this number of rows, so only filtered rows are kept in memory
+    read_chunk_size: Optional[int] = None
+    # if True, only rows appended to raw CSV since the previous preprocessing are processed: they are assigned to
+    # splits by hash of `split_key_columns` (so `split_mode` must be `hash`), transformed with the previously fitted
+    # transformer and appended to processed splits. Full preprocessing is run if raw data is not append-only, or if
+    # statistics of new rows drift: a column drifts if its population stability index exceeds
+    # `incremental_drift_threshold` or, for numeric columns, its Kolmogorov-Smirnov statistic exceeds
+    # `incremental_ks_threshold` (see `src/data/stats.py`)
+    incremental: bool = False
+    incremental_drift_threshold: float = 0.2
+    incremental_ks_threshold: float = 0.1
+    # drift is checked once this many rows have been appended since the previous full preprocessing, statistics of a
+    # few rows differ from the reference by chance
+    incremental_min_drift_rows: int = 500
     apply_standardization: bool = True
+    # `one_hot`: categorical columns are expanded to dense one-hot columns
+    # `embedding`: categorical columns are stored as integer codes (0 is reserved for unknown categories) with a saved
+    # vocabulary, and the model learns embeddings of them
+    categorical_encoding: Literal['one_hot', 'embedding'] = 'one_hot'
+    # `compact`: processed splits are stored in `.npz` files in the smallest faithful dtypes (float32 numeric columns,
+    # bit-packed binary and one-hot columns, the smallest integer type for codes and target) and widened to float32
+    # only when batches are assembled, `csv`: as text CSV files
+    storage_format: Literal['compact', 'csv'] = 'compact'
+    # if True, standardized numeric columns are stored as float16 in `compact` format (lossy, ~3 significant digits),
+    # ignored if `apply_standardization` is False
+    float16_numerics: bool = False
 
     @model_validator(mode='after')
     def splits_add_up_to_one(self) -> 'ProcessingConfig':
@@ -56,6 +125,13 @@ class ProcessingConfig(_BaseValidatedConfig):
             raise ValueError(f'Splits should add up to 1, got {total}.')
         return self
 
+    @model_validator(mode='after')
+    def incremental_uses_hash_split(self) -> 'ProcessingConfig':
+        # Appended rows are assigned to splits by hash, which matches only a hash split of the previous rows
+        if self.incremental and self.split_mode != 'hash':
+            raise ValueError(f'`incremental` preprocessing requires `split_mode: hash`, got `{self.split_mode}`.')
+        return self
+
 
 class DataConfig(_BaseValidatedConfig):
     orig_dataset_name: str = 'heart_disease_dataset_mlp'
@@ -64,6 +140,19 @@ class DataConfig(_BaseValidatedConfig):
     processing_config: ProcessingConfig = Field(default=ProcessingConfig())
 
 
+class TelemetryConfig(_BaseValidatedConfig):
+    # if True, time spent waiting for the next batch, compute time (forward, backward and optimizer step) and samples
+    # per second are measured on every training step, their per-epoch summaries are logged
+    enabled: bool = False
+    # a warning is issued if waiting for data takes more than this fraction of step time in an epoch
+    data_wait_warning_fraction: float = Field(default=0.3, gt=0, le=1)
+    # if set, `profile_num_steps` training steps starting from this one are profiled with `torch.profiler` and a
+    # Chrome trace is exported to `profile_dir` (`profiler` in the trainer's log dir if null)
+    profile_start_step: Optional[int] = None
+    profile_num_steps: int = 5
+    profile_dir: Optional[Path] = None
+
+
 class MLPTrainerConfig(_BaseValidatedConfig):
     min_epochs: int = 7  # prevents early stopping
     max_epochs: int = 20
@@ -85,16 +174,62 @@ class MLPTrainerConfig(_BaseValidatedConfig):
 
     detect_anomaly: bool = False
 
+    # hardware and distributed training settings, e.g. `accelerator: cpu`, `devices: 4`, `strategy: ddp` runs
+    # data-parallel training in 4 CPU processes that communicate via `gloo` backend
+    accelerator: str = 'auto'
+    devices: Union[int, str] = 'auto'
+    strategy: str = 'auto'
+    num_nodes: int = 1
+
+    # not a `Trainer` argument, configures `TrainingTelemetryCallback`
+    telemetry: TelemetryConfig = Field(default=TelemetryConfig())
+
+    def get_trainer_kwargs(self) -> Dict[str, Any]:
+        return {name: value for name, value in self if name != 'telemetry'}
+
 
 class MLPModelConfig(_BaseValidatedConfig):
     linear_1_dim: int = 500
     linear_2_dim: int = 500
+    # used only with `categorical_encoding: embedding`, if not set, it's `min(50, (cardinality + 1) // 2)` per column
+    embedding_dim: Optional[int] = None
 
 
 class MLPHyperparametersConfig(_BaseValidatedConfig):
     lr: float = 2e-3
 
 
+class MetricLoggingConfig(_BaseValidatedConfig):
+    # `lightning`: step metrics are logged by Lightning on every step
+    # other backends: step metrics are aggregated on device over `aggregate_every_n_steps` steps and flushed in
+    # batches by a background thread every `flush_interval_s` seconds to ClearML or a local JSONL/SQLite file.
+    # `auto` is `clearml` if ClearML tracking is enabled, `jsonl` otherwise
+    backend: Literal['lightning', 'auto', 'clearml', 'jsonl', 'sqlite'] = 'auto'
+    aggregate_every_n_steps: int = 50
+    flush_interval_s: float = 5.0
+
+
+class WarmStartConfig(_BaseValidatedConfig):
+    # if True, training starts from the best checkpoint of the previous run of the same experiment if it's compatible
+    # with the current data and model, with the reduced epochs and LR budget. Otherwise, it starts from scratch
+    enabled: bool = False
+    checkpoint_path: Optional[Path] = None  # use this checkpoint instead of looking up the previous run
+    min_epochs: int = 1
+    max_epochs: int = 5
+    lr_scale: float = 0.1
+
+
+class RunStoreConfig(_BaseValidatedConfig):
+    # if True, config and data fingerprints, metrics, timings and checkpoints of the run are recorded in a local SQLite
+    # index, `experiments_tmp/runs.sqlite` by default
+    enabled: bool = True
+    path: Optional[Path] = None
+    # if True, training is skipped if a finished run with the same config and data is found in the index and its best
+    # checkpoint still exists, results of that run are returned instead. Ignored if `track_in_clearml` is True: the
+    # ClearML task of the run has already been created by then and would be left empty
+    skip_duplicates: bool = False
+
+
 class RunModeEnum(str, Enum):
     pipeline = 'pipeline'
     local = 'local'
@@ -111,10 +246,45 @@ class MLPExperimentConfig(_BaseValidatedConfig, _ConfigYamlMixin):
     trainer_config: MLPTrainerConfig = Field(default=MLPTrainerConfig())
     mlp_model_config: MLPModelConfig = Field(default=MLPModelConfig())
     hyperparameters_config: MLPHyperparametersConfig = Field(default=MLPHyperparametersConfig())
+    warm_start_config: WarmStartConfig = Field(default=WarmStartConfig())
+    metric_logging_config: MetricLoggingConfig = Field(default=MetricLoggingConfig())
+    run_store_config: RunStoreConfig = Field(default=RunStoreConfig())
+
+
+class BatchPreprocessingConfig(_BaseValidatedConfig, _ConfigYamlMixin):
+    project_name: str = 'mlp_classification'
+    seed: Optional[int] = 42
+    # datasets are preprocessed concurrently, the same `raw_csv_url` is downloaded once for all datasets that use it,
+    # e.g. to preprocess one raw dataset with several processing configs under different `orig_dataset_name`s
+    datasets: Tuple[DataConfig, ...]
+    max_workers: Optional[int] = None  # preprocessing processes, number of CPUs by default
+    # if set, address space of every preprocessing process is limited to this size (Unix only), a dataset that needs
+    # more fails with MemoryError instead of exhausting memory of the host
+    max_worker_memory_mb: Optional[int] = None
+    # a preprocessing process is replaced by a fresh one after this number of datasets (Python 3.11+), so memory
+    # fragmented by a large dataset is returned to the OS
+    max_datasets_per_worker: Optional[int] = 1
+    io_threads: int = 4  # threads that download raw data and upload processed data
+    # if True, processed datasets are uploaded to ClearML as new versions of `Prep <orig_dataset_name>` datasets
+    upload_to_clearml: bool = False
+
+    @model_validator(mode='after')
+    def dataset_names_are_unique(self) -> 'BatchPreprocessingConfig':
+        names = [data_cfg.orig_dataset_name for data_cfg in self.datasets]
+        if duplicates := sorted({name for name in names if names.count(name) > 1}):
+            raise ValueError(f'Datasets are stored by `orig_dataset_name`, it must be unique, duplicates: {duplicates}')
+        return self
+
 
+def get_experiment_cfg(
+    cfg_path: Optional[Union[str, Path]] = None,
+    overlay_paths: Optional[Sequence[Union[str, Path]]] = None,
+) -> MLPExperimentConfig:
+    """Read the config, `TRAIN_MLP_CFG_PATH` or the default one, with overlays from `TRAIN_MLP_CFG_OVERLAYS`.
 
-def get_experiment_cfg(cfg_path: Optional[Union[str, Path]] = None) -> MLPExperimentConfig:
-    cfg_path = cfg_path or os.getenv('TRAIN_MLP_CFG_PATH')
-    if not cfg_path:
-        return MLPExperimentConfig.from_yaml(MLP_CFG_PATH)
-    return MLPExperimentConfig.from_yaml(cfg_path)
+    `TRAIN_MLP_CFG_OVERLAYS` is a list of paths separated by `os.pathsep`.
+    """
+    cfg_path = cfg_path or os.getenv('TRAIN_MLP_CFG_PATH') or MLP_CFG_PATH
+    if overlay_paths is None:
+        overlay_paths = [path for path in os.getenv('TRAIN_MLP_CFG_OVERLAYS', '').split(os.pathsep) if path]
+    return MLPExperimentConfig.from_yaml(cfg_path, overlay_paths)
@@ -1,23 +1,171 @@
+import json
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Tuple, Union
+from typing import Dict, List, Literal, Optional, Sequence, Set, Tuple, Union
 
+import numpy as np
 import pandas as pd
 import torch
 
 from src.constants import PROJECT_ROOT
 
+CATEGORICAL_VOCAB_FILENAME = 'categorical_vocab.json'
+UNKNOWN_CATEGORY_CODE = 0
+
+# Categories of each categorically encoded column, code of a category is its index in the list + 1
+CategoricalVocab = Dict[str, List[Union[str, int, float]]]
+
+StorageFormat = Literal['compact', 'csv']
+NumericDtype = Literal['float32', 'float16']
+SPLIT_FILENAMES: Dict[StorageFormat, Tuple[str, str]] = {
+    'compact': ('features.npz', 'target.npz'),
+    'csv': ('features.csv', 'target.csv'),
+}
+_BLOCKS = ('numeric', 'binary', 'integer', 'numeric_idx', 'binary_idx', 'integer_idx')
+
+
+def _smallest_int_dtype(values: np.ndarray) -> np.dtype:
+    if values.size == 0:
+        return np.dtype(np.uint8)
+    return np.result_type(np.min_scalar_type(values.min()), np.min_scalar_type(values.max()))
+
+
+def _get_column_kind(values: pd.Series) -> str:
+    if pd.api.types.is_integer_dtype(values):
+        return 'integer'
+    if values.isin((0, 1)).all():
+        return 'binary'
+    return 'numeric'
+
+
+@dataclass(frozen=True)
+class CompactFeatures:
+    """Processed features stored as column blocks in the smallest faithful dtypes, widened to float32 only on read.
+
+    Binary columns (e.g. one-hot ones) are bit-packed 8 per byte, integer columns (e.g. categorical codes) use the
+    smallest integer type and all other columns are float32, or float16 if requested.
+    """
+
+    columns: Tuple[str, ...]
+    numeric: np.ndarray  # [rows, numeric columns]
+    binary: np.ndarray  # [rows, ceil(binary columns / 8)] of uint8
+    integer: np.ndarray  # [rows, integer columns]
+    # Positions of columns of each block in `columns`
+    numeric_idx: np.ndarray
+    binary_idx: np.ndarray
+    integer_idx: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.numeric)
+
+    @property
+    def nbytes(self) -> int:
+        return self.numeric.nbytes + self.binary.nbytes + self.integer.nbytes
+
+    @classmethod
+    def from_frame(cls, features: pd.DataFrame, numeric_dtype: NumericDtype = 'float32') -> 'CompactFeatures':
+        kinds = [_get_column_kind(features[col]) for col in features.columns]
+        idx = {
+            kind: np.array([pos for pos, col_kind in enumerate(kinds) if col_kind == kind], dtype=np.int64)
+            for kind in ('numeric', 'binary', 'integer')
+        }
+        values = {kind: features.iloc[:, idx[kind]].to_numpy() for kind in idx}
+        return cls(
+            columns=tuple(str(col) for col in features.columns),
+            numeric=values['numeric'].astype(numeric_dtype),
+            binary=np.packbits(values['binary'].astype(np.uint8), axis=1),
+            integer=values['integer'].astype(_smallest_int_dtype(values['integer'])),
+            numeric_idx=idx['numeric'],
+            binary_idx=idx['binary'],
+            integer_idx=idx['integer'],
+        )
+
+    def take(self, rows: Union[np.ndarray, slice]) -> np.ndarray:
+        """Widen the rows into a float32 array."""
+        numeric = self.numeric[rows]
+        widened = np.empty((len(numeric), len(self.columns)), dtype=np.float32)
+        widened[:, self.numeric_idx] = numeric
+        widened[:, self.binary_idx] = np.unpackbits(self.binary[rows], axis=1, count=len(self.binary_idx))
+        widened[:, self.integer_idx] = self.integer[rows]
+        return widened
+
+    def to_frame(self) -> pd.DataFrame:
+        frame = pd.DataFrame(self.take(slice(None)), columns=self.columns)
+        integer_cols = [self.columns[pos] for pos in self.integer_idx]
+        return frame.astype({col: np.int64 for col in integer_cols})
+
+    def save(self, path: Path) -> None:
+        # Not compressed: bit-packing and narrow dtypes do most of the job and loading stays a plain read
+        np.savez(path, columns=np.array(self.columns, dtype=str), **{name: getattr(self, name) for name in _BLOCKS})
+
+    @classmethod
+    def load(cls, path: Path) -> 'CompactFeatures':
+        with np.load(path) as npz:
+            return cls(tuple(npz['columns'].tolist()), **{name: npz[name] for name in _BLOCKS})
+
+    @classmethod
+    def concat(cls, parts: Sequence['CompactFeatures']) -> 'CompactFeatures':
+        """Concatenate rows of parts, e.g. of a split and the parts appended to it."""
+        first = parts[0]
+        if len(parts) == 1:
+            return first
+        same_layout = all(
+            part.columns == first.columns
+            and all(np.array_equal(getattr(part, name), getattr(first, name)) for name in _BLOCKS[3:])
+            for part in parts[1:]
+        )
+        if not same_layout:
+            # A column can change its kind between parts, e.g. appended rows of a binary column aren't all 0 or 1
+            numeric_dtype = np.result_type(*(part.numeric for part in parts)).name
+            return cls.from_frame(pd.concat([part.to_frame() for part in parts], ignore_index=True), numeric_dtype)
+        return cls(
+            columns=first.columns,
+            numeric=np.concatenate([part.numeric for part in parts]),
+            binary=np.concatenate([part.binary for part in parts]),
+            integer=np.concatenate([part.integer for part in parts]),
+            numeric_idx=first.numeric_idx,
+            binary_idx=first.binary_idx,
+            integer_idx=first.integer_idx,
+        )
+
+
+def get_split_paths(processed_path: Path, split: str) -> Tuple[Path, Path]:
+    """Paths of features and target files of a split, in the format it has been saved in."""
+    split_path = processed_path / split
+    storage_format: StorageFormat = 'compact' if (split_path / SPLIT_FILENAMES['compact'][0]).is_file() else 'csv'
+    features_filename, target_filename = SPLIT_FILENAMES[storage_format]
+    return split_path / features_filename, split_path / target_filename
+
+
+def _get_part_paths(path: Path) -> List[Path]:
+    # Rows appended to `features.npz` are stored in `features.part-00001.npz`, `features.part-00002.npz`, etc.
+    return sorted(path.parent.glob(f'{path.stem}.part-*{path.suffix}'))
+
+
+def get_split_files(processed_path: Path, split: str) -> List[Path]:
+    """All files of a split: features and target files and the parts appended to them."""
+    features_path, target_path = get_split_paths(processed_path, split)
+    return [features_path, target_path, *_get_part_paths(features_path), *_get_part_paths(target_path)]
+
 
 @dataclass(frozen=True)
 class TabularSplit:
-    _features: pd.DataFrame
+    _features: Union[pd.DataFrame, CompactFeatures]
     _target: pd.Series
     split: str
 
     @property
     def features(self) -> pd.DataFrame:
+        if isinstance(self._features, CompactFeatures):
+            return self._features.to_frame()
         return self._features.copy()
 
+    @property
+    def feature_names(self) -> Tuple[str, ...]:
+        if isinstance(self._features, CompactFeatures):
+            return self._features.columns
+        return tuple(self._features.columns)
+
     @property
     def target(self) -> pd.Series:
         return self._target.copy()
@@ -37,22 +185,121 @@ class TabularSplit:
         return len(self._target)
 
     def __getitem__(self, idx: int) -> Tuple[torch.Tensor, torch.Tensor]:
-        return (
-            # .to_numpy() is needed to avoid spamming of FutureWarnings, because torch.tensor() calls
-            # Series.__getitem__(pos) which is deprecated by pandas
-            torch.tensor(self._features.iloc[idx].to_numpy(), dtype=torch.float32),
-            torch.tensor(self._target.iloc[idx], dtype=torch.int64),
-        )
+        features, target = self.get_batch([idx])
+        return features[0], target[0]
+
+    def get_batch(self, indices: Union[Sequence[int], np.ndarray]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Features and target of the rows, they are widened to float32 and int64 only here."""
+        rows = np.asarray(indices, dtype=np.int64)
+        if isinstance(self._features, CompactFeatures):
+            features = self._features.take(rows)
+        else:
+            features = self._features.iloc[rows].to_numpy(dtype=np.float32)
+        target = self._target.to_numpy()[rows].astype(np.int64)
+        return torch.from_numpy(features), torch.from_numpy(target)
 
-    def to_csv(self, export_dir: Union[str, Path]) -> None:
+    def save(
+        self,
+        export_dir: Union[str, Path],
+        append: bool = False,
+        storage_format: StorageFormat = 'compact',
+        numeric_dtype: NumericDtype = 'float32',
+    ) -> None:
+        """Export the split, if `append` is True, rows are appended to the already exported split.
+
+        `compact` splits are stored in `.npz` files in the smallest faithful dtypes (see `CompactFeatures`), with the
+        target in the smallest integer type, appended rows are stored in part files next to them. `csv` splits are
+        stored as text. Files of the other format are removed.
+        """
         export_path = PROJECT_ROOT / export_dir / self.split
         export_path.mkdir(parents=True, exist_ok=True)
-        self._features.to_csv(export_path / 'features.csv', index=False)
-        self._target.to_csv(export_path / 'target.csv', index=False)
+        features_path, target_path = (export_path / filename for filename in SPLIT_FILENAMES[storage_format])
+
+        if storage_format == 'csv':
+            mode, header = ('a', False) if append else ('w', True)
+            self.features.to_csv(features_path, index=False, mode=mode, header=header)
+            self._target.to_csv(target_path, index=False, mode=mode, header=header)
+        else:
+            base_paths = (features_path, target_path)
+            if append and features_path.is_file():
+                if len(self) == 0:
+                    return
+                # Appended rows go to a new part, so appending doesn't read or rewrite the rows saved before
+                part = f'.part-{len(_get_part_paths(features_path)) + 1:05d}'
+                features_path, target_path = (path.with_name(path.stem + part + path.suffix) for path in base_paths)
+            else:
+                for path in base_paths:
+                    for part_path in _get_part_paths(path):
+                        part_path.unlink()
+            CompactFeatures.from_frame(self.features, numeric_dtype).save(features_path)
+            target_np = self._target.to_numpy()
+            if pd.api.types.is_integer_dtype(target_np):
+                target_np = target_np.astype(_smallest_int_dtype(target_np))
+            np.savez(target_path, **{str(self._target.name): target_np})
+
+        other_format: StorageFormat = 'csv' if storage_format == 'compact' else 'compact'
+        for filename in SPLIT_FILENAMES[other_format]:
+            path = export_path / filename
+            for part_path in _get_part_paths(path):
+                part_path.unlink()
+            path.unlink(missing_ok=True)
 
     @classmethod
     def from_folder(cls, processed_path: Path, split: str, target_col: str) -> 'TabularSplit':
-        subset_path = processed_path / split
-        features = pd.read_csv(subset_path / 'features.csv')
-        target = pd.read_csv(subset_path / 'target.csv')[target_col]
-        return TabularSplit(features, target, split)
+        features_path, target_path = get_split_paths(processed_path, split)
+        if features_path.suffix == '.csv':
+            return TabularSplit(pd.read_csv(features_path), pd.read_csv(target_path)[target_col], split)
+        features = CompactFeatures.concat(
+            [CompactFeatures.load(path) for path in [features_path, *_get_part_paths(features_path)]],
+        )
+        target_parts = []
+        for path in [target_path, *_get_part_paths(target_path)]:
+            with np.load(path) as target_npz:
+                target_parts.append(target_npz[target_col])
+        return TabularSplit(features, pd.Series(np.concatenate(target_parts), name=target_col), split)
+
+    @staticmethod
+    def read_feature_names(processed_path: Path, split: str) -> Tuple[str, ...]:
+        # Only the header (the column names array) is read, so features are known without loading the split
+        features_path, _ = get_split_paths(processed_path, split)
+        if features_path.suffix == '.csv':
+            return tuple(pd.read_csv(features_path, nrows=0).columns)
+        with np.load(features_path) as npz:
+            return tuple(npz['columns'].tolist())
+
+    @staticmethod
+    def read_num_classes(processed_path: Path, split: str, target_col: str) -> int:
+        _, target_path = get_split_paths(processed_path, split)
+        if target_path.suffix == '.csv':
+            return int(pd.read_csv(target_path, usecols=[target_col])[target_col].nunique())
+        classes: Set[int] = set()
+        for path in [target_path, *_get_part_paths(target_path)]:
+            with np.load(path) as target_npz:
+                classes.update(np.unique(target_npz[target_col]).tolist())
+        return len(classes)
+
+
+def save_categorical_vocab(vocab: Optional[CategoricalVocab], processed_path: Path) -> None:
+    vocab_path = processed_path / CATEGORICAL_VOCAB_FILENAME
+    if vocab is None:
+        # Remove a stale vocabulary left after preprocessing with categorical codes
+        vocab_path.unlink(missing_ok=True)
+        return
+    with open(vocab_path, 'w') as out_file:
+        json.dump(vocab, out_file, indent=2)
+
+
+def read_categorical_vocab(processed_path: Path) -> Optional[CategoricalVocab]:
+    vocab_path = processed_path / CATEGORICAL_VOCAB_FILENAME
+    if not vocab_path.is_file():
+        return None
+    with open(vocab_path) as in_file:
+        return json.load(in_file)  # type: ignore[no-any-return]
+
+
+def read_categorical_cardinalities(processed_path: Path) -> Tuple[int, ...]:
+    """Number of embedding rows per code column (known categories + the reserved unknown one), empty if no codes."""
+    vocab = read_categorical_vocab(processed_path)
+    if vocab is None:
+        return ()
+    return tuple(len(categories) + 1 for categories in vocab.values())
@@ -0,0 +1,208 @@
+"""Preprocess many datasets concurrently, e.g. to refresh all datasets maintained with the same pipeline at once.
+
+Raw CSVs are downloaded by a thread pool, each distinct `raw_csv_url` once. As soon as a download finishes, datasets
+that use it are preprocessed by a process pool, and their processed data is uploaded to ClearML by the thread pool
+while other datasets are still being preprocessed. A summary of timings and outputs is printed and saved at the end.
+
+    python src/data/preprocessing/batch.py [<batch_config.yaml>]
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.config import BatchPreprocessingConfig, DataConfig
+from src.constants import CONFIGS, TMP_DATA_DIR
+from src.data.preprocessing.main import fetch_csv, get_raw_csv_path, preprocess_data
+
+DEFAULT_BATCH_CFG_PATH = CONFIGS / 'heart_batch_preprocessing.yaml'
+
+
+@dataclass
+class DatasetResult:
+    orig_dataset_name: str
+    raw_csv_url: str
+    status: str = 'pending'  # `ok` or `error` when finished
+    download_s: float = 0  # of the shared download of `raw_csv_url`
+    preprocess_s: float = 0
+    upload_s: float = 0
+    processed_dir: str = ''
+    processed_mb: float = 0
+    clearml_dataset_id: str = ''
+    error: str = ''
+
+
+def _init_worker(max_memory_mb: Optional[int]) -> None:
+    if max_memory_mb is None:
+        return
+    import resource  # Unix only
+
+    limit = max_memory_mb * 2**20
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _download(raw_csv_url: str, path: Path) -> Tuple[Path, float]:
+    start = time.perf_counter()
+    fetch_csv(raw_csv_url, path)
+    return path, time.perf_counter() - start
+
+
+def _preprocess(project_name: str, data_cfg: DataConfig, raw_csv_path: Path, seed: Optional[int]) -> Tuple[Path, float]:
+    start = time.perf_counter()
+    processed_dir = preprocess_data(project_name, data_cfg, raw_csv_path, seed)
+    return processed_dir, time.perf_counter() - start
+
+
+def _upload(project_name: str, data_cfg: DataConfig, processed_dir: Path) -> Tuple[str, float]:
+    # Imported here to keep preprocessing processes free of ClearML
+    from src.clearml_pipeline.preprocess.core import upload_processed_dir
+
+    start = time.perf_counter()
+    dataset_id = upload_processed_dir(project_name, data_cfg, processed_dir)
+    return dataset_id, time.perf_counter() - start
+
+
+def _get_dir_mb(path: Path) -> float:
+    return sum(file_path.stat().st_size for file_path in path.rglob('*') if file_path.is_file()) / 2**20
+
+
+def _get_process_pool(cfg: BatchPreprocessingConfig) -> ProcessPoolExecutor:
+    kwargs: Dict[str, Any] = {}
+    if cfg.max_datasets_per_worker is not None and sys.version_info >= (3, 11):
+        kwargs['max_tasks_per_child'] = cfg.max_datasets_per_worker
+    return ProcessPoolExecutor(
+        max_workers=min(cfg.max_workers or os.cpu_count() or 1, len(cfg.datasets)),
+        # Processes aren't forked from this one, whose I/O threads are running
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(cfg.max_worker_memory_mb,),
+        **kwargs,
+    )
+
+
+class _BatchRunner:
+    """Chains stages of every dataset: shared download (threads), preprocessing (processes), upload (threads)."""
+
+    def __init__(self, cfg: BatchPreprocessingConfig, io_pool: ThreadPoolExecutor, process_pool: ProcessPoolExecutor):
+        self.cfg = cfg
+        self.io_pool = io_pool
+        self.process_pool = process_pool
+        self.datasets = {data_cfg.orig_dataset_name: data_cfg for data_cfg in cfg.datasets}
+        self.results = {name: DatasetResult(name, data_cfg.raw_csv_url) for name, data_cfg in self.datasets.items()}
+        self.names_by_url: Dict[str, List[str]] = defaultdict(list)
+        for name, data_cfg in self.datasets.items():
+            self.names_by_url[data_cfg.raw_csv_url].append(name)
+        # Every running future is tagged with its stage and the URL (downloads) or the dataset name (other stages)
+        self._stages: Dict[Future, Tuple[str, str]] = {}
+
+    def run(self) -> List[DatasetResult]:
+        downloads_dir = TMP_DATA_DIR / self.cfg.project_name / 'downloads'
+        for url in self.names_by_url:
+            shared_path = downloads_dir / f'{hashlib.sha1(url.encode()).hexdigest()[:16]}.csv'
+            self._stages[self.io_pool.submit(_download, url, shared_path)] = ('download', url)
+
+        handlers = {'download': self._on_downloaded, 'preprocess': self._on_preprocessed, 'upload': self._on_uploaded}
+        while self._stages:
+            done, _ = wait(self._stages, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, key = self._stages.pop(future)
+                if (error := future.exception()) is not None:
+                    for name in self.names_by_url[key] if stage == 'download' else [key]:
+                        self._record_error(name, stage, error)
+                    continue
+                try:
+                    handlers[stage](key, *future.result())
+                except Exception as error:  # a failure to start the next stage fails only datasets of this future
+                    running = {running_key for _, running_key in self._stages.values()}
+                    for name in self.names_by_url[key] if stage == 'download' else [key]:
+                        if name not in running and self.results[name].status == 'pending':
+                            self._record_error(name, stage, error)
+        return list(self.results.values())
+
+    def _record_error(self, name: str, stage: str, error: BaseException) -> None:
+        self.results[name].status = 'error'
+        self.results[name].error = f'{stage} failed: {type(error).__name__}: {error}'
+
+    def _on_downloaded(self, url: str, shared_path: Path, elapsed: float) -> None:
+        for name in self.names_by_url[url]:
+            self.results[name].download_s = elapsed
+            data_cfg = self.datasets[name]
+            raw_csv_path = get_raw_csv_path(self.cfg.project_name, data_cfg)
+            try:
+                # Every dataset keeps its own copy of `raw.csv`: it can be preprocessed or trained on alone later and
+                # rows appended to it for incremental preprocessing don't leak into other datasets
+                fetch_csv(str(shared_path), raw_csv_path)
+                preprocess_args = (self.cfg.project_name, data_cfg, raw_csv_path, self.cfg.seed)
+                future = self.process_pool.submit(_preprocess, *preprocess_args)
+            except Exception as error:  # e.g. a full disk or a process pool broken by a killed worker
+                self._record_error(name, 'preprocess', error)
+                continue
+            self._stages[future] = ('preprocess', name)
+
+    def _on_preprocessed(self, name: str, processed_dir: Path, elapsed: float) -> None:
+        result = self.results[name]
+        result.preprocess_s = elapsed
+        result.processed_dir = str(processed_dir)
+        result.processed_mb = _get_dir_mb(processed_dir)
+        if not self.cfg.upload_to_clearml:
+            result.status = 'ok'
+            return
+        future = self.io_pool.submit(_upload, self.cfg.project_name, self.datasets[name], processed_dir)
+        self._stages[future] = ('upload', name)
+
+    def _on_uploaded(self, name: str, dataset_id: str, elapsed: float) -> None:
+        result = self.results[name]
+        result.upload_s = elapsed
+        result.clearml_dataset_id = dataset_id
+        result.status = 'ok'
+
+
+def run_batch_preprocessing(cfg: BatchPreprocessingConfig) -> List[DatasetResult]:
+    with ThreadPoolExecutor(cfg.io_threads) as io_pool, _get_process_pool(cfg) as process_pool:
+        return _BatchRunner(cfg, io_pool, process_pool).run()
+
+
+def print_summary(results: List[DatasetResult], elapsed: float) -> None:
+    print(f'{"dataset":<32} {"status":<7} {"download, s":>11} {"preprocess, s":>13} {"upload, s":>9} {"size, MB":>9}')
+    for result in results:
+        print(
+            f'{result.orig_dataset_name[:32]:<32} {result.status:<7} {result.download_s:>11.1f} '
+            f'{result.preprocess_s:>13.1f} {result.upload_s:>9.1f} {result.processed_mb:>9.1f}',
+        )
+    for result in results:
+        if result.error:
+            print(f'`{result.orig_dataset_name}`: {result.error}')
+    download_times = {result.raw_csv_url: result.download_s for result in results}  # shared downloads counted once
+    stages_s = sum(download_times.values()) + sum(result.preprocess_s + result.upload_s for result in results)
+    num_ok = sum(result.status == 'ok' for result in results)
+    print(f'{num_ok}/{len(results)} datasets are preprocessed in {elapsed:.1f}s, stages take {stages_s:.1f}s in total')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Preprocess many datasets concurrently')
+    parser.add_argument('config', type=Path, nargs='?', default=DEFAULT_BATCH_CFG_PATH)
+    parser.add_argument('--summary', type=Path, help='Summary JSON, `data_tmp/<project_name>/batch_summary.json`')
+    args = parser.parse_args()
+
+    batch_cfg = BatchPreprocessingConfig.from_yaml(args.config)
+    started = time.perf_counter()
+    dataset_results = run_batch_preprocessing(batch_cfg)
+    total_elapsed = time.perf_counter() - started
+    print_summary(dataset_results, total_elapsed)
+
+    summary_path = args.summary or TMP_DATA_DIR / batch_cfg.project_name / 'batch_summary.json'
+    summary_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(summary_path, 'w') as out_file:
+        summary = {'elapsed_s': total_elapsed, 'datasets': [asdict(result) for result in dataset_results]}
+        json.dump(summary, out_file, indent=2)
+    print(f'Summary is saved to `{summary_path}`')
+    if any(result.status != 'ok' for result in dataset_results):
+        sys.exit(1)
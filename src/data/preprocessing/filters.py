@@ -0,0 +1,203 @@
+import ast
+from dataclasses import dataclass
+from functools import reduce
+from typing import Any, Callable, Dict, List, Mapping, Sequence, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.config import AllowedValuesRule, ExpressionRule, FilterRule, NotNullRule, ProcessingConfig, RangeRule
+
+Arrays = Mapping[str, np.ndarray]
+# Writes a boolean mask of rows that pass the check into the `out` buffer
+Check = Callable[[Arrays, np.ndarray], None]
+
+
+@dataclass(frozen=True)
+class _CompiledRule:
+    name: str
+    columns: Tuple[str, ...]
+    checks: Tuple[Check, ...]
+
+
+class RowFilter:
+    """Filter compiled from declarative rules into checks over NumPy arrays, fused into one mask.
+
+    Every check writes into the same preallocated scratch buffer, which is then reduced into the mask in-place, so
+    apart from the mask and the scratch buffer, only `not_null` over non-float columns, `allowed_values` and
+    `expression` rules allocate temporary arrays. Counts of rejected rows are accumulated across all filtered chunks,
+    a row is counted for the first rule (in the declared order) it doesn't satisfy.
+    """
+
+    def __init__(self, rules: Sequence[FilterRule]):
+        self._rules = tuple(_compile_rule(rule) for rule in rules)
+        self.columns = tuple(dict.fromkeys(col for rule in self._rules for col in rule.columns))
+        self.total_rows = 0
+        self.rejected_rows: Dict[str, int] = {rule.name: 0 for rule in self._rules}
+
+    def __bool__(self) -> bool:
+        return bool(self._rules)
+
+    def mask(self, data: pd.DataFrame) -> np.ndarray:
+        num_rows = len(data)
+        self.total_rows += num_rows
+        # `.to_numpy()` doesn't copy numeric columns
+        arrays = {col: data[col].to_numpy() for col in self.columns}
+
+        passed = np.ones(num_rows, dtype=bool)
+        scratch = np.empty(num_rows, dtype=bool)
+        num_passed = num_rows
+        for rule in self._rules:
+            for check in rule.checks:
+                check(arrays, scratch)
+                np.logical_and(passed, scratch, out=passed)
+            num_passed_after = int(np.count_nonzero(passed))
+            self.rejected_rows[rule.name] += num_passed - num_passed_after
+            num_passed = num_passed_after
+        return passed
+
+    def filter(self, data: pd.DataFrame) -> pd.DataFrame:
+        if not self:
+            return data
+        return data[self.mask(data)]
+
+    def report(self) -> str:
+        lines = [f'Row filter: {sum(self.rejected_rows.values())} of {self.total_rows} rows rejected']
+        lines.extend(f'  {name}: {rejected} rows rejected' for name, rejected in self.rejected_rows.items())
+        return '\n'.join(lines)
+
+
+def get_row_filter(prep_cfg: ProcessingConfig) -> RowFilter:
+    rules: List[FilterRule] = [
+        RangeRule(column=col, min_value=0, min_inclusive=False) for col in prep_cfg.positive_columns or ()
+    ]
+    rules.extend(prep_cfg.row_filters)
+    return RowFilter(rules)
+
+
+def _compile_rule(rule: FilterRule) -> _CompiledRule:
+    if isinstance(rule, RangeRule):
+        return _compile_range(rule)
+    elif isinstance(rule, NotNullRule):
+        return _CompiledRule(f'{", ".join(rule.columns)} not null', rule.columns, tuple(map(_not_null, rule.columns)))
+    elif isinstance(rule, AllowedValuesRule):
+        return _CompiledRule(
+            f'{rule.column} in {list(rule.values)}',
+            (rule.column,),
+            (_allowed_values(rule.column, rule.values),),
+        )
+    elif isinstance(rule, ExpressionRule):
+        return _compile_expression(rule.expression)
+    raise TypeError(f'Unknown filter rule: {rule}')
+
+
+def _compile_range(rule: RangeRule) -> _CompiledRule:
+    col = rule.column
+    checks = []
+    name_parts = []
+    if rule.min_value is not None:
+        min_op = np.greater_equal if rule.min_inclusive else np.greater
+        checks.append(_compare_with_constant(col, min_op, rule.min_value))
+        name_parts.append(f'{col} {">=" if rule.min_inclusive else ">"} {rule.min_value:g}')
+    if rule.max_value is not None:
+        max_op = np.less_equal if rule.max_inclusive else np.less
+        checks.append(_compare_with_constant(col, max_op, rule.max_value))
+        name_parts.append(f'{col} {"<=" if rule.max_inclusive else "<"} {rule.max_value:g}')
+    if not checks:
+        raise ValueError(f'Range rule for `{col}` column must have `min_value` and/or `max_value`.')
+    return _CompiledRule(' and '.join(name_parts), (col,), tuple(checks))
+
+
+def _compare_with_constant(col: str, op: np.ufunc, value: float) -> Check:
+    # NaNs are never in range, comparisons with them are False
+    def check(arrays: Arrays, out: np.ndarray) -> None:
+        op(arrays[col], value, out=out)
+
+    return check
+
+
+def _not_null(col: str) -> Check:
+    def check(arrays: Arrays, out: np.ndarray) -> None:
+        values = arrays[col]
+        if values.dtype.kind == 'f':
+            np.isnan(values, out=out)
+            np.logical_not(out, out=out)
+        elif values.dtype.kind in 'iub':
+            out.fill(True)
+        else:
+            np.copyto(out, pd.notna(values))
+
+    return check
+
+
+def _allowed_values(col: str, values: Sequence[Any]) -> Check:
+    allowed = np.array(values)
+
+    def check(arrays: Arrays, out: np.ndarray) -> None:
+        np.copyto(out, np.isin(arrays[col], allowed))
+
+    return check
+
+
+_BIN_OPS: Dict[type, np.ufunc] = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.true_divide,
+}
+_COMPARE_OPS: Dict[type, np.ufunc] = {
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+}
+_Evaluator = Callable[[Arrays], Any]
+
+
+def _compile_expression(expression: str) -> _CompiledRule:
+    """Compile a simple expression into NumPy calls, only a small whitelist of syntax is allowed, nothing is eval-ed."""
+    columns: Set[str] = set()
+    evaluate = _compile_node(ast.parse(expression, mode='eval').body, columns, expression)
+
+    def check(arrays: Arrays, out: np.ndarray) -> None:
+        np.copyto(out, evaluate(arrays), casting='unsafe')
+
+    return _CompiledRule(expression, tuple(sorted(columns)), (check,))
+
+
+def _compile_node(node: ast.AST, columns: Set[str], expression: str) -> _Evaluator:  # noqa: C901
+    def compile_child(child: ast.AST) -> _Evaluator:
+        return _compile_node(child, columns, expression)
+
+    if isinstance(node, ast.Name):
+        name = node.id
+        columns.add(name)
+        return lambda arrays: arrays[name]
+    elif isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str)):
+        value = node.value
+        return lambda arrays: value
+    elif isinstance(node, ast.BinOp) and type(node.op) in _BIN_OPS:
+        bin_op, left, right = _BIN_OPS[type(node.op)], compile_child(node.left), compile_child(node.right)
+        return lambda arrays: bin_op(left(arrays), right(arrays))
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.Not)):
+        unary_op = np.negative if isinstance(node.op, ast.USub) else np.logical_not
+        operand = compile_child(node.operand)
+        return lambda arrays: unary_op(operand(arrays))
+    elif isinstance(node, ast.BoolOp):
+        bool_op = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        operands = [compile_child(value) for value in node.values]
+        return lambda arrays: reduce(bool_op, (operand(arrays) for operand in operands))
+    elif isinstance(node, ast.Compare) and all(type(op) in _COMPARE_OPS for op in node.ops):
+        # Chained comparisons like `0 < Age < 100` are split into pairwise ones joined with `and`
+        operands = [compile_child(node.left), *map(compile_child, node.comparators)]
+        ops = [_COMPARE_OPS[type(op)] for op in node.ops]
+
+        def compare(arrays: Arrays) -> Any:
+            values = [operand(arrays) for operand in operands]
+            results = (op(left, right) for op, left, right in zip(ops, values, values[1:]))
+            return reduce(np.logical_and, results)
+
+        return compare
+    raise ValueError(f'Unsupported syntax `{ast.dump(node)}` in filter expression `{expression}`.')
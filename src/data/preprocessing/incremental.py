@@ -0,0 +1,202 @@
+import hashlib
+import json
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from src.config import ProcessingConfig
+from src.data.preprocessing.filters import RowFilter
+from src.data.preprocessing.split_manifest import (
+    SPLIT_MANIFEST_FILENAME,
+    SPLIT_NAMES,
+    SplitManifest,
+    assign_hash_splits,
+    get_manifest_fingerprint,
+)
+from src.data.preprocessing.steps import hash_file, load_transformer, save_splits, transform_cols
+from src.data.stats import REFERENCE_STATS_FILENAME, DatasetStats, compute_drift
+
+INCREMENTAL_STATE_FILENAME = 'incremental_state.json'
+# Statistics of all rows appended since the previous full preprocessing, compared against reference statistics
+APPENDED_STATS_FILENAME = 'appended_stats.json'
+# Processing settings that don't affect processed data
+_NOT_FINGERPRINTED_FIELDS = {
+    'incremental',
+    'incremental_drift_threshold',
+    'incremental_ks_threshold',
+    'incremental_min_drift_rows',
+    'read_chunk_size',
+}
+
+
+@dataclass(frozen=True)
+class IncrementalState:
+    """What processed data was produced from: raw CSV and settings."""
+
+    config_fingerprint: str
+    raw_bytes: int
+    raw_sha1: str
+    num_rows: int  # number of rows of raw data that passed filters
+
+    def save(self, processed_dir: Path) -> None:
+        with open(processed_dir / INCREMENTAL_STATE_FILENAME, 'w') as out_file:
+            json.dump(asdict(self), out_file, indent=2)
+
+    @classmethod
+    def load(cls, processed_dir: Path) -> Optional['IncrementalState']:
+        state_path = processed_dir / INCREMENTAL_STATE_FILENAME
+        if not state_path.is_file():
+            return None
+        with open(state_path) as in_file:
+            return cls(**json.load(in_file))
+
+
+def get_config_fingerprint(prep_cfg: ProcessingConfig, seed: Optional[int]) -> str:
+    cfg_dump = prep_cfg.model_dump(exclude=_NOT_FINGERPRINTED_FIELDS)
+    return hashlib.sha1(json.dumps([cfg_dump, seed], sort_keys=True, default=str).encode()).hexdigest()
+
+
+def save_incremental_state(
+    processed_dir: Path,
+    raw_csv_path: Path,
+    raw_sha1: str,
+    num_rows: int,
+    prep_cfg: ProcessingConfig,
+    seed: Optional[int],
+) -> None:
+    """Save the state needed to append rows added to raw CSV later, drift is checked against reference statistics."""
+    IncrementalState(
+        config_fingerprint=get_config_fingerprint(prep_cfg, seed),
+        raw_bytes=raw_csv_path.stat().st_size,
+        raw_sha1=raw_sha1,
+        num_rows=num_rows,
+    ).save(processed_dir)
+    (processed_dir / APPENDED_STATS_FILENAME).unlink(missing_ok=True)
+
+
+def remove_incremental_state(processed_dir: Path) -> None:
+    # Processed data rewritten without saving a new state must not be appended to using a stale one
+    (processed_dir / INCREMENTAL_STATE_FILENAME).unlink(missing_ok=True)
+    (processed_dir / APPENDED_STATS_FILENAME).unlink(missing_ok=True)
+
+
+def update_incrementally(
+    processed_dir: Path,
+    raw_csv_path: Path,
+    prep_cfg: ProcessingConfig,
+    row_filter: RowFilter,
+    seed: Optional[int],
+) -> bool:
+    """Append rows added to raw CSV since the previous preprocessing to processed splits.
+
+    New rows are assigned to splits by hash of their keys (`split_key_columns`) and transformed with the frozen
+    transformer fitted by the previous full preprocessing. Drift of all rows appended since then is scored against
+    reference statistics of the train split with `src.data.stats.compute_drift`.
+
+    Returns:
+        True if processed data is up-to-date, False if full preprocessing is needed: there's no previous state, the
+        settings have changed, raw data has been modified not only by appending rows or appended rows have drifted
+        (PSI above `incremental_drift_threshold` or KS above `incremental_ks_threshold`). Drift is checked only once at
+        least `incremental_min_drift_rows` rows have been appended.
+    """
+    state = IncrementalState.load(processed_dir)
+    transformer = load_transformer(processed_dir)
+    manifest_path = processed_dir / SPLIT_MANIFEST_FILENAME
+    reference_path = processed_dir / REFERENCE_STATS_FILENAME
+    if state is None or transformer is None or not manifest_path.is_file() or not reference_path.is_file():
+        print('No state of previous preprocessing is found, running full preprocessing.')
+        return False
+    if state.config_fingerprint != get_config_fingerprint(prep_cfg, seed):
+        print('Processing settings have changed since the previous preprocessing, running full preprocessing.')
+        return False
+
+    prefix_sha1, raw_sha1 = hash_file(raw_csv_path, prefix_bytes=state.raw_bytes)
+    if prefix_sha1 != state.raw_sha1:
+        print('Raw data is not an append-only update of the previously preprocessed one, running full preprocessing.')
+        return False
+    if raw_sha1 == state.raw_sha1:
+        print('No rows have been appended to raw data since the previous preprocessing.')
+        return True
+    if not _ends_with_newline(raw_csv_path, state.raw_bytes):
+        print('The last row of previously preprocessed raw data has been modified, running full preprocessing.')
+        return False
+
+    new_data = row_filter.filter(_read_appended_rows(raw_csv_path, state.raw_bytes))
+    new_features = new_data.drop([prep_cfg.target_column], axis=1)
+    new_target = new_data[prep_cfg.target_column]
+    print(f'{len(new_data)} appended rows passed filters.')
+    if len(new_data) == 0:
+        # Nothing to append, only the state moves past the appended bytes so that they aren't read again
+        replace(state, raw_bytes=raw_csv_path.stat().st_size, raw_sha1=raw_sha1).save(processed_dir)
+        return True
+
+    # Small appends add up, so that drift is scored on a sample large enough to tell it from chance
+    reference = DatasetStats.load(reference_path)
+    appended_stats_path = processed_dir / APPENDED_STATS_FILENAME
+    if appended_stats_path.is_file():
+        appended_stats = DatasetStats.load(appended_stats_path)
+    else:
+        appended_stats = DatasetStats(reference.categorical_cols)
+    appended_stats.update(new_data)
+    if appended_stats.num_rows < prep_cfg.incremental_min_drift_rows:
+        print(
+            f'Drift is checked once {prep_cfg.incremental_min_drift_rows} rows have been appended since the previous '
+            f'full preprocessing, {appended_stats.num_rows} so far.',
+        )
+    else:
+        scores = compute_drift(
+            reference,
+            appended_stats,
+            prep_cfg.incremental_drift_threshold,
+            prep_cfg.incremental_ks_threshold,
+        )
+        if drifted := [score.column for score in scores if score.drifted]:
+            print(f'Statistics of appended rows have drifted in columns {drifted}, running full preprocessing.')
+            return False
+
+    keys = new_features[list(prep_cfg.split_key_columns)] if prep_cfg.split_key_columns else new_features
+    split_ids = assign_hash_splits(keys, prep_cfg.split_ratios)
+    new_indices = [np.flatnonzero(split_ids == split_id) for split_id in range(len(SPLIT_NAMES))]
+    new_manifest = SplitManifest(*new_indices, fingerprint='')
+    new_splits = transform_cols(transformer, new_manifest.materialize(new_features, new_target))
+    save_splits(new_splits, processed_dir, prep_cfg, append=True)
+
+    # Appended rows continue the base table and are split by the same hash rule, so the manifest is the one a full
+    # split of the new raw data would produce
+    manifest = SplitManifest.load(manifest_path)
+    SplitManifest(
+        *(
+            np.concatenate([old_indices, state.num_rows + indices])
+            for old_indices, indices in zip((manifest.train, manifest.val, manifest.test), new_indices)
+        ),
+        fingerprint=get_manifest_fingerprint(raw_sha1, prep_cfg, seed),
+    ).save(manifest_path)
+
+    IncrementalState(
+        config_fingerprint=state.config_fingerprint,
+        raw_bytes=raw_csv_path.stat().st_size,
+        raw_sha1=raw_sha1,
+        num_rows=state.num_rows + len(new_data),
+    ).save(processed_dir)
+    appended_stats.save(appended_stats_path)
+    print(f'Appended rows are added to splits: {dict(zip(SPLIT_NAMES, map(len, new_indices)))}')
+    return True
+
+
+def _ends_with_newline(path: Path, num_bytes: int) -> bool:
+    with open(path, 'rb') as in_file:
+        in_file.seek(num_bytes - 1)
+        return in_file.read(1) == b'\n'
+
+
+def _read_appended_rows(raw_csv_path: Path, offset: int) -> pd.DataFrame:
+    columns = pd.read_csv(raw_csv_path, nrows=0).columns
+    with open(raw_csv_path, 'rb') as in_file:
+        in_file.seek(offset)
+        try:
+            return pd.read_csv(in_file, header=None, names=columns)
+        except pd.errors.EmptyDataError:  # only blank lines have been appended
+            return pd.DataFrame(columns=columns)
@@ -1,18 +1,34 @@
+import os
+import shutil
+import tempfile
 from pathlib import Path
 from typing import Optional, Union
-from urllib.request import urlretrieve
+from urllib.parse import urlparse
+from urllib.request import url2pathname, urlretrieve
 
 import lightning
 
 from src.config import DataConfig
+from src.constants import PROJECT_ROOT
+from src.data.data_model import save_categorical_vocab
+from src.data.preprocessing.filters import get_row_filter
+from src.data.preprocessing.incremental import (
+    remove_incremental_state,
+    save_incremental_state,
+    update_incrementally,
+)
 from src.data.preprocessing.path_helpers import _get_dataset_dir, _get_processed_dir_path
+from src.data.preprocessing.split_manifest import SPLIT_MANIFEST_FILENAME, get_split_manifest
 from src.data.preprocessing.steps import (
-    filter_positive_cols,
     fit_col_transformer,
+    get_categorical_vocab,
+    hash_file,
     read_data,
-    split_data,
+    save_splits,
+    save_transformer,
     transform_cols,
 )
+from src.data.stats import save_reference_stats
 
 RAW_CSV_FILENAME = 'raw.csv'
 
@@ -40,31 +56,65 @@ def preprocess_data(
     if seed is not None:
         lightning.seed_everything(seed)
 
-    features, target = read_data(Path(raw_csv_path), prep_cfg.target_column)
-    features, target = filter_positive_cols(features, target, prep_cfg.positive_columns)
-    splits = split_data(features, target, prep_cfg.split_ratios)
+    raw_csv_path = Path(raw_csv_path)
+    row_filter = get_row_filter(prep_cfg)
+    processed_dir = _get_processed_dir_path(project_name, data_cfg.orig_dataset_name)
+    if prep_cfg.incremental and update_incrementally(processed_dir, raw_csv_path, prep_cfg, row_filter, seed):
+        print(f'Dataset is incrementally preprocessed and saved to {processed_dir}')
+        return processed_dir
+
+    features, target = read_data(raw_csv_path, prep_cfg.target_column, row_filter, prep_cfg.read_chunk_size)
+    if row_filter:
+        print(row_filter.report())
+
+    manifest_path = processed_dir / SPLIT_MANIFEST_FILENAME
+    _, raw_sha1 = hash_file(raw_csv_path)
+    split_manifest = get_split_manifest(features, target, prep_cfg, raw_sha1, seed, manifest_path)
+    splits = split_manifest.materialize(features, target)
 
     transformer = fit_col_transformer(
         splits.train.features,
         prep_cfg.categorical_columns,
         prep_cfg.apply_standardization,
+        prep_cfg.categorical_encoding,
     )
+    train_features = splits.train.features
     splits = transform_cols(transformer, splits)
 
-    processed_dir = _get_processed_dir_path(project_name, data_cfg.orig_dataset_name)
-    splits.to_csv(processed_dir)
+    save_splits(splits, processed_dir, prep_cfg)
+    split_manifest.save(manifest_path)
+    save_categorical_vocab(get_categorical_vocab(transformer), processed_dir)
+    save_transformer(transformer, processed_dir)
+    save_reference_stats(processed_dir, train_features, splits.train.target, prep_cfg.categorical_columns)
+    if prep_cfg.incremental:
+        save_incremental_state(processed_dir, raw_csv_path, raw_sha1, len(features), prep_cfg, seed)
+    else:
+        remove_incremental_state(processed_dir)
 
     print(f'Dataset is preprocessed and saved to {processed_dir}')
     return processed_dir
 
 
+def _get_local_source_path(raw_csv_url: str) -> Optional[Path]:
+    """Path of the raw CSV if `raw_csv_url` is a `file://` URL or a local path, None if it must be downloaded."""
+    parsed_url = urlparse(raw_csv_url)
+    if parsed_url.scheme == 'file':
+        return Path(url2pathname(parsed_url.path))
+    # A single-letter scheme is a drive letter of a Windows path
+    if not parsed_url.scheme or len(parsed_url.scheme) == 1:
+        local_path = Path(raw_csv_url).expanduser()
+        return local_path if local_path.is_absolute() else PROJECT_ROOT / local_path
+    return None
+
+
 def download_csv(project_name: str, data_cfg: DataConfig, skip_if_exists: bool = False) -> Path:
-    """Download CSV dataset from direct URL
+    """Download CSV dataset from direct URL or copy it from a local path
 
     Args:
         project_name: Used to determine a path where file will be downloaded
         data_cfg: ProcessingConfig instance. Used fields:
-            cfg.raw_csv_url: Direct URL to the single .csv file that will be downloaded
+            cfg.raw_csv_url: Direct URL to the single .csv file that will be downloaded, or a `file://` URL or a local
+                path of the file that will be copied (e.g. generated by `src/data/synthetic.py`)
             cfg.orig_dataset_name: Used to determine a path where file will be downloaded
         skip_if_exists: If True, check if file is already downloaded to the determined path
 
@@ -78,7 +128,26 @@ def download_csv(project_name: str, data_cfg: DataConfig, skip_if_exists: bool =
             print(f'Raw `{data_cfg.orig_dataset_name}` dataset already exists and won\'t be downloaded.')
             return raw_csv_path
     print(f'Downloading raw `{data_cfg.orig_dataset_name}` dataset...')
-    raw_csv_path.parent.mkdir(parents=True, exist_ok=True)
-    urlretrieve(data_cfg.raw_csv_url, raw_csv_path)
+    fetch_csv(data_cfg.raw_csv_url, raw_csv_path)
     print(f'Raw `{data_cfg.orig_dataset_name}` dataset is downloaded to the `{raw_csv_path}` path...')
     return raw_csv_path
+
+
+def fetch_csv(raw_csv_url: str, path: Path) -> Path:
+    """Download CSV from a direct URL or copy it from a `file://` URL or a local path to `path`.
+
+    The file is written next to `path` and moved into place once complete, so an existing file at `path` is replaced,
+    not overwritten: readers and other links to it keep the old content, and a failed download leaves it intact.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(suffix='.tmp', prefix=f'.{path.name}.', dir=path.parent)
+    os.close(fd)
+    try:
+        if (local_source_path := _get_local_source_path(raw_csv_url)) is not None:
+            shutil.copyfile(local_source_path, tmp_name)
+        else:
+            urlretrieve(raw_csv_url, tmp_name)
+        os.replace(tmp_name, path)
+    finally:
+        Path(tmp_name).unlink(missing_ok=True)
+    return path
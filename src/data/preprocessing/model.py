@@ -2,7 +2,7 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import Union
 
-from src.data.data_model import TabularSplit
+from src.data.data_model import NumericDtype, StorageFormat, TabularSplit
 
 
 @dataclass(frozen=True)
@@ -11,7 +11,12 @@ class TabularSplitsCollection:
     val: TabularSplit
     test: TabularSplit
 
-    def to_csv(self, export_dir: Union[str, Path]) -> None:
-        self.train.to_csv(export_dir)
-        self.val.to_csv(export_dir)
-        self.test.to_csv(export_dir)
+    def save(
+        self,
+        export_dir: Union[str, Path],
+        append: bool = False,
+        storage_format: StorageFormat = 'compact',
+        numeric_dtype: NumericDtype = 'float32',
+    ) -> None:
+        for split in (self.train, self.val, self.test):
+            split.save(export_dir, append, storage_format, numeric_dtype)
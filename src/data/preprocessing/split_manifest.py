@@ -0,0 +1,130 @@
+import hashlib
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+
+from src.config import ProcessingConfig, SplitRatios
+from src.data.data_model import TabularSplit
+from src.data.preprocessing.model import TabularSplitsCollection
+
+SPLIT_MANIFEST_FILENAME = 'split_manifest.npz'
+SPLIT_NAMES = ('train', 'val', 'test')
+
+
+@dataclass(frozen=True)
+class SplitManifest:
+    """Split of a base table expressed as positional row indices of each split.
+
+    `fingerprint` identifies the raw data, row selection and split settings the manifest was computed for, so a saved
+    manifest can be safely reused instead of splitting again.
+    """
+
+    train: np.ndarray
+    val: np.ndarray
+    test: np.ndarray
+    fingerprint: str
+
+    def materialize(self, features: pd.DataFrame, target: pd.Series) -> TabularSplitsCollection:
+        """Gather rows of each split from the base table, nothing is copied before this call."""
+        return TabularSplitsCollection(
+            *(
+                TabularSplit(features.take(indices), target.take(indices), split)
+                for split, indices in zip(SPLIT_NAMES, (self.train, self.val, self.test))
+            ),
+        )
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as out_file:
+            np.savez(out_file, train=self.train, val=self.val, test=self.test, fingerprint=np.array(self.fingerprint))
+
+    @classmethod
+    def load(cls, path: Path) -> 'SplitManifest':
+        with np.load(path) as manifest:
+            return cls(manifest['train'], manifest['val'], manifest['test'], str(manifest['fingerprint']))
+
+
+def get_split_manifest(
+    features: pd.DataFrame,
+    target: pd.Series,
+    prep_cfg: ProcessingConfig,
+    raw_sha1: str,
+    seed: Optional[int] = None,
+    manifest_path: Optional[Path] = None,
+) -> SplitManifest:
+    """Load the manifest from `manifest_path` if it was computed for the same data and settings, split otherwise.
+
+    `features` and `target` are the base table read from the raw CSV whose SHA-1 is `raw_sha1`. A stratified split is
+    random, so it's reused only if `seed` is set.
+    """
+    fingerprint = get_manifest_fingerprint(raw_sha1, prep_cfg, seed)
+    reusable = prep_cfg.split_mode == 'hash' or seed is not None
+    if reusable and manifest_path is not None and manifest_path.is_file():
+        manifest = SplitManifest.load(manifest_path)
+        if manifest.fingerprint == fingerprint:
+            print(f'Split manifest `{manifest_path}` matches the data and split settings, splitting is skipped.')
+            return manifest
+
+    if prep_cfg.split_mode == 'hash':
+        keys = features[list(prep_cfg.split_key_columns)] if prep_cfg.split_key_columns else features
+        split_ids = assign_hash_splits(keys, prep_cfg.split_ratios)
+        indices = tuple(_to_index_array(np.flatnonzero(split_ids == split_id)) for split_id in range(len(SPLIT_NAMES)))
+    else:
+        indices = _stratified_split(target, prep_cfg.split_ratios)
+    return SplitManifest(*indices, fingerprint=fingerprint)
+
+
+def _stratified_split(target: pd.Series, split_ratios: SplitRatios) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Same random draws as splitting features and target themselves, so splits are the same for the same seed
+    positions = np.arange(len(target))
+    target_np = target.to_numpy()
+    train_idx, val_test_idx = train_test_split(
+        positions,
+        stratify=target_np,
+        test_size=(1 - split_ratios.train),
+    )
+
+    relative_test_ratio = split_ratios.test / (split_ratios.val + split_ratios.test)
+    val_idx, test_idx = train_test_split(
+        val_test_idx,
+        stratify=target_np[val_test_idx],
+        test_size=relative_test_ratio,
+    )
+    return _to_index_array(train_idx), _to_index_array(val_idx), _to_index_array(test_idx)
+
+
+def assign_hash_splits(keys: pd.DataFrame, split_ratios: SplitRatios) -> np.ndarray:
+    """Assign rows to splits by hashing their keys: 0 is train, 1 is val and 2 is test.
+
+    Split of a row depends only on its key, so it can be computed chunk by chunk and is stable as data grows.
+    """
+    # Numeric columns are hashed as float64, so a row is hashed the same way no matter if pandas inferred int or float
+    # dtype for a column in a particular file or chunk (e.g. because of missing values)
+    numeric_cols = [col for col, dtype in keys.dtypes.items() if dtype.kind in 'iubf']
+    hashes = pd.util.hash_pandas_object(keys.astype({col: np.float64 for col in numeric_cols}), index=False)
+    # 53 high bits of the hash as a uniform number in [0, 1)
+    uniform = (hashes.to_numpy() >> np.uint64(11)).astype(np.float64) * 2.0**-53
+    boundaries = np.cumsum(split_ratios)[:-1]
+    return np.searchsorted(boundaries, uniform, side='right').astype(np.int8)
+
+
+def _to_index_array(indices: np.ndarray) -> np.ndarray:
+    dtype = np.int32 if len(indices) == 0 or indices.max() < np.iinfo(np.int32).max else np.int64
+    return indices.astype(dtype, copy=False)
+
+
+def get_manifest_fingerprint(raw_sha1: str, prep_cfg: ProcessingConfig, seed: Optional[int]) -> str:
+    # The base table is determined by the raw file and the settings that select its rows, it isn't hashed itself
+    digest = hashlib.sha1(raw_sha1.encode())
+    row_settings = (prep_cfg.target_column, prep_cfg.positive_columns, prep_cfg.model_dump(mode='json')['row_filters'])
+    digest.update(json.dumps(row_settings, sort_keys=True).encode())
+    split_settings = (prep_cfg.split_mode, tuple(prep_cfg.split_ratios), prep_cfg.split_key_columns)
+    # Stratified split is random, so it's reproducible only for the same seed
+    split_settings += (seed,) if prep_cfg.split_mode == 'stratified' else ()
+    digest.update(repr(split_settings).encode())
+    return digest.hexdigest()
@@ -1,57 +1,76 @@
+import hashlib
 from functools import partial
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, Literal, Optional, Tuple
 
+import joblib
 import numpy as np
 import pandas as pd
 from sklearn.compose import ColumnTransformer
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import FunctionTransformer, OneHotEncoder, OrdinalEncoder, StandardScaler
 
-from src.config import SplitRatios
-from src.data.data_model import TabularSplit
+from src.config import ProcessingConfig
+from src.data.data_model import UNKNOWN_CATEGORY_CODE, CategoricalVocab, TabularSplit
+from src.data.preprocessing.filters import RowFilter
 from src.data.preprocessing.model import TabularSplitsCollection
 
+HASH_BLOCK_SIZE = 2**20
+
+
+def hash_file(path: Path, prefix_bytes: Optional[int] = None) -> Tuple[Optional[str], str]:
+    """SHA-1 of the first `prefix_bytes` of the file (None if it's shorter) and of the whole file in a single read."""
+    digest = hashlib.sha1()
+    prefix_sha1 = None
+    read_bytes = 0
+    with open(path, 'rb') as in_file:
+        while True:
+            block_size = HASH_BLOCK_SIZE
+            if prefix_bytes is not None and read_bytes < prefix_bytes:
+                block_size = min(block_size, prefix_bytes - read_bytes)
+            block = in_file.read(block_size)
+            if not block:
+                break
+            digest.update(block)
+            read_bytes += len(block)
+            if read_bytes == prefix_bytes:
+                prefix_sha1 = digest.hexdigest()
+    return prefix_sha1, digest.hexdigest()
+
+
+def read_data(
+    csv_abs_path: Path,
+    target_col: str,
+    row_filter: Optional[RowFilter] = None,
+    chunk_size: Optional[int] = None,
+) -> Tuple[pd.DataFrame, pd.Series]:
+    """Read CSV and filter its rows in a single pass, chunk-wise if `chunk_size` is passed."""
+    if chunk_size is None:
+        data = pd.read_csv(csv_abs_path)
+        data = row_filter.filter(data) if row_filter is not None else data
+    else:
+        # Only filtered rows of each chunk are kept in memory
+        data = pd.concat(
+            [
+                row_filter.filter(chunk) if row_filter is not None else chunk
+                for chunk in pd.read_csv(csv_abs_path, chunksize=chunk_size)
+            ],
+        )
 
-def read_data(csv_abs_path: Path, target_col: str) -> Tuple[pd.DataFrame, pd.Series]:
-    data = pd.read_csv(csv_abs_path)
     features = data.drop([target_col], axis=1)
     target = data[target_col]
     return features, target
 
 
-def split_data(
-    features: pd.DataFrame,
-    target: pd.Series,
-    split_ratios: SplitRatios,
-) -> TabularSplitsCollection:
-    x_train, x_val_test, y_train, y_val_test = train_test_split(
-        features,
-        target,
-        stratify=target,
-        test_size=(1 - split_ratios.train),
-    )
-
-    relative_test_ratio = split_ratios.test / (split_ratios.val + split_ratios.test)
-    x_val, x_test, y_val, y_test = train_test_split(
-        x_val_test,
-        y_val_test,
-        stratify=y_val_test,
-        test_size=relative_test_ratio,
-    )
-
-    train_split = TabularSplit(x_train, y_train, 'train')
-    val_split = TabularSplit(x_val, y_val, 'val')
-    test_split = TabularSplit(x_test, y_test, 'test')
-
-    return TabularSplitsCollection(train_split, val_split, test_split)
-
-
 def fit_col_transformer(
     features: pd.DataFrame,
     categorical_cols: Optional[Tuple[str, ...]] = None,
     apply_standardization: bool = False,
+    categorical_encoding: Literal['one_hot', 'embedding'] = 'one_hot',
 ) -> ColumnTransformer:
+    if categorical_encoding == 'embedding':
+        return _fit_code_col_transformer(features, categorical_cols, apply_standardization)
+
     transformers = []
 
     if categorical_cols:
@@ -70,32 +89,94 @@ def fit_col_transformer(
     return transformer
 
 
-def filter_positive_cols(
+CAT_CODES_TRANSFORMER = 'cat_codes'
+
+
+def _shift_codes(codes: np.ndarray) -> np.ndarray:
+    # Unknown and missing categories are encoded as -1 and end up with the reserved code
+    return codes + (UNKNOWN_CATEGORY_CODE + 1)
+
+
+def _fit_code_col_transformer(
     features: pd.DataFrame,
-    target: pd.Series,
-    positive_cols: Optional[Tuple[str, ...]] = None,
-) -> Tuple[pd.DataFrame, pd.Series]:
-    if not positive_cols:
-        return features, target
-    masks = []
-    for col in positive_cols:
-        mask = features[col] > 0
-        masks.append(mask)
-    positives_bool = np.prod(np.vstack(masks), axis=0).astype(bool)
-    return features[positives_bool], target[positives_bool]
+    categorical_cols: Optional[Tuple[str, ...]] = None,
+    apply_standardization: bool = False,
+) -> ColumnTransformer:
+    categorical_cols = categorical_cols or ()
+    numeric_cols = tuple([col for col in features.columns if col not in categorical_cols])
+
+    # Numeric columns go first and code columns go last, that's the layout expected by the embedding MLP
+    transformers = []
+    if numeric_cols:
+        transformers.append(('num', StandardScaler() if apply_standardization else 'passthrough', numeric_cols))
+    if categorical_cols:
+        encoder = OrdinalEncoder(
+            handle_unknown='use_encoded_value',
+            unknown_value=-1,
+            encoded_missing_value=-1,
+            dtype=np.int64,
+        )
+        shift = FunctionTransformer(_shift_codes, feature_names_out='one-to-one')
+        transformers.append((CAT_CODES_TRANSFORMER, make_pipeline(encoder, shift), categorical_cols))
+
+    transformer = ColumnTransformer(transformers=transformers, remainder='drop', verbose_feature_names_out=False)
+    transformer.fit(features)
+
+    return transformer
 
 
-def _np_to_df(features_np: np.ndarray, col_names: np.ndarray) -> pd.DataFrame:
-    return pd.DataFrame(features_np, columns=col_names)
+def get_categorical_vocab(transformer: ColumnTransformer) -> Optional[CategoricalVocab]:
+    """Vocabulary of code columns if categorical columns are encoded as integer codes, None otherwise."""
+    if CAT_CODES_TRANSFORMER not in transformer.named_transformers_:
+        return None
+    encoder = transformer.named_transformers_[CAT_CODES_TRANSFORMER][0]
+    return {
+        str(col): categories.tolist() for col, categories in zip(encoder.feature_names_in_, encoder.categories_)
+    }
 
 
-def transform_cols(transformer: ColumnTransformer, splits: TabularSplitsCollection) -> TabularSplitsCollection:
-    train_features_np = transformer.transform(splits.train.features)
-    val_features_np = transformer.transform(splits.val.features)
-    test_features_np = transformer.transform(splits.test.features)
+def get_feature_groups(transformer: ColumnTransformer) -> Dict[str, Tuple[str, ...]]:
+    """Names of transformed features grouped by the original column they are produced from.
+
+    A one-hot encoded column produces a group of features, one per category, any other column produces one feature.
+    """
+    feature_names = iter(transformer.get_feature_names_out())
+    groups = {}
+    for name, fitted, cols in transformer.transformers_:
+        if fitted == 'drop':
+            continue
+        if name == 'remainder' and len(cols) and not isinstance(cols[0], str):
+            cols = transformer.feature_names_in_[cols]
+        widths = [len(categories) for categories in fitted.categories_] if isinstance(fitted, OneHotEncoder) else None
+        for idx, col in enumerate(cols):
+            width = widths[idx] if widths else 1
+            groups[str(col)] = tuple(str(next(feature_names)) for _ in range(width))
+    return groups
+
+
+def _np_to_df(features_np: np.ndarray, col_names: np.ndarray, code_cols: Tuple[str, ...] = ()) -> pd.DataFrame:
+    features = pd.DataFrame(features_np, columns=col_names)
+    if code_cols:
+        # Mixed numeric and code columns are transformed into one float array, codes are stored as compact integers
+        features = features.astype({col: np.int32 for col in code_cols})
+    return features
+
+
+def _transform(transformer: ColumnTransformer, features: pd.DataFrame, col_names: np.ndarray) -> np.ndarray:
+    if len(features) == 0:
+        # Splits of incrementally appended rows may be empty, sklearn transformers refuse to transform empty arrays
+        return np.empty((0, len(col_names)))
+    return transformer.transform(features)  # type: ignore[no-any-return]
+
 
+def transform_cols(transformer: ColumnTransformer, splits: TabularSplitsCollection) -> TabularSplitsCollection:
     col_names = transformer.get_feature_names_out()
-    np_to_df = partial(_np_to_df, col_names=col_names)
+    train_features_np = _transform(transformer, splits.train.features, col_names)
+    val_features_np = _transform(transformer, splits.val.features, col_names)
+    test_features_np = _transform(transformer, splits.test.features, col_names)
+
+    vocab = get_categorical_vocab(transformer)
+    np_to_df = partial(_np_to_df, col_names=col_names, code_cols=tuple(vocab or ()))
 
     train_features = np_to_df(train_features_np)
     val_features = np_to_df(val_features_np)
@@ -106,3 +187,28 @@ def transform_cols(transformer: ColumnTransformer, splits: TabularSplitsCollecti
         val=TabularSplit(val_features, splits.val.target, 'val'),
         test=TabularSplit(test_features, splits.test.target, 'test'),
     )
+
+
+def save_splits(
+    splits: TabularSplitsCollection,
+    processed_dir: Path,
+    prep_cfg: ProcessingConfig,
+    append: bool = False,
+) -> None:
+    # Only standardized values are small enough to keep their precision in float16
+    use_float16 = prep_cfg.float16_numerics and prep_cfg.apply_standardization
+    splits.save(processed_dir, append, prep_cfg.storage_format, 'float16' if use_float16 else 'float32')
+
+
+TRANSFORMER_FILENAME = 'transformer.joblib'
+
+
+def save_transformer(transformer: ColumnTransformer, processed_dir: Path) -> None:
+    joblib.dump(transformer, processed_dir / TRANSFORMER_FILENAME)
+
+
+def load_transformer(processed_dir: Path) -> Optional[ColumnTransformer]:
+    transformer_path = processed_dir / TRANSFORMER_FILENAME
+    if not transformer_path.is_file():
+        return None
+    return joblib.load(transformer_path)  # type: ignore[no-any-return]
@@ -0,0 +1,382 @@
+"""Single-pass, bounded-memory column statistics of tabular data and drift scores between two sets of statistics.
+
+Reference statistics of the train split are saved next to the processed splits by `preprocess_data`, any incoming CSV
+can be compared against them with:
+
+    python src/data/stats.py <incoming_csv> [<incoming_csv> ...]
+"""
+import argparse
+import json
+from collections import Counter
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from src.config import get_experiment_cfg
+from src.data.preprocessing.path_helpers import _get_processed_dir_path
+
+REFERENCE_STATS_FILENAME = 'reference_stats.json'
+OTHER_CATEGORY = '__other__'
+DEFAULT_CHUNK_SIZE = 100_000
+DEFAULT_PSI_THRESHOLD = 0.2
+DEFAULT_KS_THRESHOLD = 0.1
+_PSI_EPS = 1e-4
+_PSI_BIN_QUANTILES = np.linspace(0.1, 0.9, 9)
+
+
+class QuantileSketch:
+    """KLL-style quantile sketch: a stack of compactors with `capacity` items each.
+
+    When a level overflows, its items are sorted and every other one (with a random offset) is promoted to the next
+    level with doubled weight, so memory is O(capacity * log(n / capacity)) and rank error is O(1 / capacity).
+    """
+
+    def __init__(self, capacity: int = 1024, seed: int = 0):
+        self.capacity = capacity
+        self.levels: List[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def count(self) -> int:
+        return sum(len(items) << level for level, items in enumerate(self.levels))
+
+    def update(self, values: np.ndarray) -> None:
+        self.levels[0] = np.concatenate([self.levels[0], values.astype(np.float64)])
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) > self.capacity:
+                self._compact(level)
+            level += 1
+
+    def _compact(self, level: int) -> None:
+        if level + 1 == len(self.levels):
+            self.levels.append(np.empty(0))
+        items = np.sort(self.levels[level])
+        num_kept = len(items) % 2  # an odd item stays at its level, so the total weight is preserved exactly
+        offset = num_kept + int(self._rng.integers(2))
+        self.levels[level] = items[:num_kept]
+        self.levels[level + 1] = np.concatenate([self.levels[level + 1], items[offset::2]])
+
+    def _weighted_items(self) -> Tuple[np.ndarray, np.ndarray]:
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level_items), 2**level) for level, level_items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        return items[order], np.cumsum(weights[order])
+
+    def cdf(self, values: np.ndarray) -> np.ndarray:
+        """Approximate fraction of values that are less than or equal to each of `values`."""
+        items, cum_weights = self._weighted_items()
+        if len(items) == 0:
+            return np.full(len(values), np.nan)
+        ranks = np.searchsorted(items, values, side='right')
+        return np.where(ranks > 0, cum_weights[np.maximum(ranks - 1, 0)], 0) / cum_weights[-1]
+
+    def quantiles(self, qs: np.ndarray) -> np.ndarray:
+        items, cum_weights = self._weighted_items()
+        if len(items) == 0:
+            return np.full(len(qs), np.nan)
+        idx = np.searchsorted(cum_weights, qs * cum_weights[-1], side='left')
+        return items[np.minimum(idx, len(items) - 1)]
+
+    def items(self) -> np.ndarray:
+        return np.concatenate(self.levels)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'capacity': self.capacity, 'levels': [items.tolist() for items in self.levels]}
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'QuantileSketch':
+        sketch = cls(state['capacity'])
+        sketch.levels = [np.asarray(items, dtype=np.float64) for items in state['levels']]
+        return sketch
+
+
+class NumericStats:
+    """Count, null rate, mean/variance (chunk-wise Welford updates), range and a quantile sketch of a column."""
+
+    kind = 'numeric'
+
+    def __init__(self, sketch_capacity: int = 1024):
+        self.count = 0
+        self.null_count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared deviations from the mean
+        self.min = np.inf
+        self.max = -np.inf
+        self.sketch = QuantileSketch(sketch_capacity)
+
+    def update(self, column: pd.Series) -> None:
+        values = pd.to_numeric(column, errors='coerce').to_numpy(dtype=np.float64)
+        not_null = ~np.isnan(values)
+        values = values[not_null]
+        self.null_count += len(not_null) - len(values)
+        if len(values) == 0:
+            return
+
+        # Chan et al. combination of the running moments with the moments of the chunk
+        chunk_count, chunk_mean = len(values), float(values.mean())
+        chunk_m2 = float(((values - chunk_mean) ** 2).sum())
+        total = self.count + chunk_count
+        delta = chunk_mean - self.mean
+        self.mean += delta * chunk_count / total
+        self.m2 += chunk_m2 + delta**2 * self.count * chunk_count / total
+        self.count = total
+
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.sketch.update(values)
+
+    @property
+    def null_rate(self) -> float:
+        total = self.count + self.null_count
+        return self.null_count / total if total else 0.0
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.m2 / self.count)) if self.count else float('nan')
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'kind': self.kind,
+            'count': self.count,
+            'null_count': self.null_count,
+            'mean': self.mean,
+            'm2': self.m2,
+            'min': self.min,
+            'max': self.max,
+            'sketch': self.sketch.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'NumericStats':
+        stats = cls()
+        for attr in ('count', 'null_count', 'mean', 'm2', 'min', 'max'):
+            setattr(stats, attr, state[attr])
+        stats.sketch = QuantileSketch.from_dict(state['sketch'])
+        return stats
+
+
+class CategoricalStats:
+    """Null rate and category counts of a column, categories beyond `max_categories` are counted together."""
+
+    kind = 'categorical'
+
+    def __init__(self, max_categories: int = 1000):
+        self.max_categories = max_categories
+        self.null_count = 0
+        self.counts: Counter[str] = Counter()
+
+    def update(self, column: pd.Series) -> None:
+        self.null_count += int(column.isna().sum())
+        for category, count in column.dropna().astype(str).value_counts().items():
+            if category not in self.counts and len(self.counts) >= self.max_categories:
+                category = OTHER_CATEGORY
+            self.counts[category] += int(count)
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts.values())
+
+    @property
+    def null_rate(self) -> float:
+        total = self.count + self.null_count
+        return self.null_count / total if total else 0.0
+
+    def frequencies(self) -> Dict[str, float]:
+        count = self.count
+        return {category: cat_count / count for category, cat_count in self.counts.items()} if count else {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'kind': self.kind,
+            'max_categories': self.max_categories,
+            'null_count': self.null_count,
+            'counts': dict(self.counts),
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'CategoricalStats':
+        stats = cls(state['max_categories'])
+        stats.null_count = state['null_count']
+        stats.counts = Counter(state['counts'])
+        return stats
+
+
+ColumnStats = Union[NumericStats, CategoricalStats]
+
+
+class DatasetStats:
+    """Statistics of all columns of a table, updated chunk by chunk in a single pass."""
+
+    def __init__(self, categorical_cols: Sequence[str] = ()):
+        self.categorical_cols = tuple(categorical_cols)
+        self.num_rows = 0
+        self.columns: Dict[str, ColumnStats] = {}
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        self.num_rows += len(chunk)
+        for col in chunk.columns:
+            if col not in self.columns:
+                self.columns[col] = CategoricalStats() if col in self.categorical_cols else NumericStats()
+            self.columns[col].update(chunk[col])
+
+    def save(self, path: Path) -> None:
+        state = {
+            'categorical_cols': self.categorical_cols,
+            'num_rows': self.num_rows,
+            'columns': {col: stats.to_dict() for col, stats in self.columns.items()},
+        }
+        with open(path, 'w') as out_file:
+            json.dump(state, out_file)
+
+    @classmethod
+    def load(cls, path: Path) -> 'DatasetStats':
+        with open(path) as in_file:
+            state = json.load(in_file)
+        stats = cls(state['categorical_cols'])
+        stats.num_rows = state['num_rows']
+        stats.columns = {
+            col: CategoricalStats.from_dict(col_state)
+            if col_state['kind'] == CategoricalStats.kind
+            else NumericStats.from_dict(col_state)
+            for col, col_state in state['columns'].items()
+        }
+        return stats
+
+
+def compute_stats(chunks: Iterable[pd.DataFrame], categorical_cols: Sequence[str] = ()) -> DatasetStats:
+    stats = DatasetStats(categorical_cols)
+    for chunk in chunks:
+        stats.update(chunk)
+    return stats
+
+
+def compute_csv_stats(
+    csv_path: Union[Path, str],
+    categorical_cols: Sequence[str] = (),
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> DatasetStats:
+    """Statistics of a CSV file of any size, read chunk-wise in a single pass."""
+    # Categorical columns are read as strings, so that their categories match the ones of the reference
+    dtypes = {col: str for col in categorical_cols}
+    return compute_stats(pd.read_csv(csv_path, chunksize=chunk_size, dtype=dtypes), categorical_cols)
+
+
+def save_reference_stats(
+    processed_dir: Path,
+    features: pd.DataFrame,
+    target: pd.Series,
+    categorical_cols: Optional[Tuple[str, ...]],
+) -> None:
+    """Save statistics of raw (not transformed) train split, that data arriving later is compared against."""
+    categorical_cols = (*(categorical_cols or ()), str(target.name))
+    stats = compute_stats([pd.concat([features, target], axis=1)], categorical_cols)
+    stats.save(processed_dir / REFERENCE_STATS_FILENAME)
+
+
+@dataclass(frozen=True)
+class DriftScore:
+    column: str
+    psi: float  # population stability index
+    ks: Optional[float]  # Kolmogorov-Smirnov statistic, only for numeric columns
+    null_rate_delta: float
+    drifted: bool
+
+
+def _psi(expected: np.ndarray, actual: np.ndarray) -> float:
+    expected = np.clip(expected, _PSI_EPS, None)
+    actual = np.clip(actual, _PSI_EPS, None)
+    return float(((actual - expected) * np.log(actual / expected)).sum())
+
+
+def _numeric_drift(reference: NumericStats, current: NumericStats) -> Tuple[float, float]:
+    # PSI over reference deciles, proportions of both sides are read from the sketches
+    edges = np.unique(reference.sketch.quantiles(_PSI_BIN_QUANTILES))
+    ref_cdf = np.concatenate([[0], reference.sketch.cdf(edges), [1]])
+    cur_cdf = np.concatenate([[0], current.sketch.cdf(edges), [1]])
+    psi = _psi(np.diff(ref_cdf), np.diff(cur_cdf))
+
+    grid = np.unique(np.concatenate([reference.sketch.items(), current.sketch.items()]))
+    ks = float(np.abs(reference.sketch.cdf(grid) - current.sketch.cdf(grid)).max())
+    return psi, ks
+
+
+def _categorical_drift(reference: CategoricalStats, current: CategoricalStats) -> float:
+    ref_freqs, cur_freqs = reference.frequencies(), current.frequencies()
+    categories = sorted(set(ref_freqs) | set(cur_freqs))
+    expected = np.array([ref_freqs.get(category, 0) for category in categories])
+    actual = np.array([cur_freqs.get(category, 0) for category in categories])
+    return _psi(expected, actual)
+
+
+def compute_drift(
+    reference: DatasetStats,
+    current: DatasetStats,
+    psi_threshold: float = DEFAULT_PSI_THRESHOLD,
+    ks_threshold: float = DEFAULT_KS_THRESHOLD,
+) -> List[DriftScore]:
+    """Drift scores of every reference column, a column that is missing in current data is always drifted."""
+    scores = []
+    for col, ref_stats in reference.columns.items():
+        cur_stats = current.columns.get(col)
+        if cur_stats is None or cur_stats.count == 0:
+            scores.append(DriftScore(col, float('inf'), None, 1 - ref_stats.null_rate, drifted=True))
+            continue
+
+        ks: Optional[float] = None
+        if isinstance(ref_stats, NumericStats) and isinstance(cur_stats, NumericStats):
+            psi, ks = _numeric_drift(ref_stats, cur_stats)
+        elif isinstance(ref_stats, CategoricalStats) and isinstance(cur_stats, CategoricalStats):
+            psi = _categorical_drift(ref_stats, cur_stats)
+        else:
+            raise TypeError(f'Statistics of `{col}` column are of different kinds')
+        drifted = psi > psi_threshold or (ks is not None and ks > ks_threshold)
+        scores.append(DriftScore(col, psi, ks, cur_stats.null_rate - ref_stats.null_rate, drifted))
+    return scores
+
+
+def _print_drift(scores: Sequence[DriftScore]) -> None:
+    print(f'{"column":<30} {"PSI":>8} {"KS":>8} {"Δnull":>8} {"drifted":>8}')
+    for score in scores:
+        ks = f'{score.ks:>8.4f}' if score.ks is not None else f'{"-":>8}'
+        print(f'{score.column:<30} {score.psi:>8.4f} {ks} {score.null_rate_delta:>+8.4f} {str(score.drifted):>8}')
+
+
+def check_drift(
+    csv_paths: Sequence[Path],
+    reference_path: Path,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    psi_threshold: float = DEFAULT_PSI_THRESHOLD,
+    ks_threshold: float = DEFAULT_KS_THRESHOLD,
+) -> Dict[str, List[DriftScore]]:
+    reference = DatasetStats.load(reference_path)
+    report = {}
+    for csv_path in csv_paths:
+        current = compute_csv_stats(csv_path, reference.categorical_cols, chunk_size)
+        report[str(csv_path)] = compute_drift(reference, current, psi_threshold, ks_threshold)
+        print(f'Drift of `{csv_path}` ({current.num_rows} rows) against `{reference_path}`:')
+        _print_drift(report[str(csv_path)])
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Drift of incoming CSV files against reference train split statistics')
+    parser.add_argument('csv_paths', type=Path, nargs='+')
+    parser.add_argument('--reference', type=Path, help='Reference statistics, of the configured dataset by default')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--psi-threshold', type=float, default=DEFAULT_PSI_THRESHOLD)
+    parser.add_argument('--ks-threshold', type=float, default=DEFAULT_KS_THRESHOLD)
+    parser.add_argument('--output', type=Path, help='JSON file to save drift scores to')
+    args = parser.parse_args()
+
+    if args.reference is None:
+        cfg = get_experiment_cfg()
+        args.reference = _get_processed_dir_path(cfg.project_name, cfg.data_config.orig_dataset_name)
+        args.reference /= REFERENCE_STATS_FILENAME
+    drift_report = check_drift(args.csv_paths, args.reference, args.chunk_size, args.psi_threshold, args.ks_threshold)
+    if args.output is not None:
+        with open(args.output, 'w') as out_file:
+            json.dump({path: [asdict(score) for score in scores] for path, scores in drift_report.items()}, out_file)
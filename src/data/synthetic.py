@@ -0,0 +1,232 @@
+"""Synthetic raw data generator for scale testing of preprocessing and training without network access.
+
+The schema (column types, target class balance and class-conditional distributions of columns) is read from a JSON file
+or inferred from an existing raw CSV and processing config. Rows are generated in parallel chunks, every chunk is
+seeded by the seed and its index, so the output is the same for any number of workers. The generated CSV can be used as
+`raw_csv_url` (a local path or a `file://` URL) to run the whole training pipeline offline.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from src.config import ProcessingConfig, get_experiment_cfg
+from src.constants import PROJECT_ROOT
+
+DEFAULT_SCHEMA_PATH = PROJECT_ROOT / 'configs' / 'heart_synthetic_schema.json'
+DEFAULT_CHUNK_ROWS = 500_000
+
+
+@dataclass(frozen=True)
+class NumericColumnSchema:
+    name: str
+    is_integer: bool
+    min_value: float
+    max_value: float
+    mean_by_class: Dict[str, float]
+    std_by_class: Dict[str, float]
+
+
+@dataclass(frozen=True)
+class CategoricalColumnSchema:
+    name: str
+    frequencies_by_class: Dict[str, Dict[str, float]]
+
+
+@dataclass(frozen=True)
+class SyntheticSchema:
+    target_column: str
+    class_balance: Dict[str, float]
+    column_order: List[str]
+    numeric_columns: List[NumericColumnSchema]
+    categorical_columns: List[CategoricalColumnSchema]
+
+    def save(self, path: Path) -> None:
+        with open(path, 'w') as out_file:
+            json.dump(asdict(self), out_file, indent=2)
+
+    @classmethod
+    def load(cls, path: Path) -> 'SyntheticSchema':
+        with open(path) as in_file:
+            schema = json.load(in_file)
+        return cls(
+            target_column=schema['target_column'],
+            class_balance=schema['class_balance'],
+            column_order=schema['column_order'],
+            numeric_columns=[NumericColumnSchema(**col) for col in schema['numeric_columns']],
+            categorical_columns=[CategoricalColumnSchema(**col) for col in schema['categorical_columns']],
+        )
+
+
+def infer_schema(csv_path: Union[Path, str], prep_cfg: ProcessingConfig, max_rows: int = 1_000_000) -> SyntheticSchema:
+    """Infer the schema from the first `max_rows` of raw CSV.
+
+    Columns from `categorical_columns` are categorical and all other ones are numeric. Distributions of columns are
+    conditioned on the target class, values of `positive_columns` are learned and generated only from positive values.
+    """
+    data = pd.read_csv(csv_path, nrows=max_rows)
+    target_col = prep_cfg.target_column
+    categorical_cols = prep_cfg.categorical_columns or ()
+    positive_cols = prep_cfg.positive_columns or ()
+    target = data[target_col].astype(str)
+    classes = sorted(target.unique())
+
+    numeric_columns, categorical_columns = [], []
+    for col in data.columns:
+        if col == target_col:
+            continue
+        if col in categorical_cols:
+            frequencies = {
+                cls: data.loc[target == cls, col].dropna().astype(str).value_counts(normalize=True).to_dict()
+                for cls in classes
+            }
+            categorical_columns.append(CategoricalColumnSchema(col, frequencies))
+            continue
+
+        values = data[col]
+        valid = values.notna() & (values > 0) if col in positive_cols else values.notna()
+        by_class = values[valid].groupby(target[valid])
+        numeric_columns.append(
+            NumericColumnSchema(
+                name=col,
+                is_integer=pd.api.types.is_integer_dtype(values),
+                min_value=float(values[valid].min()),
+                max_value=float(values[valid].max()),
+                mean_by_class={str(cls): float(mean) for cls, mean in by_class.mean().items()},
+                std_by_class={str(cls): float(std) for cls, std in by_class.std(ddof=0).fillna(0).items()},
+            ),
+        )
+
+    return SyntheticSchema(
+        target_column=target_col,
+        class_balance=target.value_counts(normalize=True).to_dict(),
+        column_order=list(data.columns),
+        numeric_columns=numeric_columns,
+        categorical_columns=categorical_columns,
+    )
+
+
+def generate_chunk(schema: SyntheticSchema, num_rows: int, seed: int, chunk_idx: int) -> pd.DataFrame:
+    rng = np.random.default_rng([seed, chunk_idx])
+    classes = list(schema.class_balance)
+    class_probs = np.array([schema.class_balance[cls] for cls in classes])
+    class_idx = rng.choice(len(classes), size=num_rows, p=class_probs / class_probs.sum())
+
+    labels = np.array(classes)
+    if all(cls.lstrip('-').isdigit() for cls in classes):
+        labels = labels.astype(np.int64)
+    columns: Dict[str, np.ndarray] = {schema.target_column: labels[class_idx]}
+    for num_col in schema.numeric_columns:
+        means = np.array([num_col.mean_by_class[cls] for cls in classes])[class_idx]
+        stds = np.array([num_col.std_by_class[cls] for cls in classes])[class_idx]
+        values = np.clip(rng.normal(means, stds), num_col.min_value, num_col.max_value)
+        columns[num_col.name] = np.rint(values).astype(np.int64) if num_col.is_integer else values.round(4)
+
+    for cat_col in schema.categorical_columns:
+        values = np.empty(num_rows, dtype=object)
+        for cls_idx, cls in enumerate(classes):
+            mask = class_idx == cls_idx
+            frequencies = cat_col.frequencies_by_class[cls]
+            probs = np.array(list(frequencies.values()))
+            values[mask] = rng.choice(list(frequencies), size=int(mask.sum()), p=probs / probs.sum())
+        columns[cat_col.name] = values
+
+    return pd.DataFrame({col: columns[col] for col in schema.column_order})
+
+
+def _write_chunk(schema: SyntheticSchema, num_rows: int, seed: int, chunk_idx: int, part_path: Path) -> Path:
+    generate_chunk(schema, num_rows, seed, chunk_idx).to_csv(part_path, index=False, header=chunk_idx == 0)
+    return part_path
+
+
+def _get_chunk_sizes(num_rows: int, chunk_rows: int) -> List[int]:
+    num_full, rest = divmod(num_rows, chunk_rows)
+    return [chunk_rows] * num_full + ([rest] if rest else [])
+
+
+def generate_data(
+    schema: SyntheticSchema,
+    num_rows: int,
+    output_path: Path,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    num_workers: Optional[int] = None,
+    seed: int = 42,
+) -> Path:
+    """Generate `num_rows` rows to a CSV file in parallel chunks.
+
+    Args:
+        schema: Schema of the generated data
+        num_rows: Number of rows to generate
+        output_path: Path of the generated CSV file
+        chunk_rows: Number of rows generated by a worker at once
+        num_workers: Number of worker processes, number of CPUs by default
+        seed: Random seed, the output depends only on it and `chunk_rows`
+    """
+    chunk_sizes = _get_chunk_sizes(num_rows, chunk_rows)
+    num_workers = num_workers or os.cpu_count() or 1
+    start = time.perf_counter()
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    parts_dir = Path(tempfile.mkdtemp(dir=output_path.parent))
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [
+            executor.submit(
+                _write_chunk,
+                schema,
+                size,
+                seed,
+                chunk_idx,
+                parts_dir / f'part-{chunk_idx:05d}.csv',
+            )
+            for chunk_idx, size in enumerate(chunk_sizes)
+        ]
+        part_paths = [future.result() for future in futures]
+
+    # Parts are written in parallel and concatenated sequentially, only the first one has the header
+    with open(output_path, 'wb') as out_file:
+        for part_path in part_paths:
+            with open(part_path, 'rb') as part_file:
+                shutil.copyfileobj(part_file, out_file, length=2**24)
+    shutil.rmtree(parts_dir)
+    if not part_paths:
+        pd.DataFrame(columns=schema.column_order).to_csv(output_path, index=False)
+
+    elapsed = time.perf_counter() - start
+    print(f'{num_rows} rows are generated to `{output_path}` in {elapsed:.1f}s ({num_rows / elapsed:.0f} rows/s)')
+    return output_path
+
+
+def _get_schema(schema_path: Optional[Path], from_csv: Optional[Path]) -> Tuple[SyntheticSchema, str]:
+    if from_csv is not None:
+        return infer_schema(from_csv, get_experiment_cfg().data_config.processing_config), f'inferred from {from_csv}'
+    schema_path = schema_path or DEFAULT_SCHEMA_PATH
+    return SyntheticSchema.load(schema_path), f'read from {schema_path}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate synthetic raw data in parallel chunks')
+    parser.add_argument('--rows', type=int, required=True)
+    parser.add_argument('--output', type=Path, required=True, help='Path of the generated CSV file')
+    parser.add_argument('--schema', type=Path, help=f'Schema JSON, `{DEFAULT_SCHEMA_PATH.name}` by default')
+    parser.add_argument('--from-csv', type=Path, help='Infer the schema from this raw CSV using processing config')
+    parser.add_argument('--save-schema', type=Path, help='Save the schema to this JSON file')
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    synthetic_schema, schema_source = _get_schema(args.schema, args.from_csv)
+    print(f'Schema is {schema_source}')
+    if args.save_schema is not None:
+        synthetic_schema.save(args.save_schema)
+    generate_data(synthetic_schema, args.rows, args.output, args.chunk_rows, args.workers, args.seed)
@@ -0,0 +1,276 @@
+import json
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from torch import Tensor
+
+from src.config import MLPExperimentConfig
+from src.data.preprocessing.filters import get_row_filter
+from src.data.preprocessing.main import get_raw_csv_path
+from src.data.preprocessing.split_manifest import SPLIT_MANIFEST_FILENAME, SplitManifest, get_manifest_fingerprint
+from src.data.preprocessing.steps import hash_file, read_data
+from src.inference.numpy_runtime import SPEC_KEY, NumpyMLP
+from src.train.datamodule import TabularDataModule
+from src.train.lightning_module import ClassificationLightningModule
+from src.train.metrics import get_metrics
+from src.train.model import MLP
+
+PredictFn = Callable[[Tensor], Tensor]
+
+# Maximum absolute differences between the NumPy runtime and the torch model and the fitted transformer
+NUMPY_PARITY_TOLERANCES = {'max_abs_logit_diff': 1e-3, 'max_abs_proba_diff': 1e-4, 'max_abs_transform_diff': 1e-5}
+
+
+@dataclass(frozen=True)
+class LatencyStats:
+    batch_size: int
+    median_latency_ms: float
+    p95_latency_ms: float
+    rows_per_sec: float
+
+
+@dataclass(frozen=True)
+class ArtifactReport:
+    name: str
+    path: str
+    size_kb: float
+    test_f1: float
+    f1_delta: float
+    latency: Tuple[LatencyStats, ...]
+
+    def to_dict(self) -> Dict[str, object]:
+        return asdict(self)
+
+
+def load_mlp(checkpoint_path: Path) -> Tuple[ClassificationLightningModule, MLP]:
+    module = ClassificationLightningModule.load_from_checkpoint(checkpoint_path, map_location='cpu')
+    module.eval()
+    return module, module.model
+
+
+def get_test_datamodule(module: ClassificationLightningModule) -> TabularDataModule:
+    """Data module of the dataset the module was trained on, set up for testing.
+
+    Already processed data is read as is: preprocessing it again would rewrite it as a side effect of exporting and,
+    if raw data has changed, produce a test split the module has never been evaluated on.
+    """
+    datamodule = TabularDataModule(module.hparams.cfg)
+    try:
+        datamodule.setup(stage='test')
+    except FileNotFoundError as error:
+        raise FileNotFoundError(
+            f'Processed test split is not found in `{datamodule.data_path}`, preprocess the dataset before exporting',
+        ) from error
+    return datamodule
+
+
+def load_test_split(
+    module: ClassificationLightningModule,
+    datamodule: Optional[TabularDataModule] = None,
+) -> Tuple[Tensor, Tensor]:
+    """Read the whole test split of the dataset the module was trained on into a pair of tensors."""
+    datamodule = datamodule or get_test_datamodule(module)
+    test_split = datamodule.data_test.data  # type: ignore[union-attr]
+    return test_split.get_batch(range(len(test_split)))
+
+
+def load_raw_test_features(cfg: MLPExperimentConfig, processed_dir: Path) -> Optional[pd.DataFrame]:
+    """Raw (not transformed) features of the test split, None if the raw CSV it was split from isn't available."""
+    prep_cfg = cfg.data_config.processing_config
+    raw_csv_path = get_raw_csv_path(cfg.project_name, cfg.data_config)
+    manifest_path = processed_dir / SPLIT_MANIFEST_FILENAME
+    if not raw_csv_path.is_file() or not manifest_path.is_file():
+        return None
+    manifest = SplitManifest.load(manifest_path)
+    _, raw_sha1 = hash_file(raw_csv_path)
+    if manifest.fingerprint != get_manifest_fingerprint(raw_sha1, prep_cfg, cfg.seed):
+        return None  # raw data has changed since it was split
+    features, _ = read_data(raw_csv_path, prep_cfg.target_column, get_row_filter(prep_cfg), prep_cfg.read_chunk_size)
+    return features.take(manifest.test)
+
+
+def quantize_int8(model: MLP) -> nn.Module:
+    # Weights of `nn.Linear` layers are quantized ahead of time, activations are quantized on the fly
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def export_torchscript(model: nn.Module, example: Tensor, path: Path) -> Path:
+    with torch.inference_mode():
+        scripted = torch.jit.trace(model, example)
+    scripted = torch.jit.freeze(scripted.eval())
+    torch.jit.save(scripted, str(path))
+    return path
+
+
+def export_onnx(model: MLP, example: Tensor, path: Path) -> Path:
+    torch.onnx.export(
+        model,
+        (example,),
+        str(path),
+        input_names=['features'],
+        output_names=['logits'],
+        dynamic_axes={'features': {0: 'batch'}, 'logits': {0: 'batch'}},
+    )
+    return path
+
+
+def _get_transform_blocks(transformer: ColumnTransformer) -> List[Dict[str, Any]]:
+    # Output features of `ColumnTransformer` are concatenated outputs of its transformers in order, remainder is last
+    blocks = []
+    for name, fitted, cols in transformer.transformers_:
+        if isinstance(fitted, str) and fitted == 'drop' or not len(cols):
+            continue
+        if name == 'remainder' and not isinstance(cols[0], str):
+            cols = transformer.feature_names_in_[cols]
+        block: Dict[str, Any] = {'columns': [str(col) for col in cols]}
+        if isinstance(fitted, OneHotEncoder):
+            block.update(kind='one_hot', categories=[categories.tolist() for categories in fitted.categories_])
+        elif isinstance(fitted, Pipeline):  # categorical codes: ordinal encoder followed by the shift of codes
+            block.update(kind='codes', categories=[categories.tolist() for categories in fitted[0].categories_])
+        elif isinstance(fitted, StandardScaler):
+            block.update(kind='numeric', mean=fitted.mean_.tolist(), scale=fitted.scale_.tolist())
+        else:  # passthrough
+            block.update(kind='numeric', mean=[0.0] * len(cols), scale=[1.0] * len(cols))
+        blocks.append(block)
+    return blocks
+
+
+def export_numpy(model: MLP, transformer: Optional[ColumnTransformer], path: Path) -> Path:
+    """Save MLP weights and fitted preprocessing parameters to a single `.npz` file for `NumpyMLP` runtime."""
+    spec = {
+        'num_numeric': model.num_numeric,
+        'num_embeddings': len(model.embeddings),
+        'blocks': _get_transform_blocks(transformer) if transformer is not None else [],
+    }
+    arrays = {SPEC_KEY: np.array(json.dumps(spec))}
+    for idx, embedding in enumerate(model.embeddings):
+        arrays[f'embedding_{idx}'] = embedding.weight.detach().numpy()
+    for idx, linear in enumerate((model.linear_1, model.linear_2, model.linear_3)):
+        # Stored as (in, out), so the forward pass is `features @ weight + bias`
+        arrays[f'linear_{idx}_weight'] = np.ascontiguousarray(linear.weight.detach().numpy().T)
+        arrays[f'linear_{idx}_bias'] = linear.bias.detach().numpy()
+    np.savez_compressed(path, **arrays)
+    return path
+
+
+def get_numpy_predict_fn(path: Path) -> PredictFn:
+    runtime = NumpyMLP.load(path)
+
+    def predict(features: Tensor) -> Tensor:
+        return torch.from_numpy(runtime.forward(features.numpy()))
+
+    return predict
+
+
+def _max_abs_diff(actual: np.ndarray, expected: np.ndarray) -> float:
+    # Missing values are equal only to missing values
+    diff = np.nan_to_num(np.abs(actual - expected), nan=np.inf)
+    return float(np.where(np.isnan(actual) & np.isnan(expected), 0, diff).max(initial=0))
+
+
+def check_numpy_parity(
+    path: Path,
+    model: MLP,
+    features: Tensor,
+    raw_features: Optional[pd.DataFrame] = None,
+    transformer: Optional[ColumnTransformer] = None,
+) -> Dict[str, float]:
+    """Compare the exported NumPy model with the torch model, raise `ValueError` if they differ beyond tolerances.
+
+    Logits are compared on transformed `features`. If raw rows of the same split and the fitted transformer are passed,
+    the runtime transform of raw rows is compared with the transformer output (one-hot and code lookups, column order,
+    unknown categories) and probabilities of raw rows are compared with the ones of the torch model.
+    """
+    runtime = NumpyMLP.load(path)
+    with torch.inference_mode():
+        diffs = {'max_abs_logit_diff': _max_abs_diff(runtime.forward(features.numpy()), model(features).numpy())}
+    if raw_features is not None and transformer is not None:
+        expected = transformer.transform(raw_features)
+        if hasattr(expected, 'toarray'):
+            expected = expected.toarray()
+        expected = np.asarray(expected, dtype=np.float32)
+        columns = {col: raw_features[col].to_numpy() for col in raw_features.columns}
+        diffs['max_abs_transform_diff'] = _max_abs_diff(runtime.transform(columns), expected)
+        with torch.inference_mode():
+            torch_probs = torch.softmax(model(torch.from_numpy(expected)), dim=1).numpy()
+        diffs['max_abs_proba_diff'] = _max_abs_diff(runtime.predict_proba(columns), torch_probs)
+
+    exceeded = {name: diff for name, diff in diffs.items() if diff > NUMPY_PARITY_TOLERANCES[name]}
+    if exceeded:
+        raise ValueError(
+            f'NumPy model `{path}` doesn\'t match the torch model: {exceeded} exceed {NUMPY_PARITY_TOLERANCES}',
+        )
+    return diffs
+
+
+def get_torch_predict_fn(model: nn.Module) -> PredictFn:
+    def predict(features: Tensor) -> Tensor:
+        with torch.inference_mode():
+            return model(features)  # type: ignore[no-any-return]
+
+    return predict
+
+
+def get_onnx_predict_fn(path: Path) -> PredictFn:
+    import onnxruntime  # Optional dependency, only needed to evaluate the ONNX graph
+
+    session = onnxruntime.InferenceSession(str(path), providers=['CPUExecutionProvider'])
+
+    def predict(features: Tensor) -> Tensor:
+        logits = session.run(['logits'], {'features': features.numpy()})[0]
+        return torch.from_numpy(logits)
+
+    return predict
+
+
+def compute_f1(predict: PredictFn, features: Tensor, target: Tensor, num_classes: int) -> float:
+    metrics = get_metrics(num_classes=num_classes, num_labels=num_classes, task='multiclass', average='macro')
+    metrics.update(predict(features), target)
+    return float(metrics.compute()['f1'])
+
+
+def measure_latency(
+    predict: PredictFn,
+    features: Tensor,
+    batch_sizes: Sequence[int],
+    min_iters: int = 20,
+    min_time_s: float = 0.5,
+) -> Tuple[LatencyStats, ...]:
+    stats = []
+    for batch_size in batch_sizes:
+        batch = _get_batch(features, batch_size)
+        for _ in range(3):  # warmup
+            predict(batch)
+
+        timings: List[float] = []
+        started = time.perf_counter()
+        while len(timings) < min_iters or time.perf_counter() - started < min_time_s:
+            iter_start = time.perf_counter()
+            predict(batch)
+            timings.append(time.perf_counter() - iter_start)
+
+        median = float(np.median(timings))
+        stats.append(
+            LatencyStats(
+                batch_size=batch_size,
+                median_latency_ms=median * 1e3,
+                p95_latency_ms=float(np.percentile(timings, 95)) * 1e3,
+                rows_per_sec=batch_size / median,
+            ),
+        )
+    return tuple(stats)
+
+
+def _get_batch(features: Tensor, batch_size: int) -> Tensor:
+    # Test split may be smaller than the batch, rows are repeated in this case
+    repeats = -(-batch_size // len(features))
+    return features.repeat(repeats, 1)[:batch_size].contiguous()
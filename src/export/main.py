@@ -0,0 +1,134 @@
+import argparse
+import json
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import torch
+
+from src.data.preprocessing.steps import load_transformer
+from src.export.core import (
+    ArtifactReport,
+    PredictFn,
+    check_numpy_parity,
+    compute_f1,
+    export_numpy,
+    export_onnx,
+    export_torchscript,
+    get_numpy_predict_fn,
+    get_onnx_predict_fn,
+    get_test_datamodule,
+    get_torch_predict_fn,
+    load_mlp,
+    load_raw_test_features,
+    load_test_split,
+    measure_latency,
+    quantize_int8,
+)
+
+DEFAULT_BATCH_SIZES = (1, 32, 256, 2048)
+REPORT_FILENAME = 'export_report.json'
+
+
+def export_model(
+    checkpoint_path: Path,
+    output_dir: Optional[Path] = None,
+    batch_sizes: Sequence[int] = DEFAULT_BATCH_SIZES,
+) -> List[ArtifactReport]:
+    """Export MLP from a Lightning checkpoint to int8 TorchScript, fp32 TorchScript, ONNX and NumPy `.npz`.
+
+    Every artifact is loaded back and evaluated on the test split: F1 parity with the checkpoint and CPU latency and
+    throughput at several batch sizes are reported and saved to `export_report.json` in the output directory. Export
+    fails if the NumPy model doesn't match the checkpoint and the fitted transformer within tolerances, see
+    `check_numpy_parity`.
+
+    Args:
+        checkpoint_path: Path to a checkpoint of `ClassificationLightningModule`
+        output_dir: Directory to save artifacts to, `export` directory next to the checkpoint by default
+        batch_sizes: Batch sizes to measure latency and throughput with
+    """
+    output_dir = output_dir or checkpoint_path.parent / 'export'
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    module, model = load_mlp(checkpoint_path)
+    datamodule = get_test_datamodule(module)
+    features, target = load_test_split(module, datamodule)
+    num_classes = module.hparams.num_classes
+    example = features[:1]
+
+    int8_path = export_torchscript(quantize_int8(model), example, output_dir / 'mlp_int8.ts')
+    ts_path = export_torchscript(model, example, output_dir / 'mlp_fp32.ts')
+    onnx_path = export_onnx(model, example, output_dir / 'mlp.onnx')
+    transformer = load_transformer(datamodule.data_path)  # type: ignore[arg-type]
+    if transformer is None:
+        print('Fitted transformer is not found next to the processed data, NumPy model is exported without it.')
+    numpy_path = export_numpy(model, transformer, output_dir / 'mlp_numpy.npz')
+    raw_features = load_raw_test_features(module.hparams.cfg, datamodule.data_path)  # type: ignore[arg-type]
+    if transformer is not None and raw_features is None:
+        print('Raw data of the test split is not available, NumPy transform is not compared with the transformer.')
+    parity = check_numpy_parity(numpy_path, model, features, raw_features, transformer)
+    print('NumPy model matches the checkpoint: ' + ', '.join(f'{name}={diff:.2e}' for name, diff in parity.items()))
+
+    artifacts = [
+        ('checkpoint_fp32', checkpoint_path, get_torch_predict_fn(model)),
+        ('torchscript_int8', int8_path, get_torch_predict_fn(torch.jit.load(str(int8_path)))),
+        ('torchscript_fp32', ts_path, get_torch_predict_fn(torch.jit.load(str(ts_path)))),
+        ('numpy_fp32', numpy_path, get_numpy_predict_fn(numpy_path)),
+    ]
+    try:
+        artifacts.append(('onnx_fp32', onnx_path, get_onnx_predict_fn(onnx_path)))
+    except ImportError:
+        print(f'`onnxruntime` is not installed, ONNX graph is exported to `{onnx_path}` but not evaluated.')
+
+    reports = []
+    reference_f1: Optional[float] = None
+    for name, path, predict in artifacts:
+        report = _evaluate_artifact(name, path, predict, features, target, num_classes, batch_sizes, reference_f1)
+        reference_f1 = reference_f1 if reference_f1 is not None else report.test_f1
+        reports.append(report)
+
+    with open(output_dir / REPORT_FILENAME, 'w') as out_file:
+        json.dump([report.to_dict() for report in reports], out_file, indent=2)
+    _print_reports(reports)
+    print(f'Exported artifacts and report are saved to `{output_dir}`')
+    return reports
+
+
+def _evaluate_artifact(
+    name: str,
+    path: Path,
+    predict: PredictFn,
+    features: torch.Tensor,
+    target: torch.Tensor,
+    num_classes: int,
+    batch_sizes: Sequence[int],
+    reference_f1: Optional[float],
+) -> ArtifactReport:
+    test_f1 = compute_f1(predict, features, target, num_classes)
+    return ArtifactReport(
+        name=name,
+        path=str(path),
+        size_kb=path.stat().st_size / 1024,
+        test_f1=test_f1,
+        f1_delta=0.0 if reference_f1 is None else test_f1 - reference_f1,
+        latency=measure_latency(predict, features, batch_sizes),
+    )
+
+
+def _print_reports(reports: Sequence[ArtifactReport]) -> None:
+    print(f'{"artifact":<18} {"size, KB":>9} {"test F1":>8} {"ΔF1":>8} {"batch":>6} {"p50, ms":>9} {"rows/s":>11}')
+    for report in reports:
+        for stats in report.latency:
+            print(
+                f'{report.name:<18} {report.size_kb:>9.1f} {report.test_f1:>8.4f} {report.f1_delta:>+8.4f} '
+                f'{stats.batch_size:>6} {stats.median_latency_ms:>9.3f} {stats.rows_per_sec:>11.0f}',
+            )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export trained MLP to int8 TorchScript, TorchScript, ONNX and NumPy')
+    parser.add_argument('checkpoint', type=Path, help='Path to a Lightning checkpoint')
+    parser.add_argument('--output-dir', type=Path)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=list(DEFAULT_BATCH_SIZES))
+    args = parser.parse_args()
+
+    export_model(args.checkpoint, args.output_dir, args.batch_sizes)
@@ -0,0 +1,96 @@
+"""NumPy-only inference runtime of the MLP exported by `src/export/main.py` to a single `.npz` file.
+
+The file holds preprocessing parameters fitted on the train split and MLP weights, so scoring needs neither torch nor
+scikit-learn. This module depends only on NumPy and can be copied into a scoring image as is.
+"""
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Sequence, Union
+
+import numpy as np
+
+SPEC_KEY = 'spec'
+RawColumns = Mapping[str, Union[Sequence[Any], np.ndarray]]
+
+
+def _lookup(categories: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Index of each value in sorted `categories` and whether the value is a known category."""
+    if categories.dtype.kind in 'US':
+        values = values.astype(str)
+    idx = np.minimum(np.searchsorted(categories, values), len(categories) - 1)
+    return idx, categories[idx] == values
+
+
+class NumpyMLP:
+    """Preprocessing and forward pass of the exported MLP in batched NumPy operations.
+
+    Raw rows are passed column-wise: a mapping of raw feature names to equally long sequences of values.
+    """
+
+    def __init__(self, spec: Dict[str, Any], arrays: Dict[str, np.ndarray]):
+        self.spec = spec
+        self.num_numeric: int = spec['num_numeric']
+        self.blocks: List[Dict[str, Any]] = spec['blocks']
+        self.categories = {
+            (block_idx, col_idx): np.asarray(categories)
+            for block_idx, block in enumerate(self.blocks)
+            for col_idx, categories in enumerate(block.get('categories', ()))
+        }
+        self.embeddings = [arrays[f'embedding_{idx}'] for idx in range(spec['num_embeddings'])]
+        self.linears = [(arrays[f'linear_{idx}_weight'], arrays[f'linear_{idx}_bias']) for idx in range(3)]
+
+    @classmethod
+    def load(cls, path: Union[Path, str]) -> 'NumpyMLP':
+        with np.load(path) as npz:
+            arrays = {key: npz[key] for key in npz.files}
+        return cls(json.loads(str(arrays.pop(SPEC_KEY))), arrays)
+
+    @property
+    def num_classes(self) -> int:
+        return int(self.linears[-1][1].shape[0])
+
+    def transform(self, columns: RawColumns) -> np.ndarray:
+        """Transform raw columns into MLP input features, the same way the fitted transformer does."""
+        if not self.blocks:
+            raise ValueError('The model is exported without preprocessing parameters, pass transformed features')
+        num_rows = len(next(iter(columns.values())))
+        transformed = []
+        for block_idx, block in enumerate(self.blocks):
+            for col_idx, col in enumerate(block['columns']):
+                values = np.asarray(columns[col])
+                if block['kind'] == 'numeric':
+                    numeric = (values.astype(np.float32) - block['mean'][col_idx]) / block['scale'][col_idx]
+                    transformed.append(numeric.reshape(-1, 1))
+                    continue
+                idx, known = _lookup(self.categories[block_idx, col_idx], values)
+                if block['kind'] == 'codes':
+                    # Unknown categories map to the reserved code 0
+                    transformed.append(np.where(known, idx + 1, 0).reshape(-1, 1))
+                else:
+                    one_hot = np.zeros((num_rows, len(self.categories[block_idx, col_idx])), dtype=np.float32)
+                    rows = np.flatnonzero(known)
+                    one_hot[rows, idx[rows]] = 1
+                    transformed.append(one_hot)
+        return np.concatenate(transformed, axis=1).astype(np.float32)
+
+    def forward(self, features: np.ndarray) -> np.ndarray:
+        """Logits for transformed features."""
+        hidden = features.astype(np.float32, copy=False)
+        if self.embeddings:
+            codes = hidden[:, self.num_numeric :].astype(np.int64)
+            embedded = [table[codes[:, idx]] for idx, table in enumerate(self.embeddings)]
+            hidden = np.concatenate([hidden[:, : self.num_numeric], *embedded], axis=1)
+        for layer_idx, (weight, bias) in enumerate(self.linears):
+            hidden = hidden @ weight + bias
+            if layer_idx < len(self.linears) - 1:
+                np.maximum(hidden, 0, out=hidden)
+        return hidden
+
+    def predict_proba(self, columns: RawColumns) -> np.ndarray:
+        logits = self.forward(self.transform(columns))
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        return probs / probs.sum(axis=1, keepdims=True)  # type: ignore[no-any-return]
+
+    def predict(self, columns: RawColumns) -> np.ndarray:
+        return self.forward(self.transform(columns)).argmax(axis=1)  # type: ignore[no-any-return]
@@ -9,8 +9,9 @@ def run_training(cfg: MLPExperimentConfig) -> None:
         return run_pipeline(cfg)
     elif cfg.run_mode == RunModeEnum.local:
         if cfg.track_in_clearml is True:
-            return clearml_train_mlp(cfg)
-        return train_mlp(cfg)
+            clearml_train_mlp(cfg)
+        else:
+            train_mlp(cfg)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,309 @@
+"""Local SQLite index of training runs: config and data fingerprints, metrics, timings and checkpoints.
+
+Runs can be listed, ranked by a metric and compared without the ClearML server:
+
+    python src/tracking/run_store.py list [--project P] [--experiment E]
+    python src/tracking/run_store.py rank test_f1
+    python src/tracking/run_store.py diff <run_id> <run_id>
+    python src/tracking/run_store.py lookup [--config <config.yaml>]
+"""
+import argparse
+import hashlib
+import json
+import sqlite3
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from src.config import MLPExperimentConfig, get_experiment_cfg
+from src.constants import TMP_EXPERIMENTS_DIR
+from src.data.data_model import get_split_files
+from src.data.preprocessing.path_helpers import _get_processed_dir_path
+from src.data.preprocessing.split_manifest import SPLIT_MANIFEST_FILENAME, SPLIT_NAMES, SplitManifest
+
+DEFAULT_RUN_STORE_PATH = TMP_EXPERIMENTS_DIR / 'runs.sqlite'
+# Settings that don't affect training results
+_NOT_HASHED_FIELDS: Dict[str, Any] = {
+    'track_in_clearml': True,
+    'run_mode': True,
+    'metric_logging_config': True,
+    'run_store_config': True,
+    'trainer_config': {'telemetry': True},
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    project TEXT,
+    experiment TEXT,
+    config_hash TEXT,
+    data_fingerprint TEXT,
+    config TEXT,
+    status TEXT,
+    started_at REAL,
+    finished_at REAL,
+    fit_duration_s REAL,
+    test_duration_s REAL,
+    best_checkpoint_path TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_lookup ON runs (config_hash, data_fingerprint, status);
+CREATE INDEX IF NOT EXISTS runs_experiment ON runs (project, experiment, started_at);
+CREATE TABLE IF NOT EXISTS metrics (run_id TEXT, step INTEGER, epoch INTEGER, name TEXT, value REAL, timestamp REAL);
+CREATE INDEX IF NOT EXISTS metrics_run ON metrics (run_id, name);
+CREATE TABLE IF NOT EXISTS final_metrics (run_id TEXT, name TEXT, value REAL, PRIMARY KEY (run_id, name));
+CREATE INDEX IF NOT EXISTS final_metrics_rank ON final_metrics (name, value);
+CREATE TABLE IF NOT EXISTS checkpoints (run_id TEXT, path TEXT, score REAL);
+CREATE INDEX IF NOT EXISTS checkpoints_run ON checkpoints (run_id);
+"""
+
+
+def get_config_hash(cfg: MLPExperimentConfig) -> str:
+    cfg_dump = cfg.model_dump(mode='json', exclude=_NOT_HASHED_FIELDS)
+    return hashlib.sha1(json.dumps(cfg_dump, sort_keys=True).encode()).hexdigest()
+
+
+def get_data_fingerprint(processed_dir: Path) -> str:
+    """Fingerprint of processed data: the one of the split manifest, which covers raw data and split settings.
+
+    Processing settings are a part of the config hash. If there's no manifest, split files are hashed.
+    """
+    manifest_path = processed_dir / SPLIT_MANIFEST_FILENAME
+    if manifest_path.is_file():
+        return SplitManifest.load(manifest_path).fingerprint
+    digest = hashlib.sha1()
+    for split_file in sorted(path for split in SPLIT_NAMES for path in get_split_files(processed_dir, split)):
+        with open(split_file, 'rb') as in_file:
+            while block := in_file.read(2**20):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True)
+class RunRecord:
+    run_id: str
+    project: str
+    experiment: str
+    config_hash: str
+    data_fingerprint: str
+    status: str
+    started_at: float
+    finished_at: Optional[float]
+    fit_duration_s: Optional[float]
+    test_duration_s: Optional[float]
+    best_checkpoint_path: Optional[str]
+
+
+_RUN_COLUMNS = ', '.join(f'runs.{name}' for name in RunRecord.__dataclass_fields__)
+
+
+class RunStore:
+    def __init__(self, path: Path = DEFAULT_RUN_STORE_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        # Lightning logs metrics from the training thread, connection is created there but used from a few hooks
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')  # readers don't block the run that is being recorded
+        self._connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def start_run(self, cfg: MLPExperimentConfig, data_fingerprint: str) -> str:
+        run_id = uuid.uuid4().hex[:12]
+        with self._connection:
+            self._connection.execute(
+                'INSERT INTO runs (run_id, project, experiment, config_hash, data_fingerprint, config, status, '
+                'started_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    run_id,
+                    cfg.project_name,
+                    cfg.experiment_name,
+                    get_config_hash(cfg),
+                    data_fingerprint,
+                    cfg.model_dump_json(),
+                    'running',
+                    time.time(),
+                ),
+            )
+        return run_id
+
+    def log_metrics(self, run_id: str, metrics: Mapping[str, float], step: Optional[int], epoch: Optional[int]) -> None:
+        timestamp = time.time()
+        with self._connection:
+            self._connection.executemany(
+                'INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?)',
+                [(run_id, step, epoch, name, float(value), timestamp) for name, value in metrics.items()],
+            )
+
+    def finish_run(
+        self,
+        run_id: str,
+        final_metrics: Mapping[str, float],
+        checkpoints: Mapping[str, Optional[float]],
+        best_checkpoint_path: str,
+        fit_duration_s: float,
+        test_duration_s: float,
+    ) -> None:
+        with self._connection:
+            self._connection.execute(
+                'UPDATE runs SET status = ?, finished_at = ?, fit_duration_s = ?, test_duration_s = ?, '
+                'best_checkpoint_path = ? WHERE run_id = ?',
+                ('finished', time.time(), fit_duration_s, test_duration_s, best_checkpoint_path, run_id),
+            )
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO final_metrics VALUES (?, ?, ?)',
+                [(run_id, name, float(value)) for name, value in final_metrics.items()],
+            )
+            self._connection.executemany(
+                'INSERT INTO checkpoints VALUES (?, ?, ?)',
+                [(run_id, path, score) for path, score in checkpoints.items()],
+            )
+
+    def fail_run(self, run_id: str) -> None:
+        with self._connection:
+            self._connection.execute(
+                'UPDATE runs SET status = ?, finished_at = ? WHERE run_id = ?',
+                ('failed', time.time(), run_id),
+            )
+
+    def find_finished_run(self, config_hash: str, data_fingerprint: str) -> Optional[RunRecord]:
+        """The latest finished run with the same config and data."""
+        row = self._connection.execute(
+            f'SELECT {_RUN_COLUMNS} FROM runs WHERE config_hash = ? AND data_fingerprint = ? AND status = ? '
+            'ORDER BY started_at DESC LIMIT 1',
+            (config_hash, data_fingerprint, 'finished'),
+        ).fetchone()
+        return RunRecord(*row) if row else None
+
+    def get_run(self, run_id: str) -> Optional[RunRecord]:
+        row = self._connection.execute(f'SELECT {_RUN_COLUMNS} FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+        return RunRecord(*row) if row else None
+
+    def get_config(self, run_id: str) -> Dict[str, Any]:
+        row = self._connection.execute('SELECT config FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+        return json.loads(row[0]) if row else {}  # type: ignore[no-any-return]
+
+    def get_final_metrics(self, run_id: str) -> Dict[str, float]:
+        rows = self._connection.execute('SELECT name, value FROM final_metrics WHERE run_id = ?', (run_id,))
+        return dict(rows.fetchall())
+
+    def list_runs(
+        self,
+        project: Optional[str] = None,
+        experiment: Optional[str] = None,
+        limit: int = 20,
+    ) -> List[RunRecord]:
+        conditions = [(column, value) for column, value in (('project', project), ('experiment', experiment)) if value]
+        where = ' AND '.join(f'{column} = ?' for column, _ in conditions) or '1'
+        rows = self._connection.execute(
+            f'SELECT {_RUN_COLUMNS} FROM runs WHERE {where} ORDER BY started_at DESC LIMIT ?',
+            (*(value for _, value in conditions), limit),
+        )
+        return [RunRecord(*row) for row in rows.fetchall()]
+
+    def rank_runs(
+        self,
+        metric: str,
+        descending: bool = True,
+        project: Optional[str] = None,
+        limit: int = 20,
+    ) -> List[Tuple[RunRecord, float]]:
+        order = 'DESC' if descending else 'ASC'
+        project_condition = 'AND runs.project = ?' if project else ''
+        rows = self._connection.execute(
+            f'SELECT {_RUN_COLUMNS}, final_metrics.value FROM final_metrics JOIN runs USING (run_id) '
+            f'WHERE final_metrics.name = ? {project_condition} ORDER BY final_metrics.value {order} LIMIT ?',
+            (metric, *((project,) if project else ()), limit),
+        )
+        return [(RunRecord(*row[:-1]), row[-1]) for row in rows.fetchall()]
+
+    def diff_runs(self, run_id_a: str, run_id_b: str) -> Dict[str, Dict[str, Tuple[Any, Any]]]:
+        """Config values and final metrics that differ between two runs."""
+        config_a, config_b = (_flatten(self.get_config(run_id)) for run_id in (run_id_a, run_id_b))
+        metrics_a, metrics_b = (self.get_final_metrics(run_id) for run_id in (run_id_a, run_id_b))
+        return {
+            'config': _diff_dicts(config_a, config_b),
+            'metrics': _diff_dicts(metrics_a, metrics_b),
+        }
+
+
+def _flatten(nested: Mapping[str, Any], prefix: str = '') -> Dict[str, Any]:
+    flat: Dict[str, Any] = {}
+    for key, value in nested.items():
+        if isinstance(value, Mapping):
+            flat.update(_flatten(value, f'{prefix}{key}.'))
+        else:
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+def _diff_dicts(dict_a: Mapping[str, Any], dict_b: Mapping[str, Any]) -> Dict[str, Tuple[Any, Any]]:
+    keys = sorted(set(dict_a) | set(dict_b))
+    return {key: (dict_a.get(key), dict_b.get(key)) for key in keys if dict_a.get(key) != dict_b.get(key)}
+
+
+def get_run_store(cfg: MLPExperimentConfig) -> Optional[RunStore]:
+    run_store_cfg = cfg.run_store_config
+    if not run_store_cfg.enabled:
+        return None
+    return RunStore(run_store_cfg.path or DEFAULT_RUN_STORE_PATH)
+
+
+def _print_runs(runs: Sequence[RunRecord], values: Optional[Sequence[float]] = None) -> None:
+    print(f'{"run_id":<13} {"status":<9} {"started":<20} {"fit, s":>8} {"value":>8}  project / experiment')
+    for idx, run in enumerate(runs):
+        started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run.started_at))
+        fit_duration = f'{run.fit_duration_s:>8.1f}' if run.fit_duration_s is not None else f'{"-":>8}'
+        value = f'{values[idx]:>8.4f}' if values is not None else f'{"":>8}'
+        experiment = f'{run.project} / {run.experiment}'
+        print(f'{run.run_id:<13} {run.status:<9} {started:<20} {fit_duration} {value}  {experiment}')
+
+
+def _main() -> None:
+    parser = argparse.ArgumentParser(description='Query the local index of training runs')
+    parser.add_argument('--store', type=Path, default=DEFAULT_RUN_STORE_PATH)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    list_parser = subparsers.add_parser('list', help='The latest runs')
+    list_parser.add_argument('--project')
+    list_parser.add_argument('--experiment')
+    list_parser.add_argument('--limit', type=int, default=20)
+    rank_parser = subparsers.add_parser('rank', help='Runs ranked by a final metric')
+    rank_parser.add_argument('metric')
+    rank_parser.add_argument('--ascending', action='store_true')
+    rank_parser.add_argument('--project')
+    rank_parser.add_argument('--limit', type=int, default=20)
+    diff_parser = subparsers.add_parser('diff', help='Config and final metrics differences of two runs')
+    diff_parser.add_argument('run_ids', nargs=2)
+    lookup_parser = subparsers.add_parser('lookup', help='Finished runs with the same config and processed data')
+    lookup_parser.add_argument('--config', type=Path, help='The config used by default if not passed')
+    args = parser.parse_args()
+
+    store = RunStore(args.store)
+    if args.command == 'list':
+        _print_runs(store.list_runs(args.project, args.experiment, args.limit))
+    elif args.command == 'rank':
+        ranked = store.rank_runs(args.metric, not args.ascending, args.project, args.limit)
+        _print_runs([run for run, _ in ranked], [value for _, value in ranked])
+    elif args.command == 'diff':
+        for section, diff in store.diff_runs(*args.run_ids).items():
+            print(f'{section}:')
+            for key, (value_a, value_b) in diff.items():
+                print(f'  {key}: {value_a} -> {value_b}')
+    else:
+        cfg = get_experiment_cfg(args.config)
+        processed_dir = _get_processed_dir_path(cfg.project_name, cfg.data_config.orig_dataset_name)
+        if not processed_dir.is_dir():
+            print(f'Processed data is not found in `{processed_dir}`, the config has not been trained on it.')
+            return
+        run = store.find_finished_run(get_config_hash(cfg), get_data_fingerprint(processed_dir))
+        if run is None:
+            print('The config has not been trained on the current processed data.')
+        else:
+            _print_runs([run])
+            print(f'Final metrics: {store.get_final_metrics(run.run_id)}')
+
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,164 @@
+import atexit
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Deque, List, Literal, Optional, Protocol, Sequence, Union
+
+from src.config import MLPExperimentConfig
+from src.constants import TMP_EXPERIMENTS_DIR
+
+
+@dataclass(frozen=True)
+class Record:
+    run: str
+    kind: Literal['scalar', 'text']
+    name: str
+    value: Union[float, str]
+    step: int
+    timestamp: float
+
+
+class TextReporter(Protocol):
+    def report_text(self, msg: str) -> None:
+        ...
+
+
+class SinkBackend(Protocol):
+    def write(self, records: Sequence[Record]) -> None:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+class JsonlBackend:
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, 'a')
+
+    def write(self, records: Sequence[Record]) -> None:
+        self._file.write(''.join(json.dumps(asdict(record)) + '\n' for record in records))
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class SqliteBackend:
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Records are written by the flushing thread and, on close, by the closing one
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS records (run TEXT, kind TEXT, name TEXT, value, step INTEGER, timestamp REAL)',
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS records_run_name ON records (run, name)')
+
+    def write(self, records: Sequence[Record]) -> None:
+        with self._connection:
+            self._connection.executemany(
+                'INSERT INTO records VALUES (?, ?, ?, ?, ?, ?)',
+                [(rec.run, rec.kind, rec.name, rec.value, rec.step, rec.timestamp) for rec in records],
+            )
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class ClearMLBackend:
+    def __init__(self, logger: Any):
+        self._logger = logger
+
+    def write(self, records: Sequence[Record]) -> None:
+        for record in records:
+            if record.kind == 'scalar':
+                self._logger.report_scalar(record.name, record.name, value=record.value, iteration=record.step)
+            else:
+                # Texts are printed when they are reported to the sink
+                self._logger.report_text(record.value, print_console=False)
+
+    def close(self) -> None:
+        self._logger.flush()
+
+
+class BufferedMetricSink:
+    """Collects scalars and texts without blocking and writes them to the backend in batches from a background thread.
+
+    Records are flushed every `flush_interval_s` seconds and on `close()`, which is also called at interpreter exit.
+    Errors of the backend are reported, but never propagated to the logging code.
+    """
+
+    def __init__(self, backend: SinkBackend, flush_interval_s: float = 5.0, run: Optional[str] = None):
+        self.backend = backend
+        self.flush_interval_s = flush_interval_s
+        self.run = run or time.strftime('%Y%m%d-%H%M%S')
+        # Appending to and popping from deque are thread-safe, so logging takes no locks
+        self._buffer: Deque[Record] = deque()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._flush_periodically, name='metric-sink', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log_scalar(self, name: str, value: float, step: int) -> None:
+        self._buffer.append(Record(self.run, 'scalar', name, value, step, time.time()))
+
+    def report_text(self, msg: str) -> None:
+        self._buffer.append(Record(self.run, 'text', 'text', msg, 0, time.time()))
+        print(msg)
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            records: List[Record] = []
+            while self._buffer:
+                records.append(self._buffer.popleft())
+            if not records:
+                return
+            try:
+                self.backend.write(records)
+            except Exception as exc:  # noqa: B902
+                print(f'Failed to write {len(records)} metric records: {exc!r}')
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        self._stopped.set()
+        self._thread.join()
+        self.flush()
+        self.backend.close()
+
+    def _flush_periodically(self) -> None:
+        while not self._stopped.wait(self.flush_interval_s):
+            self.flush()
+
+
+def _get_local_metrics_path(cfg: MLPExperimentConfig, suffix: str) -> Path:
+    return TMP_EXPERIMENTS_DIR / cfg.project_name / cfg.experiment_name / f'metrics.{suffix}'
+
+
+def get_metric_sink(cfg: MLPExperimentConfig) -> Optional[BufferedMetricSink]:
+    """Sink for step metrics of a training run, None if step metrics are logged by Lightning."""
+    logging_cfg = cfg.metric_logging_config
+    backend_name = logging_cfg.backend
+    if backend_name == 'lightning':
+        return None
+    if backend_name == 'auto':
+        backend_name = 'clearml' if cfg.track_in_clearml else 'jsonl'
+
+    backend: SinkBackend
+    if backend_name == 'clearml':
+        from clearml import Logger
+
+        backend = ClearMLBackend(Logger.current_logger())
+    elif backend_name == 'sqlite':
+        backend = SqliteBackend(_get_local_metrics_path(cfg, 'sqlite'))
+    else:
+        backend = JsonlBackend(_get_local_metrics_path(cfg, 'jsonl'))
+    return BufferedMetricSink(backend, logging_cfg.flush_interval_s)
@@ -0,0 +1,235 @@
+import json
+import time
+from argparse import Namespace
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import torch
+from lightning import Callback, LightningModule, Trainer
+from lightning.pytorch.loggers import Logger
+from lightning.pytorch.utilities import rank_zero_only, rank_zero_warn
+from torch import Tensor
+
+from src.config import TelemetryConfig
+from src.tracking.run_store import RunStore
+from src.tracking.sink import BufferedMetricSink
+
+
+class ThroughputCallback(Callback):
+    """Measure training throughput in samples per second summed over all processes.
+
+    Timing is done by the global zero process: processes are synchronized on every optimizer step in data-parallel
+    training, so its epoch time is the epoch time of the whole run.
+
+    Args:
+        warmup_epochs: Number of first epochs excluded from the summary, they include dataloader and DDP warmup.
+        output_path: If passed, the summary is dumped to this JSON file at the end of training.
+    """
+
+    def __init__(self, warmup_epochs: int = 1, output_path: Optional[Path] = None):
+        self.warmup_epochs = warmup_epochs
+        self.output_path = output_path
+        self.epoch_throughputs: List[float] = []
+        self._epoch_start: float = 0
+        self._epoch_samples: int = 0
+
+    def on_train_epoch_start(self, trainer: Trainer, pl_module: LightningModule) -> None:
+        self._epoch_samples = 0
+        self._epoch_start = time.perf_counter()
+
+    def on_train_batch_end(
+        self,
+        trainer: Trainer,
+        pl_module: LightningModule,
+        outputs: Any,
+        batch: Any,
+        batch_idx: int,
+    ) -> None:
+        self._epoch_samples += len(batch[1])
+
+    def on_train_epoch_end(self, trainer: Trainer, pl_module: LightningModule) -> None:
+        elapsed = time.perf_counter() - self._epoch_start
+        # `DistributedSampler` gives every process the same number of samples
+        throughput = self._epoch_samples * trainer.world_size / elapsed
+        if trainer.current_epoch >= self.warmup_epochs:
+            self.epoch_throughputs.append(throughput)
+        pl_module.log('train_samples_per_sec', throughput, on_step=False, on_epoch=True, rank_zero_only=True)
+
+    def on_train_end(self, trainer: Trainer, pl_module: LightningModule) -> None:
+        if self.output_path is None or not trainer.is_global_zero:
+            return
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.output_path, 'w') as out_file:
+            json.dump(self.summary(trainer.world_size), out_file)
+
+    def summary(self, world_size: int) -> dict[str, float]:
+        throughputs = self.epoch_throughputs
+        mean_throughput = sum(throughputs) / len(throughputs) if throughputs else float('nan')
+        return {'world_size': world_size, 'samples_per_sec': mean_throughput, 'measured_epochs': len(throughputs)}
+
+
+class BufferedStepMetricsCallback(Callback):
+    """Aggregate step loss on device and hand its mean over every `aggregate_every_n_steps` steps to the metric sink.
+
+    Nothing but an in-place tensor addition happens on a training step, the only device sync (`.item()`) happens once
+    per aggregation window, and the sink writes records from its own thread.
+    """
+
+    def __init__(self, sink: BufferedMetricSink, aggregate_every_n_steps: int = 50):
+        self.sink = sink
+        self.aggregate_every_n_steps = aggregate_every_n_steps
+        self._loss_sum: Optional[Tensor] = None
+        self._num_steps = 0
+
+    def on_train_batch_end(
+        self,
+        trainer: Trainer,
+        pl_module: LightningModule,
+        outputs: Any,
+        batch: Any,
+        batch_idx: int,
+    ) -> None:
+        loss = outputs['loss'].detach()
+        if self._loss_sum is None:
+            self._loss_sum = loss.clone()
+        else:
+            self._loss_sum += loss
+        self._num_steps += 1
+        if self._num_steps == self.aggregate_every_n_steps:
+            self._hand_over(trainer)
+
+    def on_train_epoch_end(self, trainer: Trainer, pl_module: LightningModule) -> None:
+        self._hand_over(trainer)
+
+    def on_train_end(self, trainer: Trainer, pl_module: LightningModule) -> None:
+        self.sink.flush()
+
+    def _hand_over(self, trainer: Trainer) -> None:
+        if self._loss_sum is None:
+            return
+        if trainer.is_global_zero:
+            self.sink.log_scalar('step_loss', (self._loss_sum / self._num_steps).item(), trainer.global_step)
+        self._loss_sum = None
+        self._num_steps = 0
+
+
+class RunStoreLogger(Logger):
+    """Record every metric logged by Lightning (per-epoch train, validation and test ones) to the run store.
+
+    A logger rather than a callback: loggers receive the epoch metrics after the LightningModule has logged them.
+    """
+
+    def __init__(self, store: RunStore, run_id: str):
+        super().__init__()
+        self.store = store
+        self.run_id = run_id
+
+    @property
+    def name(self) -> str:
+        return 'run_store'
+
+    @property
+    def version(self) -> str:
+        return self.run_id
+
+    @rank_zero_only
+    def log_hyperparams(self, params: Union[Dict[str, Any], Namespace], *args: Any, **kwargs: Any) -> None:
+        pass  # the whole config is stored by `RunStore.start_run()`
+
+    @rank_zero_only
+    def log_metrics(self, metrics: Dict[str, float], step: Optional[int] = None) -> None:
+        metrics = dict(metrics)
+        epoch = metrics.pop('epoch', None)
+        self.store.log_metrics(self.run_id, metrics, step, None if epoch is None else int(epoch))
+
+
+class TrainingTelemetryCallback(Callback):
+    """Split time of training steps into waiting for the next batch and compute, optionally profile a window of steps.
+
+    Data wait is the time from the end of a step to the start of the next one (or from the start of an epoch), it is
+    dominated by the DataLoader. Compute is the time of the step itself: forward, backward and optimizer step, on GPU
+    the device is synchronized at the end of a step to time it. Per-epoch means and samples per second are logged, and
+    a warning is issued when data wait exceeds `data_wait_warning_fraction` of step time: then `num_workers` or
+    `batch_size` need tuning rather than the model.
+    """
+
+    def __init__(self, cfg: TelemetryConfig):
+        self.cfg = cfg
+        self._step = 0
+        self._last_step_end: float = 0
+        self._step_start: float = 0
+        self._data_wait_s: float = 0
+        self._compute_s: float = 0
+        self._num_samples = 0
+        self._num_steps = 0
+        self._profiler: Optional[torch.profiler.profile] = None
+
+    def on_train_epoch_start(self, trainer: Trainer, pl_module: LightningModule) -> None:
+        self._data_wait_s = self._compute_s = 0
+        self._num_samples = self._num_steps = 0
+        self._last_step_end = time.perf_counter()
+
+    def on_train_batch_start(self, trainer: Trainer, pl_module: LightningModule, batch: Any, batch_idx: int) -> None:
+        if self._step == self.cfg.profile_start_step:
+            self._start_profiler(pl_module)
+        self._step_start = time.perf_counter()
+        self._data_wait_s += self._step_start - self._last_step_end
+
+    def on_train_batch_end(
+        self,
+        trainer: Trainer,
+        pl_module: LightningModule,
+        outputs: Any,
+        batch: Any,
+        batch_idx: int,
+    ) -> None:
+        if pl_module.device.type == 'cuda':
+            torch.cuda.synchronize(pl_module.device)
+        self._last_step_end = time.perf_counter()
+        self._compute_s += self._last_step_end - self._step_start
+        self._num_samples += len(batch[1])
+        self._num_steps += 1
+        self._step += 1
+        if self._profiler is not None:
+            self._profiler.step()
+            if self._step == self.cfg.profile_start_step + self.cfg.profile_num_steps:  # type: ignore[operator]
+                self._stop_profiler(trainer)
+
+    def on_train_epoch_end(self, trainer: Trainer, pl_module: LightningModule) -> None:
+        if not self.cfg.enabled or self._num_steps == 0:
+            return
+        step_s = self._data_wait_s + self._compute_s
+        data_wait_fraction = self._data_wait_s / step_s
+        summary = {
+            'telemetry_data_wait_ms': 1000 * self._data_wait_s / self._num_steps,
+            'telemetry_compute_ms': 1000 * self._compute_s / self._num_steps,
+            'telemetry_data_wait_fraction': data_wait_fraction,
+            # `DistributedSampler` gives every process the same number of samples
+            'telemetry_samples_per_sec': self._num_samples * trainer.world_size / step_s,
+        }
+        pl_module.log_dict(summary, on_step=False, on_epoch=True, rank_zero_only=True)
+        if data_wait_fraction > self.cfg.data_wait_warning_fraction:
+            rank_zero_warn(
+                f'Training steps of epoch {trainer.current_epoch} spent {data_wait_fraction:.0%} of time waiting for '
+                'data, consider increasing `dataloader_config.num_workers` or `batch_size`.',
+            )
+
+    def on_train_end(self, trainer: Trainer, pl_module: LightningModule) -> None:
+        if self._profiler is not None:
+            self._stop_profiler(trainer)
+
+    def _start_profiler(self, pl_module: LightningModule) -> None:
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if pl_module.device.type == 'cuda':
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self._profiler = torch.profiler.profile(activities=activities, record_shapes=True)
+        self._profiler.__enter__()
+
+    def _stop_profiler(self, trainer: Trainer) -> None:
+        profiler, self._profiler = self._profiler, None
+        profiler.__exit__(None, None, None)  # type: ignore[union-attr]
+        profile_dir = self.cfg.profile_dir or Path(trainer.log_dir or trainer.default_root_dir) / 'profiler'
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        trace_path = profile_dir / f'trace_step{self.cfg.profile_start_step}_rank{trainer.global_rank}.json'
+        profiler.export_chrome_trace(str(trace_path))  # type: ignore[union-attr]
+        print(f'Profiler trace of {self.cfg.profile_num_steps} training steps is exported to `{trace_path}`')
@@ -0,0 +1,201 @@
+"""Long-lived training daemon that keeps libraries imported and processed splits in memory between training jobs.
+
+Jobs are `MLPExperimentConfig`s submitted over a local TCP socket (one JSON request and one JSON response per line) or
+dropped as YAML/JSON files into the `incoming` directory of a queue directory. Jobs run one at a time, each with its own
+seed, model, trainer and data module. Results are sent back over the socket or written to the `done` directory.
+
+    python src/train/daemon.py serve [--port PORT] [--queue-dir DIR]
+    python src/train/daemon.py submit <config.yaml> [--port PORT]
+"""
+import argparse
+import json
+import socket
+import socketserver
+import threading
+import time
+import traceback
+import uuid
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import torch
+from clearml import Task
+
+from src.clearml_pipeline.train_task import clearml_train_mlp
+from src.config import MLPExperimentConfig, RunModeEnum
+from src.train.dataset import SplitCache
+from src.train.train import TrainingResult, train_mlp
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+QUEUE_POLL_INTERVAL_S = 1.0
+
+
+@dataclass(frozen=True)
+class JobResult:
+    job_id: str
+    status: str  # `ok` or `error`
+    elapsed_s: float
+    metrics: Dict[str, float] = field(default_factory=dict)
+    best_checkpoint_path: str = ''
+    error: str = ''
+
+
+class TrainingDaemon:
+    def __init__(self) -> None:
+        self.split_cache = SplitCache()
+        # Jobs from the socket and the directory queue are run one at a time
+        self._job_lock = threading.Lock()
+
+    def run_job(self, cfg: MLPExperimentConfig, job_id: Optional[str] = None) -> JobResult:
+        job_id = job_id or uuid.uuid4().hex[:8]
+        with self._job_lock:
+            print(f'Running job `{job_id}`: {cfg.project_name} / {cfg.experiment_name}')
+            start = time.perf_counter()
+            try:
+                result = self._train(_get_job_cfg(cfg))
+            except Exception:  # noqa: B902
+                return JobResult(job_id, 'error', time.perf_counter() - start, error=traceback.format_exc())
+            finally:
+                _reset_global_state()
+            elapsed = time.perf_counter() - start
+            print(f'Job `{job_id}` is finished in {elapsed:.1f}s')
+            return JobResult(job_id, 'ok', elapsed, result.metrics, result.best_checkpoint_path)
+
+    def _train(self, cfg: MLPExperimentConfig) -> TrainingResult:
+        if not cfg.track_in_clearml:
+            return train_mlp(cfg, split_cache=self.split_cache)
+        try:
+            return clearml_train_mlp(cfg, split_cache=self.split_cache)
+        finally:
+            # Every job is tracked as a separate ClearML task
+            if (task := Task.current_task()) is not None:
+                task.close()
+
+
+def _get_job_cfg(cfg: MLPExperimentConfig) -> MLPExperimentConfig:
+    if cfg.run_mode != RunModeEnum.local:
+        raise ValueError('The daemon runs jobs only in `local` run mode')
+    trainer_cfg = cfg.trainer_config
+    if trainer_cfg.devices not in (1, 'auto') or trainer_cfg.num_nodes != 1 or trainer_cfg.strategy.startswith('ddp'):
+        # Lightning's DDP launcher re-executes the launching command for each process, i.e. would start new daemons
+        raise ValueError('The daemon runs jobs only in a single process, set `devices: 1` and `strategy: auto`')
+    cfg = cfg.model_copy(deep=True)
+    cfg.trainer_config.devices = 1
+    return cfg
+
+
+def _reset_global_state() -> None:
+    # Process-wide settings a job may have changed, e.g. by `deterministic=True` of the trainer
+    torch.use_deterministic_algorithms(False)
+    torch.backends.cudnn.benchmark = False
+
+
+def _parse_cfg(request: Dict[str, Any]) -> MLPExperimentConfig:
+    if 'config_path' in request:
+        return MLPExperimentConfig.from_yaml(request['config_path'])
+    return MLPExperimentConfig.model_validate(request['config'])
+
+
+class _JobRequestHandler(socketserver.StreamRequestHandler):
+    server: '_DaemonServer'
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            request = json.loads(line)
+            job_id = request.get('job_id')
+            try:
+                cfg = _parse_cfg(request)
+            except Exception:  # noqa: B902
+                result = JobResult(job_id or '', 'error', 0.0, error=traceback.format_exc())
+            else:
+                result = self.server.training_daemon.run_job(cfg, job_id)
+            self.wfile.write(json.dumps(asdict(result)).encode() + b'\n')
+
+
+class _DaemonServer(socketserver.TCPServer):
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple[str, int], training_daemon: TrainingDaemon):
+        super().__init__(address, _JobRequestHandler)
+        self.training_daemon = training_daemon
+
+
+def watch_queue_dir(training_daemon: TrainingDaemon, queue_dir: Path) -> None:
+    """Run jobs from `queue_dir/incoming` in order of their names.
+
+    A job file is moved to `running` while its job runs, then to `done` together with `<name>.result.json`.
+    """
+    incoming_dir, running_dir, done_dir = (queue_dir / name for name in ('incoming', 'running', 'done'))
+    for dir_path in (incoming_dir, running_dir, done_dir):
+        dir_path.mkdir(parents=True, exist_ok=True)
+    print(f'Watching `{incoming_dir}` for jobs')
+
+    while True:
+        job_paths = sorted(path for path in incoming_dir.iterdir() if path.suffix in {'.yaml', '.yml', '.json'})
+        if not job_paths:
+            time.sleep(QUEUE_POLL_INTERVAL_S)
+            continue
+        job_path = job_paths[0].rename(running_dir / job_paths[0].name)
+        try:
+            if job_path.suffix == '.json':
+                with open(job_path) as in_file:
+                    cfg = MLPExperimentConfig.model_validate(json.load(in_file))
+            else:
+                cfg = MLPExperimentConfig.from_yaml(job_path)
+        except Exception:  # noqa: B902
+            result = JobResult(job_path.stem, 'error', 0.0, error=traceback.format_exc())
+        else:
+            result = training_daemon.run_job(cfg, job_path.stem)
+        with open(done_dir / f'{job_path.stem}.result.json', 'w') as out_file:
+            json.dump(asdict(result), out_file, indent=2)
+        job_path.rename(done_dir / job_path.name)
+
+
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, queue_dir: Optional[Path] = None) -> None:
+    training_daemon = TrainingDaemon()
+    if queue_dir is not None:
+        threading.Thread(target=watch_queue_dir, args=(training_daemon, queue_dir), daemon=True).start()
+    with _DaemonServer((host, port), training_daemon) as server:
+        print(f'Training daemon is listening on {host}:{port}')
+        server.serve_forever()
+
+
+def submit_job(
+    cfg: Optional[MLPExperimentConfig] = None,
+    config_path: Optional[Path] = None,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+) -> Dict[str, Any]:
+    """Submit a job to a running daemon and wait for its result, pass either a config or a path to a YAML config."""
+    if config_path is not None:
+        request: Dict[str, Any] = {'config_path': str(config_path.resolve())}
+    elif cfg is not None:
+        request = {'config': cfg.model_dump(mode='json')}
+    else:
+        raise ValueError('Either `cfg` or `config_path` must be passed')
+    with socket.create_connection((host, port)) as connection:
+        connection.sendall(json.dumps(request).encode() + b'\n')
+        with connection.makefile('rb') as response_file:
+            return json.loads(response_file.readline())  # type: ignore[no-any-return]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Training daemon that keeps libraries and data warm between jobs')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve', help='Run the daemon')
+    serve_parser.add_argument('--host', default=DEFAULT_HOST)
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument('--queue-dir', type=Path, help='Also run jobs dropped into `<queue_dir>/incoming`')
+    submit_parser = subparsers.add_parser('submit', help='Submit a YAML config as a job and wait for its result')
+    submit_parser.add_argument('config_path', type=Path)
+    submit_parser.add_argument('--host', default=DEFAULT_HOST)
+    submit_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(args.host, args.port, args.queue_dir)
+    else:
+        job_result = submit_job(config_path=args.config_path, host=args.host, port=args.port)
+        print(json.dumps(job_result, indent=2))
@@ -0,0 +1,235 @@
+"""Tune DataLoader settings on the prepared dataset and write the winning ones as a config overlay.
+
+Short training windows are run in two stages:
+
+1. Batch sizes, with LR scaled by batch size. The fastest batch size whose `valid_f1` is within `f1_tolerance` of the
+   one of the configured batch size wins.
+2. Worker counts, persistent workers and prefetch factors at the winning batch size. They don't change the order or
+   values of samples, so only throughput is compared.
+
+The overlay holds only `dataloader_config` and `hyperparameters_config.lr`, apply it with the `TRAIN_MLP_CFG_OVERLAYS`
+environment variable.
+"""
+import argparse
+import itertools
+import math
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Literal, Optional, Sequence
+
+import lightning
+import yaml
+from lightning import Trainer
+
+from src.config import MLPExperimentConfig, get_experiment_cfg
+from src.constants import CONFIGS
+from src.train.callbacks import ThroughputCallback
+from src.train.datamodule import TabularDataModule
+from src.train.dataset import SplitCache
+from src.train.lightning_module import ClassificationLightningModule
+
+DEFAULT_OVERLAY_PATH = CONFIGS / 'overlays' / 'dataloader_autotune.yaml'
+DEFAULT_BATCH_SIZES = (64, 128, 256, 512, 1024, 2048)
+DEFAULT_NUM_WORKERS = (0, 1, 2, 4)
+DEFAULT_PREFETCH_FACTORS = (2, 4)
+
+LRScaling = Literal['none', 'linear', 'sqrt']
+
+
+@dataclass(frozen=True)
+class LoaderTrial:
+    batch_size: int
+    num_workers: int
+    persistent_workers: bool
+    prefetch_factor: Optional[int]
+    lr: float
+    samples_per_sec: float
+    valid_f1: float
+
+
+def scale_lr(lr: float, batch_size: int, base_batch_size: int, lr_scaling: LRScaling) -> float:
+    ratio = batch_size / base_batch_size
+    if lr_scaling == 'linear':
+        return lr * ratio
+    if lr_scaling == 'sqrt':
+        return lr * math.sqrt(ratio)
+    return lr
+
+
+def _get_trial_cfg(
+    cfg: MLPExperimentConfig,
+    batch_size: int,
+    num_workers: int,
+    persistent_workers: bool,
+    prefetch_factor: Optional[int],
+    lr: float,
+) -> MLPExperimentConfig:
+    cfg = cfg.model_copy(deep=True)
+    cfg.dataloader_config.batch_size = batch_size
+    cfg.dataloader_config.num_workers = num_workers
+    cfg.dataloader_config.persistent_workers = persistent_workers
+    cfg.dataloader_config.prefetch_factor = prefetch_factor
+    cfg.hyperparameters_config.lr = lr
+    return cfg
+
+
+def run_trial(
+    cfg: MLPExperimentConfig,
+    batch_size: int,
+    num_workers: int = 0,
+    persistent_workers: bool = False,
+    prefetch_factor: Optional[int] = None,
+    lr: Optional[float] = None,
+    epochs: int = 3,
+    split_cache: Optional[SplitCache] = None,
+) -> LoaderTrial:
+    """Train for `epochs` epochs in a single process, the first one is a warmup excluded from throughput."""
+    if epochs < 2:
+        raise ValueError(f'At least 2 epochs are needed to measure throughput after the warmup one, got {epochs}')
+    lr = cfg.hyperparameters_config.lr if lr is None else lr
+    trial_cfg = _get_trial_cfg(cfg, batch_size, num_workers, persistent_workers, prefetch_factor, lr)
+    lightning.seed_everything(trial_cfg.seed, verbose=False)
+
+    datamodule = TabularDataModule(cfg=trial_cfg, split_cache=split_cache)
+    model = ClassificationLightningModule(
+        trial_cfg,
+        datamodule.num_features,
+        datamodule.num_classes,
+        datamodule.categorical_cardinalities,
+        datamodule.feature_names,
+    )
+    throughput_callback = ThroughputCallback(warmup_epochs=1)
+    trainer = Trainer(
+        **{
+            **trial_cfg.trainer_config.get_trainer_kwargs(),
+            # Lightning's DDP launcher would re-run the whole tuning in every process, throughput is tuned per process
+            'devices': 1,
+            'strategy': 'auto',
+            'num_nodes': 1,
+            'min_epochs': epochs,
+            'max_epochs': epochs,
+            'check_val_every_n_epoch': epochs,
+            'fast_dev_run': False,
+        },
+        callbacks=[throughput_callback],
+        logger=False,
+        enable_checkpointing=False,
+        enable_progress_bar=False,
+        enable_model_summary=False,
+    )
+    trainer.fit(model=model, datamodule=datamodule)
+    return LoaderTrial(
+        batch_size,
+        num_workers,
+        persistent_workers,
+        prefetch_factor,
+        lr,
+        throughput_callback.summary(1)['samples_per_sec'],
+        float(trainer.callback_metrics['valid_f1']),
+    )
+
+
+def _get_worker_grid(num_workers_grid: Sequence[int], prefetch_factors: Sequence[int]) -> List[tuple[int, bool, int]]:
+    # Loading in the main process (`num_workers=0`) is measured by the batch size stage
+    cpu_count = os.cpu_count() or 1
+    workers = [num_workers for num_workers in num_workers_grid if 0 < num_workers < cpu_count]
+    return list(itertools.product(workers, (False, True), prefetch_factors))
+
+
+def _print_trial(trial: LoaderTrial) -> None:
+    print(
+        f'batch_size={trial.batch_size:<5} num_workers={trial.num_workers} persistent={trial.persistent_workers!s:<5} '
+        f'prefetch={trial.prefetch_factor!s:<4} lr={trial.lr:.2e}: {trial.samples_per_sec:>10.0f} samples/s, '
+        f'valid_f1={trial.valid_f1:.4f}',
+    )
+
+
+def autotune(
+    cfg: MLPExperimentConfig,
+    batch_sizes: Sequence[int] = DEFAULT_BATCH_SIZES,
+    num_workers_grid: Sequence[int] = DEFAULT_NUM_WORKERS,
+    prefetch_factors: Sequence[int] = DEFAULT_PREFETCH_FACTORS,
+    lr_scaling: LRScaling = 'linear',
+    f1_tolerance: float = 0.01,
+    epochs: int = 3,
+) -> LoaderTrial:
+    split_cache = SplitCache()  # splits are read once for all trials
+    base_batch_size = cfg.dataloader_config.batch_size
+    base_lr = cfg.hyperparameters_config.lr
+
+    print('Stage 1: batch size')
+    batch_trials = []
+    for batch_size in sorted({base_batch_size, *batch_sizes}):
+        lr = scale_lr(base_lr, batch_size, base_batch_size, lr_scaling)
+        batch_trials.append(run_trial(cfg, batch_size, lr=lr, epochs=epochs, split_cache=split_cache))
+        _print_trial(batch_trials[-1])
+    base_f1 = next(trial.valid_f1 for trial in batch_trials if trial.batch_size == base_batch_size)
+    eligible = [trial for trial in batch_trials if trial.valid_f1 >= base_f1 - f1_tolerance]
+    best = max(eligible, key=lambda trial: trial.samples_per_sec)
+
+    print(f'Stage 2: workers at batch_size={best.batch_size}')
+    for num_workers, persistent_workers, prefetch_factor in _get_worker_grid(num_workers_grid, prefetch_factors):
+        trial = run_trial(
+            cfg,
+            best.batch_size,
+            num_workers,
+            persistent_workers,
+            prefetch_factor,
+            best.lr,
+            epochs,
+            split_cache,
+        )
+        _print_trial(trial)
+        if trial.samples_per_sec > best.samples_per_sec:
+            best = trial
+    return best
+
+
+def save_overlay(trial: LoaderTrial, path: Path, base_cfg: MLPExperimentConfig) -> None:
+    overlay = {
+        'dataloader_config': {
+            'batch_size': trial.batch_size,
+            'num_workers': trial.num_workers,
+            'pin_memory': base_cfg.dataloader_config.pin_memory,
+            'persistent_workers': trial.persistent_workers,
+            'prefetch_factor': trial.prefetch_factor,
+        },
+        'hyperparameters_config': {'lr': trial.lr},
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as out_file:
+        out_file.write(
+            f'# Written by src/train/dataloader_autotune.py on {time.strftime("%Y-%m-%d %H:%M")} for '
+            f'`{base_cfg.data_config.orig_dataset_name}`: {trial.samples_per_sec:.0f} samples/s, '
+            f'valid_f1={trial.valid_f1:.4f}\n',
+        )
+        yaml.safe_dump(overlay, out_file, default_flow_style=False, sort_keys=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tune DataLoader settings and write them as a config overlay')
+    parser.add_argument('--output', type=Path, default=DEFAULT_OVERLAY_PATH)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=list(DEFAULT_BATCH_SIZES))
+    parser.add_argument('--num-workers', type=int, nargs='+', default=list(DEFAULT_NUM_WORKERS))
+    parser.add_argument('--prefetch-factors', type=int, nargs='+', default=list(DEFAULT_PREFETCH_FACTORS))
+    parser.add_argument('--lr-scaling', choices=['none', 'linear', 'sqrt'], default='linear')
+    parser.add_argument('--f1-tolerance', type=float, default=0.01)
+    parser.add_argument('--epochs', type=int, default=3, help='Epochs per trial, the first one is a warmup')
+    args = parser.parse_args()
+
+    experiment_cfg = get_experiment_cfg()
+    best_trial = autotune(
+        experiment_cfg,
+        args.batch_sizes,
+        args.num_workers,
+        args.prefetch_factors,
+        args.lr_scaling,
+        args.f1_tolerance,
+        args.epochs,
+    )
+    save_overlay(best_trial, args.output, experiment_cfg)
+    print('Best settings:')
+    _print_trial(best_trial)
+    print(f'Overlay is written to `{args.output}`, apply it with `TRAIN_MLP_CFG_OVERLAYS={args.output}`')
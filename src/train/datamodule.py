@@ -1,21 +1,34 @@
+import json
+import os
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
 
+import torch
 from lightning import LightningDataModule
-from torch.utils.data import DataLoader
+from lightning.pytorch.overrides.distributed import UnrepeatedDistributedSampler
+from torch.utils.data import DataLoader, Dataset
 
 from src.clearml_pipeline.preprocess.task import get_prep_data
 from src.config import MLPExperimentConfig, RunModeEnum
+from src.data.data_model import TabularSplit, read_categorical_cardinalities
 from src.data.preprocessing.main import download_csv, preprocess_data
-from src.train.dataset import TabularDataset
+from src.data.preprocessing.path_helpers import _get_processed_dir_path
+from src.train.dataset import SplitCache, TabularDataset, collate_batch
+
+
+def _is_local_zero() -> bool:
+    # Lightning sets `LOCAL_RANK` for every process it launches, the launching process itself has no such variable
+    return int(os.environ.get('LOCAL_RANK', 0)) == 0
 
 
 class TabularDataModule(LightningDataModule):
     def __init__(
         self,
         cfg: MLPExperimentConfig,
+        split_cache: Optional[SplitCache] = None,
     ):
         super().__init__()
+        self.split_cache = split_cache
         self.project_name = cfg.project_name
         self.cfg = cfg
         self.data_cfg = cfg.data_config
@@ -23,43 +36,69 @@ class TabularDataModule(LightningDataModule):
 
         self.batch_size = cfg.dataloader_config.batch_size
         self.num_workers = cfg.dataloader_config.num_workers
-        self.pin_memory = cfg.dataloader_config.pin_memory
+        # Pinned memory only speeds up host to GPU copies
+        self.pin_memory = cfg.dataloader_config.pin_memory and torch.cuda.is_available()
+        self.persistent_workers = cfg.dataloader_config.persistent_workers
+        self.prefetch_factor = cfg.dataloader_config.prefetch_factor
 
         # There is no need to download and read datasets on each prepare_data() and setup() hooks call
         self.is_data_prepared: bool = False
         self.is_fit_set_up: bool = False
         self.is_test_set_up: bool = False
 
+        self.data_path: Optional[Path] = None
         self.data_train: Optional[TabularDataset] = None
         self.data_val: Optional[TabularDataset] = None
         self.data_test: Optional[TabularDataset] = None
 
         # Prevent hyperparameters from being stored in checkpoints.
-        self.save_hyperparameters(logger=False)
+        self.save_hyperparameters(ignore=['split_cache'], logger=False)
 
-    def _prep_data_attrs(self) -> None:
-        self.prepare_data()
-        self.setup(stage='test')
+    def _prep_data_path(self) -> Path:
+        # Used before the trainer is set up: in DDP, processes other than the local zero one are launched only after
+        # the data has been prepared by the local zero process, so they only need to discover the path
+        if _is_local_zero():
+            self.prepare_data()
+        return self._get_data_path()
+
+    @property
+    def processed_data_path(self) -> Path:
+        return self._prep_data_path()
 
     @property
     def num_classes(self) -> int:
-        self._prep_data_attrs()
-        return self.data_test.num_classes  # type: ignore
+        return TabularSplit.read_num_classes(self._prep_data_path(), 'train', self.prep_cfg.target_column)
+
+    @property
+    def feature_names(self) -> Tuple[str, ...]:
+        return TabularSplit.read_feature_names(self._prep_data_path(), 'train')
 
     @property
     def num_features(self) -> int:
-        self._prep_data_attrs()
-        return self.data_test.num_features  # type: ignore
+        return len(self.feature_names)
+
+    @property
+    def categorical_cardinalities(self) -> Tuple[int, ...]:
+        return read_categorical_cardinalities(self._prep_data_path())
 
     def prepare_data(self) -> None:
+        # Called only by the local zero process in distributed training, so no state except for this guard is assigned
+        # here, other processes discover the prepared data path in `setup()`
         if self.is_data_prepared:
             return
 
-        # Since we don't do distributed training, we can safely assign state here
-        self.data_path = self._prepare_data()
+        prepared_key = self._get_prepared_key()
+        if self.split_cache is None or not self.split_cache.is_prepared(prepared_key):
+            self._prepare_data()
+        if self.split_cache is not None and not self.prep_cfg.incremental:
+            # Incrementally preprocessed data may change with no change of the config, so it's prepared every time
+            self.split_cache.mark_prepared(prepared_key)
 
         self.is_data_prepared = True
 
+    def _get_prepared_key(self) -> str:
+        return json.dumps([self.project_name, self.cfg.run_mode, self.data_cfg.model_dump(mode='json'), self.cfg.seed])
+
     def _prepare_data(self) -> Path:
         if self.cfg.run_mode == RunModeEnum.pipeline:
             return get_prep_data(self.cfg)
@@ -67,40 +106,71 @@ class TabularDataModule(LightningDataModule):
             raw_csv_path = download_csv(self.project_name, self.data_cfg, skip_if_exists=True)
             return preprocess_data(self.project_name, self.data_cfg, raw_csv_path, seed=self.cfg.seed)
 
+    def _get_data_path(self) -> Path:
+        if self.cfg.run_mode == RunModeEnum.pipeline:
+            # Returns a cached local copy, the dataset is downloaded only once by `prepare_data()`
+            return get_prep_data(self.cfg)
+        return _get_processed_dir_path(self.project_name, self.data_cfg.orig_dataset_name)
+
     def setup(self, stage: str) -> None:
+        if self.data_path is None:
+            self.data_path = self._get_data_path()
+
         if stage == 'fit' and not self.is_fit_set_up:
-            self.data_train = TabularDataset(self.data_path, 'train', self.prep_cfg.target_column)
-            self.data_val = TabularDataset(self.data_path, 'val', self.prep_cfg.target_column)
+            self.data_train = TabularDataset(self.data_path, 'train', self.prep_cfg.target_column, self.split_cache)
+            self.data_val = TabularDataset(self.data_path, 'val', self.prep_cfg.target_column, self.split_cache)
             self.is_fit_set_up = True
 
         elif stage == 'test' and not self.is_test_set_up:
-            self.data_test = TabularDataset(self.data_path, 'test', self.prep_cfg.target_column)
+            self.data_test = TabularDataset(self.data_path, 'test', self.prep_cfg.target_column, self.split_cache)
             self.is_test_set_up = True
 
+    def _get_eval_sampler(self, dataset: Optional[Dataset]) -> Optional[UnrepeatedDistributedSampler]:
+        # Lightning injects `DistributedSampler` into dataloaders in distributed mode, which pads splits with repeated
+        # samples to make them even across processes. That is needed for training, but biases evaluation metrics.
+        if self.trainer is None or self.trainer.world_size == 1:
+            return None
+        return UnrepeatedDistributedSampler(
+            dataset,
+            num_replicas=self.trainer.world_size,
+            rank=self.trainer.global_rank,
+            shuffle=False,
+        )
+
+    def _get_loader_kwargs(self) -> Dict[str, Any]:
+        kwargs: Dict[str, Any] = {
+            'batch_size': self.batch_size,
+            'num_workers': self.num_workers,
+            'pin_memory': self.pin_memory,
+            'collate_fn': collate_batch,
+        }
+        if self.num_workers > 0:
+            # DataLoader rejects these arguments without worker processes
+            kwargs['persistent_workers'] = self.persistent_workers
+            kwargs['prefetch_factor'] = self.prefetch_factor
+        return kwargs
+
     def train_dataloader(self) -> DataLoader:
+        # In distributed mode Lightning replaces the sampler with a shuffling `DistributedSampler`
         return DataLoader(
             dataset=self.data_train,
-            batch_size=self.batch_size,
-            num_workers=self.num_workers,
-            pin_memory=self.pin_memory,
+            **self._get_loader_kwargs(),
             shuffle=True,
         )
 
     def val_dataloader(self) -> DataLoader:
         return DataLoader(
             dataset=self.data_val,
-            batch_size=self.batch_size,
-            num_workers=self.num_workers,
-            pin_memory=self.pin_memory,
+            **self._get_loader_kwargs(),
+            sampler=self._get_eval_sampler(self.data_val),
             shuffle=False,
         )
 
     def test_dataloader(self) -> DataLoader:
         return DataLoader(
             dataset=self.data_test,
-            batch_size=self.batch_size,
-            num_workers=self.num_workers,
-            pin_memory=self.pin_memory,
+            **self._get_loader_kwargs(),
+            sampler=self._get_eval_sampler(self.data_test),
             shuffle=False,
         )
 
@@ -1,15 +1,51 @@
 from pathlib import Path
-from typing import Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 import torch
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, default_collate
 
-from src.data.data_model import TabularSplit
+from src.data.data_model import TabularSplit, get_split_files
+
+SplitKey = Tuple[str, str, str]
+
+
+class SplitCache:
+    """In-memory cache of processed splits shared by training jobs of a long-lived process.
+
+    Splits are keyed by their path and a fingerprint of their files (size and modification time), so a split that has
+    been rewritten by preprocessing is read again. It also remembers which datasets have already been prepared.
+    """
+
+    def __init__(self) -> None:
+        self._splits: Dict[SplitKey, Tuple[Tuple[int, ...], TabularSplit]] = {}
+        self._prepared_keys: Set[str] = set()
+
+    def get_split(self, path: Path, split: str, target_col: str) -> TabularSplit:
+        key = (str(path.resolve()), split, target_col)
+        fingerprint = self._get_fingerprint(path, split)
+        cached = self._splits.get(key)
+        if cached is None or cached[0] != fingerprint:
+            self._splits[key] = (fingerprint, TabularSplit.from_folder(path, split, target_col))
+        return self._splits[key][1]
+
+    @staticmethod
+    def _get_fingerprint(path: Path, split: str) -> Tuple[int, ...]:
+        stats = [split_path.stat() for split_path in get_split_files(path, split)]
+        return tuple(value for stat in stats for value in (stat.st_size, stat.st_mtime_ns))
+
+    def is_prepared(self, key: str) -> bool:
+        return key in self._prepared_keys
+
+    def mark_prepared(self, key: str) -> None:
+        self._prepared_keys.add(key)
 
 
 class TabularDataset(Dataset):
-    def __init__(self, path: Path, split: str, target_col: str):
-        self.data = TabularSplit.from_folder(path, split, target_col)
+    def __init__(self, path: Path, split: str, target_col: str, split_cache: Optional[SplitCache] = None):
+        if split_cache is not None:
+            self.data = split_cache.get_split(path, split, target_col)
+        else:
+            self.data = TabularSplit.from_folder(path, split, target_col)
 
     def __len__(self) -> int:
         return len(self.data)
@@ -17,10 +53,21 @@ class TabularDataset(Dataset):
     def __getitem__(self, idx: int) -> Tuple[torch.Tensor, torch.Tensor]:
         return self.data[idx]
 
+    def __getitems__(self, indices: List[int]) -> Tuple[torch.Tensor, torch.Tensor]:
+        # Used by DataLoader instead of `__getitem__` to fetch a whole batch, rows are widened from storage dtypes here
+        return self.data.get_batch(indices)
+
     @property
     def num_classes(self) -> int:
         return len(self.data.target.unique())
 
     @property
     def num_features(self) -> int:
-        return len(self.data.features.columns)
+        return len(self.data.feature_names)
+
+
+def collate_batch(batch: Any) -> Any:
+    """Collate function of DataLoaders over `TabularDataset`, whose batches are already assembled by `__getitems__`."""
+    if isinstance(batch, tuple):
+        return batch
+    return default_collate(batch)
@@ -0,0 +1,180 @@
+"""Permutation feature importance of a trained MLP on the test split.
+
+Features produced from the same original column (e.g. one-hot encoded categories) are permuted together, so importance
+is reported per original column.
+"""
+import argparse
+import json
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import torch
+from torch import Tensor
+
+from src.data.preprocessing.steps import get_feature_groups, load_transformer
+from src.export.core import get_test_datamodule, load_mlp, load_test_split
+from src.train.model import MLP
+
+IMPORTANCE_FILENAME = 'feature_importance.json'
+_FLOAT_BYTES = 4
+
+
+@dataclass(frozen=True)
+class FeatureImportance:
+    feature: str
+    f1_drop_mean: float
+    f1_drop_std: float
+
+
+def macro_f1(preds: Tensor, target: Tensor, num_classes: int) -> Tensor:
+    """Macro F1 of each row of `preds` (variants x samples) against `target`, computed for all rows at once.
+
+    Classes that are neither predicted nor present in the target are excluded from the average, as in torchmetrics.
+    """
+    num_variants = preds.shape[0]
+    offsets = torch.arange(num_variants, device=preds.device).unsqueeze(1) * num_classes**2
+    flat_idx = (offsets + target.unsqueeze(0) * num_classes + preds).flatten()
+    confusion = torch.bincount(flat_idx, minlength=num_variants * num_classes**2)
+    confusion = confusion.reshape(num_variants, num_classes, num_classes).double()
+
+    true_pos = confusion.diagonal(dim1=1, dim2=2)
+    denominator = confusion.sum(dim=1) + confusion.sum(dim=2)  # 2 * TP + FP + FN
+    f1 = torch.where(denominator > 0, 2 * true_pos / denominator.clamp(min=1), torch.zeros_like(true_pos))
+    num_present = (denominator > 0).sum(dim=1).clamp(min=1)
+    return f1.sum(dim=1) / num_present
+
+
+def get_group_indices(
+    feature_names: Sequence[str],
+    feature_groups: Optional[Dict[str, Tuple[str, ...]]] = None,
+) -> Dict[str, List[int]]:
+    """Indices of input features of the MLP grouped by original column, every feature is its own group by default."""
+    if feature_groups is None:
+        return {name: [idx] for idx, name in enumerate(feature_names)}
+    feature_idx = {name: idx for idx, name in enumerate(feature_names)}
+    return {col: [feature_idx[name] for name in names] for col, names in feature_groups.items()}
+
+
+def _get_variants_per_pass(model: MLP, num_rows: int, num_features: int, memory_limit_mb: int) -> int:
+    # Upper bound of floats held per row of a variant: permuted rows and the stacked variant, embedded and concatenated
+    # inputs of the first layer if there are categorical codes, and outputs of each hidden layer and its ReLU. Hidden
+    # layers are usually much wider than the input, so they dominate
+    row_floats = 2 * num_features + 2 * (model.linear_1.out_features + model.linear_2.out_features)
+    if len(model.embeddings) > 0:
+        row_floats += 2 * model.linear_1.in_features
+    variant_bytes = num_rows * row_floats * _FLOAT_BYTES
+    return max(1, memory_limit_mb * 2**20 // variant_bytes)
+
+
+def permutation_importance(
+    model: MLP,
+    features: Tensor,
+    target: Tensor,
+    num_classes: int,
+    group_indices: Dict[str, List[int]],
+    num_repeats: int = 5,
+    memory_limit_mb: int = 512,
+    seed: int = 42,
+) -> List[FeatureImportance]:
+    """Drop of test macro F1 when values of each group of features are shuffled across rows.
+
+    All (group, repeat) variants of the test split are built as one stacked tensor and evaluated in as few large
+    forward passes as fit in `memory_limit_mb`, instead of running a test loop per variant.
+
+    Returns:
+        Importance of every group, sorted from the most to the least important
+    """
+    model.eval()
+    num_rows, num_features = features.shape
+    generator = torch.Generator().manual_seed(seed)
+
+    variant_groups = [group for group in group_indices for _ in range(num_repeats)]
+    group_masks = torch.zeros(len(group_indices), num_features, dtype=torch.bool)
+    for group_idx, indices in enumerate(group_indices.values()):
+        group_masks[group_idx, indices] = True
+    variant_masks = group_masks.repeat_interleave(num_repeats, dim=0)
+
+    variants_per_pass = _get_variants_per_pass(model, num_rows, num_features, memory_limit_mb)
+    f1_scores = []
+    with torch.inference_mode():
+        base_f1 = macro_f1(model(features).argmax(dim=1).unsqueeze(0), target, num_classes)[0]
+        for start in range(0, len(variant_groups), variants_per_pass):
+            masks = variant_masks[start : start + variants_per_pass]
+            perms = torch.stack([torch.randperm(num_rows, generator=generator) for _ in range(len(masks))])
+            # Variant `i` takes permuted rows in its group columns and original rows in all other columns
+            stacked = torch.where(masks.unsqueeze(1), features[perms], features.unsqueeze(0))
+            logits = model(stacked.reshape(-1, num_features))
+            preds = logits.argmax(dim=1).reshape(len(masks), num_rows)
+            f1_scores.append(macro_f1(preds, target, num_classes))
+
+    f1_drops = (base_f1 - torch.cat(f1_scores)).reshape(len(group_indices), num_repeats)
+    importances = [
+        FeatureImportance(
+            feature=group,
+            f1_drop_mean=float(drops.mean()),
+            f1_drop_std=float(drops.std(unbiased=False)),
+        )
+        for group, drops in zip(group_indices, f1_drops)
+    ]
+    return sorted(importances, key=lambda importance: importance.f1_drop_mean, reverse=True)
+
+
+def compute_importance(
+    checkpoint_path: Path,
+    output_path: Optional[Path] = None,
+    num_repeats: int = 5,
+    memory_limit_mb: int = 512,
+) -> List[FeatureImportance]:
+    """Compute permutation importance of original columns for the model from a Lightning checkpoint.
+
+    Args:
+        checkpoint_path: Path to a checkpoint of `ClassificationLightningModule`
+        output_path: JSON file to save importance to, `feature_importance.json` next to the checkpoint by default
+        num_repeats: Number of random permutations of each column
+        memory_limit_mb: Approximate memory cap of a single forward pass over stacked variants
+    """
+    module, model = load_mlp(checkpoint_path)
+    datamodule = get_test_datamodule(module)
+    features, target = load_test_split(module, datamodule)
+
+    transformer = load_transformer(datamodule.data_path)  # type: ignore[arg-type]
+    if transformer is None:
+        print('Fitted transformer is not found next to the processed data, every feature is permuted separately.')
+    feature_groups = get_feature_groups(transformer) if transformer is not None else None
+    group_indices = get_group_indices(datamodule.feature_names, feature_groups)
+
+    importances = permutation_importance(
+        model,
+        features,
+        target,
+        module.hparams.num_classes,
+        group_indices,
+        num_repeats=num_repeats,
+        memory_limit_mb=memory_limit_mb,
+        seed=module.hparams.cfg.seed,
+    )
+
+    output_path = output_path or checkpoint_path.parent / IMPORTANCE_FILENAME
+    with open(output_path, 'w') as out_file:
+        json.dump([asdict(importance) for importance in importances], out_file, indent=2)
+    _print_importances(importances)
+    print(f'Feature importance is saved to `{output_path}`')
+    return importances
+
+
+def _print_importances(importances: Sequence[FeatureImportance]) -> None:
+    print(f'{"feature":<30} {"F1 drop":>8} {"std":>8}')
+    for importance in importances:
+        print(f'{importance.feature:<30} {importance.f1_drop_mean:>+8.4f} {importance.f1_drop_std:>8.4f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Permutation feature importance of trained MLP on the test split')
+    parser.add_argument('checkpoint', type=Path, help='Path to a Lightning checkpoint')
+    parser.add_argument('--output', type=Path)
+    parser.add_argument('--num-repeats', type=int, default=5)
+    parser.add_argument('--memory-limit-mb', type=int, default=512)
+    args = parser.parse_args()
+
+    compute_importance(args.checkpoint, args.output, args.num_repeats, args.memory_limit_mb)
@@ -1,4 +1,4 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Sequence
 
 import torch
 import torch.nn.functional as func
@@ -12,10 +12,19 @@ from src.train.model import get_mlp_model
 
 
 class ClassificationLightningModule(LightningModule):
-    def __init__(self, cfg: MLPExperimentConfig, in_features: int, num_classes: int):
+    def __init__(
+        self,
+        cfg: MLPExperimentConfig,
+        in_features: int,
+        num_classes: int,
+        cat_cardinalities: Sequence[int] = (),
+        feature_names: Sequence[str] = (),  # saved with hyperparameters to check compatibility of checkpoints
+    ):
         super().__init__()
 
         self.hyperparameters_cfg = cfg.hyperparameters_config
+        # Otherwise, step metrics are aggregated and logged by `BufferedStepMetricsCallback`
+        self.log_step_metrics = cfg.metric_logging_config.backend == 'lightning'
 
         self._train_loss = MeanMetric()
         self._valid_loss = MeanMetric()
@@ -33,6 +42,7 @@ class ClassificationLightningModule(LightningModule):
             mlp_cfg=cfg.mlp_model_config,
             in_dim=in_features,
             out_dim=num_classes,
+            cat_cardinalities=cat_cardinalities,
         )
 
         self.save_hyperparameters()
@@ -45,7 +55,8 @@ class ClassificationLightningModule(LightningModule):
         logits = self(features)
         loss = func.cross_entropy(logits, targets)
         self._train_loss(loss)
-        self.log('step_loss', loss, on_step=True, prog_bar=True, logger=True)
+        if self.log_step_metrics:
+            self.log('step_loss', loss, on_step=True, prog_bar=True, logger=True)
         return {'loss': loss}
 
     def on_train_epoch_end(self) -> None:
@@ -60,6 +71,8 @@ class ClassificationLightningModule(LightningModule):
         self._valid_metrics(logits, targets)
 
     def on_validation_epoch_end(self) -> None:
+        # `compute()` of torchmetrics metrics reduces their states across all processes in distributed training, so
+        # logged epoch-level values are global and there's no need in `sync_dist=True`
         self.log('mean_valid_loss', self._valid_loss.compute(), on_step=False, prog_bar=True, on_epoch=True)
         self._valid_loss.reset()
 
@@ -1,16 +1,52 @@
+from typing import Optional, Sequence
+
+import torch
 import torch.nn as nn
 from torch import Tensor
 
 from src.config import MLPModelConfig
+from src.data.data_model import UNKNOWN_CATEGORY_CODE
+
+
+def get_embedding_dim(cardinality: int, embedding_dim: Optional[int] = None) -> int:
+    return embedding_dim or min(50, (cardinality + 1) // 2)
 
 
 class MLP(nn.Module):
-    def __init__(self, in_dim: int, lin_1_dim: int, lin_2_dim: int, out_dim: int):
+    """MLP over numeric features and, optionally, embeddings of categorical codes.
+
+    If `cat_cardinalities` are passed, the last `len(cat_cardinalities)` of `in_dim` input columns are treated as
+    integer codes of categorical columns: each of them is embedded and concatenated with the numeric columns.
+    """
+
+    def __init__(
+        self,
+        in_dim: int,
+        lin_1_dim: int,
+        lin_2_dim: int,
+        out_dim: int,
+        cat_cardinalities: Sequence[int] = (),
+        embedding_dim: Optional[int] = None,
+    ):
         super().__init__()
 
+        self.num_numeric = in_dim - len(cat_cardinalities)
+        # Embedding of the reserved unknown category is fixed to zeros
+        self.embeddings = nn.ModuleList(
+            [
+                nn.Embedding(
+                    cardinality,
+                    get_embedding_dim(cardinality, embedding_dim),
+                    padding_idx=UNKNOWN_CATEGORY_CODE,
+                )
+                for cardinality in cat_cardinalities
+            ],
+        )
+        linear_in_dim = self.num_numeric + sum(embedding.embedding_dim for embedding in self.embeddings)
+
         relu = nn.ReLU()
 
-        self.linear_1 = nn.Linear(in_dim, lin_1_dim)
+        self.linear_1 = nn.Linear(linear_in_dim, lin_1_dim)
         self.relu_1 = relu
         self.linear_2 = nn.Linear(lin_1_dim, lin_2_dim)
         self.relu_2 = relu
@@ -19,13 +55,25 @@ class MLP(nn.Module):
         self.layers = nn.Sequential(self.linear_1, self.relu_1, self.linear_2, self.relu_2, self.linear_3)
 
     def forward(self, data: Tensor) -> Tensor:
-        return self.layers(data)
+        if len(self.embeddings) == 0:
+            return self.layers(data)
+
+        codes = data[:, self.num_numeric :].long()
+        embedded = [embedding(codes[:, idx]) for idx, embedding in enumerate(self.embeddings)]
+        return self.layers(torch.cat([data[:, : self.num_numeric], *embedded], dim=1))
 
 
-def get_mlp_model(mlp_cfg: MLPModelConfig, in_dim: int, out_dim: int) -> MLP:
+def get_mlp_model(
+    mlp_cfg: MLPModelConfig,
+    in_dim: int,
+    out_dim: int,
+    cat_cardinalities: Sequence[int] = (),
+) -> MLP:
     return MLP(
         in_dim=in_dim,
         lin_1_dim=mlp_cfg.linear_1_dim,
         lin_2_dim=mlp_cfg.linear_2_dim,
         out_dim=out_dim,
+        cat_cardinalities=cat_cardinalities,
+        embedding_dim=mlp_cfg.embedding_dim,
     )
@@ -1,24 +1,160 @@
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
 import lightning
-from lightning import Trainer
+from lightning import Callback, Trainer
 from lightning.pytorch.callbacks import LearningRateMonitor, ModelCheckpoint
+from torch import Tensor
 
 from src.config import MLPExperimentConfig
+from src.tracking.run_store import RunStore, get_config_hash, get_data_fingerprint, get_run_store
+from src.tracking.sink import get_metric_sink
+from src.train.callbacks import BufferedStepMetricsCallback, RunStoreLogger, TrainingTelemetryCallback
 from src.train.datamodule import TabularDataModule
+from src.train.dataset import SplitCache
 from src.train.lightning_module import ClassificationLightningModule
+from src.train.warm_start import (
+    CHECKPOINT_FILENAME,
+    MONITORED_METRIC,
+    find_previous_best_checkpoint,
+    get_warm_start_cfg,
+    load_warm_start_state,
+    save_best_checkpoint_record,
+)
+
+
+def _get_warm_start_state(cfg: MLPExperimentConfig, datamodule: TabularDataModule) -> Optional[Dict[str, Tensor]]:
+    if not cfg.warm_start_config.enabled:
+        return None
+    if (checkpoint_path := find_previous_best_checkpoint(cfg)) is None:
+        print('No checkpoint of the previous run is found, training from scratch.')
+        return None
+    return load_warm_start_state(
+        checkpoint_path,
+        cfg,
+        datamodule.feature_names,
+        datamodule.num_classes,
+        datamodule.categorical_cardinalities,
+    )
+
+
+@dataclass(frozen=True)
+class TrainingResult:
+    metrics: Dict[str, float]  # the last logged training and validation metrics and test metrics
+    best_checkpoint_path: str
+
+
+def _find_duplicate_run(cfg: MLPExperimentConfig, store: RunStore, data_fingerprint: str) -> Optional[TrainingResult]:
+    if not cfg.run_store_config.skip_duplicates or cfg.warm_start_config.enabled or cfg.track_in_clearml:
+        # A warm-started run depends on the previous run, not only on its config and data. A tracked run already has
+        # its ClearML task, which must not be left empty.
+        return None
+    run = store.find_finished_run(get_config_hash(cfg), data_fingerprint)
+    if run is None or not run.best_checkpoint_path or not Path(run.best_checkpoint_path).is_file():
+        return None
+    print(f'Run `{run.run_id}` has already trained this config on the same data, skipping training.')
+    return TrainingResult(store.get_final_metrics(run.run_id), run.best_checkpoint_path)
 
 
-def train_mlp(cfg: MLPExperimentConfig) -> None:
+def _get_checkpoint_scores(checkpoint_callback: ModelCheckpoint) -> Dict[str, float]:
+    return {path: float(score) for path, score in checkpoint_callback.best_k_models.items()}
+
+
+def train_mlp(
+    cfg: MLPExperimentConfig,
+    extra_callbacks: Sequence[Callback] = (),
+    split_cache: Optional[SplitCache] = None,
+) -> TrainingResult:
     lightning.seed_everything(cfg.seed)
 
-    datamodule = TabularDataModule(cfg=cfg)
-    model = ClassificationLightningModule(cfg, datamodule.num_features, datamodule.num_classes)
+    datamodule = TabularDataModule(cfg=cfg, split_cache=split_cache)
+    run_store = get_run_store(cfg)
+    data_fingerprint = ''
+    if run_store is not None:
+        data_fingerprint = get_data_fingerprint(datamodule.processed_data_path)
+        if (duplicate_result := _find_duplicate_run(cfg, run_store, data_fingerprint)) is not None:
+            run_store.close()
+            return duplicate_result
+
+    warm_start_state = _get_warm_start_state(cfg, datamodule)
+    if warm_start_state is not None:
+        print('Warm-starting from the best checkpoint of the previous run with the reduced epochs and LR budget.')
+        cfg = get_warm_start_cfg(cfg)
+
+    model = ClassificationLightningModule(
+        cfg,
+        datamodule.num_features,
+        datamodule.num_classes,
+        datamodule.categorical_cardinalities,
+        datamodule.feature_names,
+    )
+    if warm_start_state is not None:
+        model.load_state_dict(warm_start_state, strict=False)
 
-    checkpoint_callback = ModelCheckpoint(save_top_k=3, monitor='valid_f1', mode='max', every_n_epochs=1)
+    checkpoint_callback = ModelCheckpoint(
+        filename=CHECKPOINT_FILENAME,
+        save_top_k=3,
+        monitor=MONITORED_METRIC,
+        mode='max',
+        every_n_epochs=1,
+    )
+    metric_sink = get_metric_sink(cfg)
     callbacks = [
-        LearningRateMonitor(logging_interval='step'),
+        # LR is constant within an epoch, there's no need to log it on every step
+        LearningRateMonitor(logging_interval='step' if metric_sink is None else 'epoch'),
         checkpoint_callback,
+        *extra_callbacks,
     ]
+    telemetry_cfg = cfg.trainer_config.telemetry
+    if telemetry_cfg.enabled or telemetry_cfg.profile_start_step is not None:
+        callbacks.append(TrainingTelemetryCallback(telemetry_cfg))
+    if metric_sink is not None:
+        callbacks.append(BufferedStepMetricsCallback(metric_sink, cfg.metric_logging_config.aggregate_every_n_steps))
 
-    trainer = Trainer(**dict(cfg.trainer_config), callbacks=callbacks)
+    trainer = Trainer(**cfg.trainer_config.get_trainer_kwargs(), callbacks=callbacks)
+    run_id = None
+    if run_store is not None and trainer.is_global_zero:
+        run_id = run_store.start_run(cfg, data_fingerprint)
+        trainer.loggers = [*trainer.loggers, RunStoreLogger(run_store, run_id)]
+    try:
+        metrics, durations = _fit_and_test(cfg, trainer, model, datamodule, checkpoint_callback)
+        if run_store is not None and run_id is not None:
+            run_store.finish_run(
+                run_id,
+                metrics,
+                _get_checkpoint_scores(checkpoint_callback),
+                checkpoint_callback.best_model_path,
+                *durations,
+            )
+    except BaseException:
+        if run_store is not None and run_id is not None:
+            run_store.fail_run(run_id)
+        raise
+    finally:
+        if metric_sink is not None:
+            metric_sink.close()
+        if run_store is not None:
+            run_store.close()
+    return TrainingResult(metrics, checkpoint_callback.best_model_path)
+
+
+def _fit_and_test(
+    cfg: MLPExperimentConfig,
+    trainer: Trainer,
+    model: ClassificationLightningModule,
+    datamodule: TabularDataModule,
+    checkpoint_callback: ModelCheckpoint,
+) -> Tuple[Dict[str, float], Tuple[float, float]]:
+    fit_start = time.perf_counter()
     trainer.fit(model=model, datamodule=datamodule)
-    trainer.test(model=model, datamodule=datamodule)
+    fit_duration = time.perf_counter() - fit_start
+    metrics = {name: float(value) for name, value in trainer.callback_metrics.items()}
+    if trainer.is_global_zero:
+        save_best_checkpoint_record(cfg, checkpoint_callback.best_model_path, checkpoint_callback.best_model_score)
+
+    test_start = time.perf_counter()
+    for test_metrics in trainer.test(model=model, datamodule=datamodule):
+        metrics.update(test_metrics)
+    return metrics, (fit_duration, time.perf_counter() - test_start)
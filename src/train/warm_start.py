@@ -0,0 +1,116 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import torch
+from torch import Tensor
+
+from src.config import MLPExperimentConfig
+from src.constants import TMP_EXPERIMENTS_DIR
+
+BEST_CHECKPOINT_FILENAME = 'best_checkpoint.json'
+MONITORED_METRIC = 'valid_f1'  # the best checkpoint has the highest one
+CHECKPOINT_FILENAME = '{epoch}-{step}-{valid_f1:.4f}'
+# User properties of a ClearML training task that identify its best checkpoint among the task's output models
+_BEST_CHECKPOINT_PROPERTY = 'best_checkpoint'
+_BEST_SCORE_PROPERTY = f'best_{MONITORED_METRIC}'
+
+
+def _get_best_checkpoint_record_path(cfg: MLPExperimentConfig) -> Path:
+    return TMP_EXPERIMENTS_DIR / cfg.project_name / cfg.experiment_name / BEST_CHECKPOINT_FILENAME
+
+
+def save_best_checkpoint_record(cfg: MLPExperimentConfig, checkpoint_path: str, score: Optional[Tensor]) -> None:
+    """Record the best checkpoint of the run, so the next run of the same experiment can be warm-started from it.
+
+    The record is saved locally, and also as user properties of the ClearML task if `track_in_clearml` is True.
+    """
+    if not checkpoint_path:
+        return
+    if cfg.track_in_clearml and score is not None:
+        from clearml import Task
+
+        if (task := Task.current_task()) is not None:
+            properties = {_BEST_CHECKPOINT_PROPERTY: Path(checkpoint_path).name, _BEST_SCORE_PROPERTY: float(score)}
+            task.set_user_properties(**properties)
+    record_path = _get_best_checkpoint_record_path(cfg)
+    record_path.parent.mkdir(parents=True, exist_ok=True)
+    record = {'path': str(Path(checkpoint_path).resolve()), 'score': None if score is None else float(score)}
+    with open(record_path, 'w') as out_file:
+        json.dump(record, out_file)
+
+
+def find_previous_best_checkpoint(cfg: MLPExperimentConfig) -> Optional[Path]:
+    warm_start_cfg = cfg.warm_start_config
+    if warm_start_cfg.checkpoint_path is not None:
+        return warm_start_cfg.checkpoint_path
+    if cfg.track_in_clearml:
+        return _find_clearml_best_checkpoint(cfg)
+
+    record_path = _get_best_checkpoint_record_path(cfg)
+    if not record_path.is_file():
+        return None
+    with open(record_path) as in_file:
+        checkpoint_path = Path(json.load(in_file)['path'])
+    return checkpoint_path if checkpoint_path.is_file() else None
+
+
+def _find_clearml_best_checkpoint(cfg: MLPExperimentConfig) -> Optional[Path]:
+    from clearml import Task
+
+    # `task_name` is matched as a pattern, so names are compared exactly afterwards
+    tasks = Task.get_tasks(
+        project_name=cfg.project_name,
+        task_name=cfg.experiment_name,
+        task_filter={'status': ['completed', 'published']},
+    )
+    best: Optional[Tuple[float, Any, str]] = None
+    for task in tasks:
+        properties = task.get_user_properties(value_only=True)
+        if task.name != cfg.experiment_name or _BEST_SCORE_PROPERTY not in properties:
+            continue
+        score = float(properties[_BEST_SCORE_PROPERTY])
+        if best is None or score > best[0]:
+            best = (score, task, properties[_BEST_CHECKPOINT_PROPERTY])
+    if best is None:
+        return None
+
+    _, task, checkpoint_filename = best
+    # Checkpoints saved during training are registered as output models of the task, including ones of pipeline steps
+    for model in task.models['output']:
+        if (model.url or '').endswith(checkpoint_filename):
+            return Path(model.get_local_copy())
+    return None
+
+
+def load_warm_start_state(
+    checkpoint_path: Path,
+    cfg: MLPExperimentConfig,
+    feature_names: Sequence[str],
+    num_classes: int,
+    cat_cardinalities: Sequence[int],
+) -> Optional[Dict[str, Tensor]]:
+    """Load MLP weights from the checkpoint if they are compatible with the current data and model, None otherwise."""
+    checkpoint = torch.load(checkpoint_path, map_location='cpu', weights_only=False)
+    hparams = checkpoint.get('hyper_parameters', {})
+    current: Tuple[Any, ...] = (tuple(feature_names), num_classes, tuple(cat_cardinalities), cfg.mlp_model_config)
+    previous: Tuple[Any, ...] = (
+        tuple(hparams.get('feature_names', ())),
+        hparams.get('num_classes'),
+        tuple(hparams.get('cat_cardinalities', ())),
+        hparams['cfg'].mlp_model_config if 'cfg' in hparams else None,
+    )
+    if current != previous:
+        print(f'Checkpoint `{checkpoint_path}` is incompatible with current features or model, training from scratch.')
+        return None
+    return {key: weights for key, weights in checkpoint['state_dict'].items() if key.startswith('model.')}
+
+
+def get_warm_start_cfg(cfg: MLPExperimentConfig) -> MLPExperimentConfig:
+    """Copy of the config with the reduced epochs and LR budget for fine-tuning."""
+    warm_start_cfg = cfg.warm_start_config
+    cfg = cfg.model_copy(deep=True)
+    cfg.trainer_config.min_epochs = warm_start_cfg.min_epochs
+    cfg.trainer_config.max_epochs = warm_start_cfg.max_epochs
+    cfg.hyperparameters_config.lr = cfg.hyperparameters_config.lr * warm_start_cfg.lr_scale
+    return cfg